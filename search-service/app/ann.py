@@ -0,0 +1,110 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour structure for VectorIndex.
+
+Spherical k-means splits the embedding space into ``nlist`` cells, each with a
+centroid and a posting list of the rows assigned to it. A query is compared to
+the centroids only, and the rows of its ``nprobe`` closest cells are then
+scored exactly. Raising ``nprobe`` trades speed for recall; probing every cell
+is exact search.
+
+The structure holds row numbers only; vectors stay in the VectorIndex matrix.
+Posting lists are replaced, never mutated, so a search that already read
+``lists`` keeps a consistent view while rows are being added.
+"""
+
+import math
+from typing import List, Optional
+
+import numpy as np
+
+# Training points per centroid; more gives better cells but slower training
+_SAMPLE_PER_LIST = 32
+_ASSIGN_BLOCK_ROWS = 16_384
+
+
+def default_nlist(num_rows: int) -> int:
+    return max(1, int(math.sqrt(num_rows)))
+
+
+class IVFIndex:
+    def __init__(self, nlist: int, seed: int = 0):
+        self.nlist = nlist
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None  # (nlist, dim) float32, unit rows
+        self.lists: List[np.ndarray] = [np.zeros(0, dtype=np.int32) for _ in range(nlist)]
+
+    @property
+    def sample_size(self) -> int:
+        """How many training vectors train() uses at most."""
+        return self.nlist * _SAMPLE_PER_LIST
+
+    def train(self, sample: np.ndarray, iterations: int = 8) -> None:
+        """Spherical k-means on (a sample of) unit vectors."""
+        rng = np.random.default_rng(self.seed)
+        sample = np.asarray(sample, dtype=np.float32)
+        if len(sample) > self.sample_size:
+            sample = sample[rng.choice(len(sample), self.sample_size, replace=False)]
+        if len(sample) < self.nlist:
+            raise ValueError("Need at least nlist training vectors")
+
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            # Re-seed empty cells with random points so every cell stays in use.
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+                norms[empty] = np.linalg.norm(sums[empty], axis=1)
+            centroids = sums / np.maximum(norms, 1e-12)[:, None]
+        self.centroids = centroids.astype(np.float32)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + _ASSIGN_BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Append `rows` (whose vectors are given) to their closest cells."""
+        if len(rows) == 0:
+            return
+        self.add_assigned(rows, self.assign(vectors))
+
+    def add_assigned(self, rows: np.ndarray, cells: np.ndarray) -> None:
+        """Append `rows` to the given cells (e.g. as computed by assign())."""
+        order = np.argsort(cells, kind="stable")
+        cells, rows = cells[order], np.asarray(rows, dtype=np.int32)[order]
+        bounds = np.flatnonzero(np.diff(cells)) + 1
+
+        lists = list(self.lists)
+        starts = np.concatenate(([0], bounds))
+        for start, cell_rows in zip(starts.tolist(), np.split(rows, bounds)):
+            cell = int(cells[start])
+            lists[cell] = np.concatenate((lists[cell], cell_rows))
+        self.lists = lists
+
+    def remapped(self, remap: np.ndarray) -> "IVFIndex":
+        """Copy with rows renumbered by `remap` (old row -> new row, -1 = dropped)."""
+        ivf = IVFIndex(self.nlist, self.seed)
+        ivf.centroids = self.centroids
+        ivf.lists = []
+        for rows in self.lists:
+            new_rows = remap[rows]
+            ivf.lists.append(new_rows[new_rows >= 0])
+        return ivf
+
+    def probe(self, queries: np.ndarray, nprobe: int) -> np.ndarray:
+        """The `nprobe` closest cells of each query, as an (n, nprobe) array."""
+        nprobe = min(nprobe, self.nlist)
+        if nprobe == self.nlist:
+            return np.tile(np.arange(self.nlist), (len(queries), 1))
+        similarity = queries @ self.centroids.T
+        return np.argpartition(-similarity, nprobe - 1, axis=1)[:, :nprobe]
+
+    def candidates(self, cells: np.ndarray) -> np.ndarray:
+        lists = self.lists
+        return np.concatenate([lists[c] for c in cells.tolist()])
@@ -1,9 +1,15 @@
+import os
+from typing import Any, Dict, Optional
+
 import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from .config import get_settings
+from .timing import stage
+from .tokens import CertificateRefresher, FakeIssuer, TokenCache, TokenVerifier
 
 # Get application settings
 settings = get_settings()
@@ -11,6 +17,30 @@ settings = get_settings()
 # Define the security scheme for bearer tokens
 http_bearer = HTTPBearer()
 
+# Verified claims by token hash, until the token expires
+token_cache = TokenCache(max_entries=settings.AUTH_TOKEN_CACHE_MAX_ENTRIES)
+
+
+def create_token_verifier() -> Optional[TokenVerifier]:
+    """
+    Local verification against prefetched certificates: Google's, or the fake
+    issuer's when AUTH_FAKE_ISSUER_KEY_PATH is set. None with the auth
+    emulator, whose unsigned tokens are left to the Firebase Admin SDK, and
+    with TEST_AUTH_BYPASS, where no token is verified (and so no certificates
+    are fetched).
+    """
+    if os.getenv("TEST_AUTH_BYPASS") == "1":
+        return None
+    if settings.AUTH_FAKE_ISSUER_KEY_PATH:
+        issuer = FakeIssuer(settings.FIREBASE_PROJECT_ID, settings.AUTH_FAKE_ISSUER_KEY_PATH)
+        return TokenVerifier(settings.FIREBASE_PROJECT_ID, CertificateRefresher(issuer.certificates))
+    if settings.FIREBASE_AUTH_EMULATOR_HOST:
+        return None
+    return TokenVerifier(settings.FIREBASE_PROJECT_ID)
+
+
+token_verifier = create_token_verifier()
+
 def init_firebase():
     """
     Initializes the Firebase Admin SDK idempotently, handling both production 
@@ -35,19 +65,36 @@ def init_firebase():
                 "projectId": settings.FIREBASE_PROJECT_ID
             })
 
+def verify_token(id_token: str) -> Dict[str, Any]:
+    """Verifies `id_token` and caches its claims. Blocking: call it off the event loop."""
+    if token_verifier is None:
+        init_firebase()
+        claims = auth.verify_id_token(id_token)
+    else:
+        claims = token_verifier.verify(id_token)
+    token_cache.put(id_token, claims)
+    return claims
+
+
+def auth_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"token_cache": token_cache.stats()}
+    if token_verifier is not None:
+        stats["certificates"] = token_verifier.certificates.stats()
+    return stats
+
+
 async def get_current_user(
     token: HTTPAuthorizationCredentials = Depends(http_bearer)
 ) -> dict:
     """
-    FastAPI dependency that initializes Firebase, verifies the ID token from the
-    Authorization header, and returns the decoded user data (claims).
+    FastAPI dependency that verifies the ID token from the Authorization header
+    and returns the decoded user data (claims). Tokens seen before are answered
+    from the cache; new ones are verified in the thread pool.
 
     Raises:
         HTTPException(401): If the token is missing, malformed, invalid, or expired.
         HTTPException(500): For any other unexpected errors during token verification.
     """
-    init_firebase()  # Ensure Firebase is initialized before proceeding
-
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -58,7 +105,10 @@ async def get_current_user(
     try:
         # Verify the ID token using the Firebase Admin SDK
         id_token = token.credentials
-        decoded_token = auth.verify_id_token(id_token)
+        with stage("auth"):
+            decoded_token = token_cache.get(id_token)
+            if decoded_token is None:
+                decoded_token = await run_in_threadpool(verify_token, id_token)
         return decoded_token
     except (auth.InvalidIdTokenError, ValueError) as e:
         # Catches malformed, invalid, or expired tokens
@@ -0,0 +1,418 @@
+"""
+Copy-on-write chunk storage for BM25Index.
+
+A ChunkStore is the index's mutable doc id -> DocumentChunk mapping. Its
+``freeze()`` returns an immutable FrozenChunks view that an index snapshot can
+hold while writers keep changing the store.
+
+Freezing must not copy every chunk on every write batch, so the store is
+layered. An immutable base (a plain dict, or chunks memory-mapped from a
+snapshot on disk) sits under an immutable layer of changes. Recent writes go
+to a small mutable overlay, and only that overlay is copied by ``freeze()``.
+Once the overlay grows past about sqrt(n) entries it is folded into a new
+immutable layer, which keeps both the per-freeze copy and the amortized
+folding cost small.
+
+The folded layer does not keep DocumentChunk models around (about a kilobyte
+of Python objects each, besides the text). Chunks are stored column-wise in a
+ChunkColumns: text packed into one buffer, course ids, sources and titles
+interned, timestamps as integers, and headings and metadata kept as JSON until
+a chunk is read. A DocumentChunk is only rebuilt when a chunk is accessed,
+i.e. for the top-k of a search.
+
+Chunk text is stored deflated, each chunk on its own so that any one can be
+read without the others. Chunks of one course share a lot of vocabulary that
+a single chunk is too short to exploit, so once a course has enough chunks a
+preset dictionary is built from a sample of them (zlib's ``zdict``, the same
+idea as a trained zstd dictionary). Decompressed text of recently read chunks
+is kept in ``text_cache``, a byte-bounded LRU shared by all courses.
+"""
+
+import itertools
+import json
+import math
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, Iterator, List, Mapping, MutableMapping, Optional, Set, Tuple
+
+from pydantic_core import from_json
+
+from .models import DocumentChunk
+
+# Overlay size below which freeze() never folds
+_MIN_OVERLAY = 1024
+
+# Chunks a course needs before a compression dictionary is trained from them
+_TRAIN_MIN_CHUNKS = 256
+ZDICT_SIZE = 16 * 1024
+# Level 3 compresses within ~5% of level 6 at half the cost (lecture text)
+_COMPRESS_LEVEL = 3
+# Shorter text is stored as is: the deflate framing would not pay for itself
+_COMPRESS_MIN_BYTES = 64
+DEFAULT_TEXT_CACHE_BYTES = 64 * 1024 * 1024
+
+_NO_INT = -(2 ** 63)  # chunk_index None, or a timestamp kept verbatim in ChunkColumns._raw
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _decode_time(value: int) -> str:
+    # Low bit: UTC offset (+00:00) present; the rest: microseconds since the epoch.
+    base = _EPOCH_UTC if value & 1 else _EPOCH
+    return (base + (value >> 1) * _MICROSECOND).isoformat()
+
+
+def _encode_time(value: str) -> int:
+    """`value` as an int, or _NO_INT if decoding would not give back the exact string."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return _NO_INT
+    if dt.tzinfo is None:
+        encoded = ((dt - _EPOCH) // _MICROSECOND) * 2
+    elif dt.utcoffset() == timedelta(0):
+        encoded = ((dt - _EPOCH_UTC) // _MICROSECOND) * 2 + 1
+    else:
+        return _NO_INT
+    return encoded if _decode_time(encoded) == value else _NO_INT
+
+
+def train_zdict(texts: List[str], size: int = ZDICT_SIZE) -> bytes:
+    """
+    A preset deflate dictionary for chunks like `texts`: an evenly spread
+    sample of them, concatenated. Deflate finds matches anywhere in the
+    dictionary, so raw sample text works about as well as picking n-grams.
+    """
+    if not texts:
+        return b""
+    average = max(1, sum(len(t) for t in texts) // len(texts))
+    step = max(1, len(texts) * average // size)
+    return "".join(texts[::step]).encode("utf-8")[-size:]
+
+
+class TextCache:
+    """
+    Byte-bounded LRU of decompressed chunk text, keyed by (columns id, row).
+    Entries are charged their in-memory size (sys.getsizeof): a str takes one
+    to four bytes per character, plus its header.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_TEXT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[int, int]) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: Tuple[int, int], text: str) -> None:
+        size = sys.getsizeof(text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = text
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= sys.getsizeof(old)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            }
+
+
+text_cache = TextCache()
+_column_ids = itertools.count()
+
+
+class ChunkColumns:
+    """
+    Append-only column storage of chunks; ``append`` returns the new row.
+
+    Rows are never modified after they are appended, so immutable views over
+    some of them (ColumnarChunks) stay valid while later rows are added.
+    Replaced and deleted chunks leave dead rows behind until ``compacted``.
+    """
+
+    def __init__(self, zdict: Optional[bytes] = None, compress: bool = True):
+        self.id = next(_column_ids)  # text_cache key; id() could be reused after garbage collection
+        self.zdict = zdict
+        self.compress = compress
+        # Primed once and copied per chunk: loading a dictionary costs more than a short chunk.
+        self._deflate = zlib.compressobj(_COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=zdict or b"")
+        self._inflate = zlib.decompressobj(-15, zdict=zdict or b"")
+        self._strings: List[Optional[str]] = [None]  # interned values; 0 = None
+        self._string_ids: Dict[str, int] = {}
+        self._course = array("i")
+        self._source = array("i")
+        self._title = array("i")
+        self._chunk_index = array("q")
+        self._created = array("q")
+        self._updated = array("q")
+        self._text = bytearray()
+        self._text_ptr = array("q", [0])
+        self._deflated = bytearray()  # per row: 1 if its text is compressed
+        # JSON of [headings, metadata], empty when they are None and {}
+        self._extra = bytearray()
+        self._extra_ptr = array("q", [0])
+        # Values that do not fit a column, by (row, field): odd timestamps, non-JSON metadata
+        self._raw: Dict[Tuple[int, str], Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._course)
+
+    def _intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def append(self, doc: DocumentChunk) -> int:
+        row = len(self)
+        self._course.append(self._intern(doc.course_id))
+        self._source.append(self._intern(doc.source))
+        self._title.append(self._intern(doc.title))
+        self._chunk_index.append(_NO_INT if doc.chunk_index is None else doc.chunk_index)
+        for column, field in ((self._created, "created_at"), (self._updated, "updated_at")):
+            value = getattr(doc, field)
+            encoded = _encode_time(value)
+            column.append(encoded)
+            if encoded == _NO_INT:
+                self._raw[row, field] = value
+        data = doc.content.encode("utf-8")
+        deflated = False
+        if self.compress and len(data) >= _COMPRESS_MIN_BYTES:
+            deflate = self._deflate.copy()
+            packed = deflate.compress(data) + deflate.flush()
+            if len(packed) < len(data):
+                data, deflated = packed, True
+        self._text += data
+        self._text_ptr.append(len(self._text))
+        self._deflated.append(deflated)
+        if doc.headings is not None or doc.metadata:
+            try:
+                self._extra += json.dumps([doc.headings, doc.metadata], separators=(",", ":")).encode("utf-8")
+            except (TypeError, ValueError):
+                self._raw[row, "extra"] = (doc.headings, doc.metadata)
+        self._extra_ptr.append(len(self._extra))
+        return row
+
+    def get(self, row: int, doc_id: str) -> DocumentChunk:
+        headings, metadata = None, {}
+        start, end = self._extra_ptr[row], self._extra_ptr[row + 1]
+        if start != end:
+            headings, metadata = from_json(self._extra[start:end])
+        elif (row, "extra") in self._raw:
+            headings, metadata = self._raw[row, "extra"]
+        chunk_index = self._chunk_index[row]
+        created, updated = self._created[row], self._updated[row]
+        created_at = self._raw[row, "created_at"] if created == _NO_INT else _decode_time(created)
+        if updated == created and updated != _NO_INT:
+            updated_at = created_at  # never-updated chunks: decode once
+        else:
+            updated_at = self._raw[row, "updated_at"] if updated == _NO_INT else _decode_time(updated)
+        return DocumentChunk(
+            id=doc_id,
+            course_id=self._strings[self._course[row]],
+            source=self._strings[self._source[row]],
+            chunk_index=None if chunk_index == _NO_INT else chunk_index,
+            title=self._strings[self._title[row]],
+            headings=headings,
+            content=self.text(row),
+            metadata=metadata,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+    def text(self, row: int) -> str:
+        data = self._text[self._text_ptr[row]:self._text_ptr[row + 1]]
+        if not self._deflated[row]:
+            return data.decode("utf-8")
+        key = (self.id, row)
+        text = text_cache.get(key)
+        if text is None:
+            inflate = self._inflate.copy()
+            text = (inflate.decompress(data) + inflate.flush()).decode("utf-8")
+            text_cache.put(key, text)
+        return text
+
+    def compressed_bytes(self) -> int:
+        return len(self._text)
+
+    def compacted(self, rows: Dict[str, int], retrain: bool = False) -> Tuple["ChunkColumns", Dict[str, int]]:
+        """
+        New columns holding only `rows` (doc id -> row), and the ids' rows in
+        them. With `retrain`, the new columns get a dictionary trained on them.
+        """
+        zdict = self.zdict
+        if retrain and self.compress:
+            zdict = train_zdict([self.text(row) for row in itertools.islice(rows.values(), 4096)])
+        columns = ChunkColumns(zdict, self.compress)
+        return columns, {doc_id: columns.append(self.get(row, doc_id)) for doc_id, row in rows.items()}
+
+
+class ColumnarChunks(Mapping):
+    """Immutable doc id -> DocumentChunk view of some rows of a ChunkColumns."""
+
+    __slots__ = ("columns", "rows")
+
+    def __init__(self, columns: ChunkColumns, rows: Dict[str, int]):
+        self.columns = columns
+        self.rows = rows
+
+    def __getitem__(self, doc_id: str) -> DocumentChunk:
+        return self.columns.get(self.rows[doc_id], doc_id)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self.rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class FrozenChunks(Mapping):
+    """
+    ``base`` with ``changes`` applied and ``hidden`` ids removed. ``hidden``
+    must only name ids of ``base``; none of the three is ever mutated.
+    """
+
+    __slots__ = ("_base", "_changes", "_hidden", "_len")
+
+    def __init__(
+        self,
+        base: Mapping[str, DocumentChunk],
+        changes: Mapping[str, DocumentChunk],
+        hidden: FrozenSet[str],
+    ):
+        self._base = base
+        self._changes = changes
+        self._hidden = hidden
+        self._len = len(base) - len(hidden) + len(changes)
+
+    def __getitem__(self, doc_id: str) -> DocumentChunk:
+        doc = self._changes.get(doc_id)
+        if doc is not None:
+            return doc
+        if doc_id in self._hidden:
+            raise KeyError(doc_id)
+        return self._base[doc_id]
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._changes or (doc_id not in self._hidden and doc_id in self._base)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._changes
+        for doc_id in self._base:
+            if doc_id not in self._hidden:
+                yield doc_id
+
+    def __len__(self) -> int:
+        return self._len
+
+
+class ChunkStore(MutableMapping):
+    def __init__(self, base: Optional[Mapping[str, DocumentChunk]] = None, compress: bool = True):
+        self._columns = ChunkColumns(compress=compress)
+        self._frozen = FrozenChunks(
+            base if base is not None else {}, ColumnarChunks(self._columns, {}), frozenset()
+        )
+        self._overlay: Dict[str, DocumentChunk] = {}
+        self._hidden: Set[str] = set()  # ids of self._frozen deleted or overwritten since the last fold
+
+    def __getitem__(self, doc_id: str) -> DocumentChunk:
+        doc = self._overlay.get(doc_id)
+        if doc is not None:
+            return doc
+        if doc_id in self._hidden:
+            raise KeyError(doc_id)
+        return self._frozen[doc_id]
+
+    def __setitem__(self, doc_id: str, doc: DocumentChunk):
+        if doc_id in self._frozen:
+            self._hidden.add(doc_id)
+        self._overlay[doc_id] = doc
+
+    def __delitem__(self, doc_id: str):
+        if doc_id in self._overlay:
+            del self._overlay[doc_id]
+        elif doc_id in self._frozen and doc_id not in self._hidden:
+            self._hidden.add(doc_id)
+        else:
+            raise KeyError(doc_id)
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._overlay or (doc_id not in self._hidden and doc_id in self._frozen)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._overlay
+        for doc_id in self._frozen:
+            if doc_id not in self._hidden:
+                yield doc_id
+
+    def __len__(self) -> int:
+        return len(self._frozen) - len(self._hidden) + len(self._overlay)
+
+    def freeze(self) -> FrozenChunks:
+        """An immutable view of the current contents."""
+        if len(self._overlay) + len(self._hidden) > max(_MIN_OVERLAY, 4 * math.isqrt(len(self))):
+            self._fold()
+        if not self._overlay and not self._hidden:
+            return self._frozen
+        return FrozenChunks(self._frozen, dict(self._overlay), frozenset(self._hidden))
+
+    def _fold(self):
+        """Merge the overlay into a new immutable changes layer over the same base."""
+        frozen = self._frozen
+        rows = dict(frozen._changes.rows)
+        hidden = set(frozen._hidden)
+        for doc_id in self._hidden:
+            if rows.pop(doc_id, None) is None:
+                hidden.add(doc_id)  # lived in the base
+        columns = self._columns
+        for doc_id, doc in self._overlay.items():
+            rows[doc_id] = columns.append(doc)
+        untrained = columns.compress and columns.zdict is None and len(rows) >= _TRAIN_MIN_CHUNKS
+        if untrained or len(columns) > 2 * len(rows) + _MIN_OVERLAY:
+            # Mostly replaced or deleted chunks, or enough of them to train a dictionary from.
+            # Views still holding the old columns keep them alive.
+            columns, rows = columns.compacted(rows, retrain=True)
+            self._columns = columns
+        self._frozen = FrozenChunks(frozen._base, ColumnarChunks(columns, rows), frozenset(hidden))
+        self._overlay = {}
+        self._hidden = set()
@@ -1,9 +1,87 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     """Manages application settings and environment variables."""
     FIREBASE_AUTH_EMULATOR_HOST: str | None = None
     FIREBASE_PROJECT_ID: str = "your-gcp-project-id"
+    # Verified ID tokens remembered until they expire
+    AUTH_TOKEN_CACHE_MAX_ENTRIES: int = 10_000
+    # Offline load testing: accept tokens signed with the RSA key in this file (created if missing)
+    # instead of Google-issued ones. Never set it in production.
+    AUTH_FAKE_ISSUER_KEY_PATH: str | None = None
+
+    # Fraction of tombstoned rows at which an index compacts in the background
+    INDEX_COMPACT_THRESHOLD: float = 0.2
+
+    # Store chunk text deflated with a per-course trained dictionary
+    CHUNK_COMPRESSION: bool = True
+    # Decompressed chunk text kept for hot chunks, shared by all courses
+    CHUNK_TEXT_CACHE_MB: float = 64.0
+
+    # Threads used to search course indices concurrently for cross-course queries
+    FEDERATED_SEARCH_WORKERS: int = 4
+
+    # Dense retrieval for modes "vector" and "hybrid". Chunks are then embedded at ingest, on the
+    # request thread unless EMBEDDING_WORKERS is set, which makes batch uploads 2-3x slower.
+    VECTOR_SEARCH_ENABLED: bool = False
+    # A registered embedder name ("hashing") or a "package.module:ClassName" path
+    EMBEDDER: str = "hashing"
+    EMBEDDING_DIM: int = 256
+    # Storage precision of the embedding matrix: float32, float16 or int8
+    VECTOR_DTYPE: str = "float32"
+    # Chunks per embedding call at ingest, and processes embedding batches in parallel (0 = inline)
+    EMBEDDING_BATCH_SIZE: int = 256
+    EMBEDDING_WORKERS: int = 0
+    # SQLite cache of embeddings by content hash; defaults to INDEX_SNAPSHOT_DIR/embeddings.sqlite
+    EMBEDDING_CACHE_PATH: str | None = None
+    # Courses with at least this many chunks use approximate (IVF) vector search; 0 disables it
+    VECTOR_ANN_MIN_ROWS: int = 50_000
+    # IVF cells probed per query: higher is slower but closer to exact
+    VECTOR_ANN_NPROBE: int = 16
+
+    # mode="hybrid": how long to wait for each leg before answering from the other one
+    HYBRID_LEXICAL_DEADLINE_MS: float = 250.0
+    HYBRID_VECTOR_DEADLINE_MS: float = 250.0
+    # Reciprocal rank fusion constant; larger values flatten the weight of top ranks
+    HYBRID_RRF_K: int = 60
+
+    # Cached search rankings, invalidated per course when its index changes
+    QUERY_CACHE_MAX_ENTRIES: int = 1024
+    QUERY_CACHE_TTL_SECONDS: float = 60.0
+
+    # Signing key for search next_page_token cursors; unset uses a random per-process key
+    PAGE_TOKEN_SECRET: str | None = None
+    # How long page tokens, and the ranked lists behind them, stay valid
+    PAGE_TOKEN_TTL_SECONDS: float = 300.0
+
+    # Directory for on-disk index snapshots; unset keeps indices in memory only
+    INDEX_SNAPSHOT_DIR: str | None = None
+    INDEX_SNAPSHOT_INTERVAL_SECONDS: float = 60.0
+
+    # "indexer" owns writes (the only mode without INDEX_SNAPSHOT_DIR); "reader" processes serve
+    # searches from the snapshots an indexer publishes to the same INDEX_SNAPSHOT_DIR
+    SERVICE_ROLE: Literal["indexer", "reader"] = "indexer"
+    # How often a reader checks for newly published index generations
+    REPLICA_POLL_INTERVAL_MS: float = 500.0
+
+    # Acknowledge batch writes once logged and index them in the background (202 + operation id)
+    INDEXING_ASYNC: bool = False
+    # How long the indexing worker lets a burst of writes pile up before applying it
+    INDEXING_COALESCE_MS: float = 50.0
+    # Documents waiting to be indexed above which new writes are rejected with 503
+    INDEXING_MAX_PENDING_DOCS: int = 100_000
+    # Longest a search with min_generation waits for the index to catch up
+    MIN_GENERATION_TIMEOUT_MS: float = 5000.0
+
+    # Background sampling of process CPU, memory, threads and open files for /health/history
+    PROCESS_SAMPLE_INTERVAL_MS: float = 1000.0
+    PROCESS_SAMPLE_HISTORY: int = 600
+
+    # Write-ahead log (kept under INDEX_SNAPSHOT_DIR/wal when snapshots are enabled)
+    WAL_GROUP_COMMIT_MS: float = 2.0
+    WAL_FSYNC: bool = True
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
@@ -0,0 +1,198 @@
+"""
+Ingest-side embedding: cache lookup, fixed-size batching and a process pool.
+
+Chunks are looked up in an EmbeddingCache first, keyed by (embedder id,
+content hash); the embedder id changes whenever its output would, so a cache
+never serves vectors from a different model. Only the misses are embedded, in
+batches of ``batch_size`` texts. With ``workers`` > 0 the batches are spread
+over a process pool (embedding is CPU-bound Python, so threads would contend
+on the GIL); each worker process builds its own copy of the embedder once.
+
+The cache is a SQLite file, so unchanged chunks are not re-embedded after a
+restart, or when a lecture is deleted and uploaded again, or copied to another
+course.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .embeddings import Embedder
+
+DEFAULT_BATCH_SIZE = 256
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+class EmbeddingCache:
+    """Persistent map of (embedder id, content hash) -> float32 vector."""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " embedder TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (embedder, hash)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def get_many(self, embedder_id: str, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_CHUNK):
+                chunk = unique[start:start + _LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    "SELECT hash, vector FROM embeddings WHERE embedder = ? AND hash IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    [embedder_id, *chunk],
+                )
+                for h, blob in rows:
+                    found[bytes(h)] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, embedder_id: str, hashes: List[bytes], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (embedder, hash, vector) VALUES (?, ?, ?)",
+                [(embedder_id, h, v.tobytes()) for h, v in zip(hashes, vectors)],
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Set in each pool worker by _init_worker, so the embedder is pickled once per
+# process rather than once per batch.
+_worker_embedder: Optional[Embedder] = None
+
+
+def _init_worker(embedder: Embedder) -> None:
+    global _worker_embedder
+    _worker_embedder = embedder
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return _worker_embedder.embed(texts)
+
+
+class EmbeddingPipeline:
+    def __init__(
+        self,
+        embedder: Embedder,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = 0,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.workers = workers
+        self.cache = cache
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = Lock()
+        self._stats_lock = Lock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.embedded = 0
+        self.batches = 0
+        self.embed_seconds = 0.0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # "spawn": forking a process that already runs server threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.embedder,),
+                )
+            return self._pool
+
+    def _embed_misses(self, texts: List[str]) -> np.ndarray:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        started = time.perf_counter()
+        if self.workers > 0 and len(batches) > 1:
+            vectors = np.concatenate(list(self._get_pool().map(_embed_batch, batches)))
+        else:
+            # A single batch is not worth the round trip to another process.
+            vectors = np.concatenate([self.embedder.embed(batch) for batch in batches])
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.embedded += len(texts)
+            self.batches += len(batches)
+            self.embed_seconds += elapsed
+        return vectors
+
+    def embed(self, texts: List[str], hashes: List[bytes]) -> np.ndarray:
+        """Embeddings of `texts`, whose content hashes are `hashes`."""
+        out = np.empty((len(texts), self.embedder.dim), dtype=np.float32)
+        if not texts:
+            return out
+
+        cached = self.cache.get_many(self.embedder.id, hashes) if self.cache is not None else {}
+        missing: Dict[bytes, List[int]] = {}  # hash -> positions, so duplicates embed once
+        for i, h in enumerate(hashes):
+            vector = cached.get(h)
+            if vector is not None:
+                out[i] = vector
+            else:
+                missing.setdefault(h, []).append(i)
+
+        with self._stats_lock:
+            # Repeats of a missing text within the batch are served by its one embedding.
+            self.cache_hits += len(texts) - len(missing)
+            self.cache_misses += len(missing)
+
+        if missing:
+            miss_hashes = list(missing)
+            vectors = self._embed_misses([texts[missing[h][0]] for h in miss_hashes])
+            for h, vector in zip(miss_hashes, vectors):
+                out[missing[h]] = vector
+            if self.cache is not None:
+                self.cache.put_many(self.embedder.id, miss_hashes, vectors)
+        return out
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "batch_size": self.batch_size,
+                "workers": self.workers,
+                "cache_enabled": self.cache is not None,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_rate": round(self.cache_hits / lookups * 100, 2) if lookups else 0.0,
+                "embedded_chunks": self.embedded,
+                "batches": self.batches,
+                "embed_seconds": round(self.embed_seconds, 3),
+                "chunks_per_second": round(self.embedded / self.embed_seconds, 1) if self.embed_seconds else 0.0,
+            }
+
+    def close(self) -> None:
+        """Stop the worker processes (they are restarted on demand)."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
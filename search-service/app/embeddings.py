@@ -0,0 +1,129 @@
+"""
+Text embedders for dense ("vector" mode) retrieval.
+
+An embedder maps a batch of texts to an (n, dim) float32 matrix of
+L2-normalized rows, so a dot product is a cosine similarity. It also carries an
+``id`` that changes whenever its output would, which is what embedding caches
+key on.
+
+The default, HashingEmbedder, needs no model download or network access: each
+word and its character trigrams are hashed into a fixed number of buckets
+(the "hashing trick", with a hash-derived sign to cancel collisions), and the
+resulting sparse vector is reduced by a fixed random Gaussian projection. It is
+deterministic for a given seed, so vectors are stable across processes and
+restarts. Other embedders are plugged in by name via ``register_embedder`` or
+as a ``"package.module:ClassName"`` import path.
+"""
+
+import importlib
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Callable, Dict, List, Protocol, Tuple
+
+import numpy as np
+from bm25s.stopwords import STOPWORDS_EN
+
+_WORD_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+_STOPWORDS = frozenset(STOPWORDS_EN)
+
+
+class Embedder(Protocol):
+    id: str
+    dim: int
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return an (len(texts), dim) float32 matrix with L2-normalized rows."""
+        ...
+
+
+class HashingEmbedder:
+    """Hashed word + character-trigram features, randomly projected to `dim`."""
+
+    BATCH_SIZE = 256
+    MAX_CACHED_WORDS = 200_000
+
+    def __init__(self, dim: int = 256, num_buckets: int = 1 << 13, seed: int = 0):
+        if num_buckets & (num_buckets - 1):
+            raise ValueError("num_buckets must be a power of two")
+        self.dim = dim
+        self.num_buckets = num_buckets
+        self.seed = seed
+        self.id = f"hashing-v1-d{dim}-b{num_buckets}-s{seed}"
+
+        rng = np.random.default_rng(seed)
+        self._projection = (
+            rng.standard_normal((num_buckets, dim), dtype=np.float32) / np.float32(math.sqrt(dim))
+        )
+        # word -> (buckets, signed weights) of the word and its trigrams
+        self._word_features: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._word_features.get(word)
+        if cached is not None:
+            return cached
+
+        padded = f"<{word}>"
+        trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        grams = [f"w:{word}", *trigrams]
+        weights = [1.0] + [1.0 / math.sqrt(len(trigrams))] * len(trigrams)
+
+        hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+        buckets = np.array([h & (self.num_buckets - 1) for h in hashes], dtype=np.int64)
+        signed = np.array(
+            [w if h & 0x80000000 else -w for h, w in zip(hashes, weights)], dtype=np.float32
+        )
+
+        if len(self._word_features) >= self.MAX_CACHED_WORDS:
+            self._word_features.clear()
+        self._word_features[word] = (buckets, signed)
+        return buckets, signed
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            batch = texts[start:start + self.BATCH_SIZE]
+            cells: List[np.ndarray] = []
+            values: List[np.ndarray] = []
+            for i, text in enumerate(batch):
+                words = Counter(
+                    w for w in _WORD_PATTERN.findall(text.lower()) if w not in _STOPWORDS
+                )
+                for word, tf in words.items():
+                    buckets, signed = self._features(word)
+                    cells.append(buckets + i * self.num_buckets)
+                    # Sublinear term frequency, as in tf-idf
+                    values.append(signed * (1 + math.log(tf)))
+            if not cells:
+                continue
+
+            # Sum every (text, bucket) contribution of the batch in one pass.
+            sparse = np.bincount(
+                np.concatenate(cells),
+                weights=np.concatenate(values),
+                minlength=len(batch) * self.num_buckets,
+            ).astype(np.float32).reshape(len(batch), self.num_buckets)
+            out[start:start + len(batch)] = sparse @ self._projection
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+_EMBEDDERS: Dict[str, Callable[..., Embedder]] = {"hashing": HashingEmbedder}
+
+
+def register_embedder(name: str, factory: Callable[..., Embedder]) -> None:
+    _EMBEDDERS[name] = factory
+
+
+def create_embedder(name: str, **kwargs) -> Embedder:
+    """Instantiate a registered embedder, or one given as "package.module:ClassName"."""
+    factory = _EMBEDDERS.get(name)
+    if factory is None:
+        if ":" not in name:
+            raise ValueError(f"Unknown embedder {name!r}")
+        module_name, attr = name.split(":", 1)
+        factory = getattr(importlib.import_module(module_name), attr)
+    return factory(**kwargs)
@@ -0,0 +1,161 @@
+"""
+Cross-course search federated over the per-course BM25 indices.
+
+Instead of indexing every chunk a second time in a global index, a global
+query is answered by the course indices themselves:
+
+1. the query is tokenized once (all indices share one vocabulary);
+2. each index reports N, total document length and the document frequency of
+   the query terms, and these are summed into one CollectionStats, so IDF and
+   avgdl are those of the combined corpus, as with a single global index;
+3. every index the caller may read (``course_ids``) that contains at least one
+   query term scores its own rows with those global statistics, concurrently
+   on a thread pool (NumPy releases the GIL for the heavy array work);
+4. the per-index top-k lists of doc ids are merged with a heap, and only the
+   chunks of the overall top-k are built (not k per course). federated_rank
+   stops before that and returns (course id, doc id, score) triples, for
+   callers that only hydrate part of the ranking.
+
+Course access is therefore enforced by retrieval itself: each course index is
+the precomputed document set of one course, only allowed documents compete
+for the top-k, and scoring cost scales with the allowed courses rather than
+the whole corpus. Statistics still cover every course, so a document scores
+the same no matter who is searching.
+
+Indices that contain none of the query terms are not searched at all; they
+could only contribute zero-score filler.
+
+Vector search federates the same way, minus the statistics: the query is
+embedded once and cosine similarities are comparable across courses as is.
+"""
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from typing import Collection, Dict, List, Mapping, Optional, Tuple
+
+from .index import BM25Index, CollectionStats, IndexSnapshot
+from .models import DocumentChunk
+from .timing import stage
+from .vector_index import VectorIndex
+
+DEFAULT_MAX_WORKERS = 4
+
+# One shared pool per size, so every caller gets the concurrency it asked for
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f"federated-search-{max_workers}"
+            )
+        return executor
+
+
+def federated_search(
+    indices: Mapping[str, BM25Index],
+    query: str,
+    k: int = 10,
+    course_ids: Optional[Collection[str]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> List[Tuple[DocumentChunk, float]]:
+    """
+    Top-k over the course indices in `indices` (course id -> index), restricted
+    to `course_ids` when given (None searches every course).
+    """
+    top = _rank_shards(indices, query, k, course_ids, max_workers)
+    with stage("hydrate"):
+        return [(snap.docs[doc_id], score) for snap, _, doc_id, score in top]
+
+
+def federated_rank(
+    indices: Mapping[str, BM25Index],
+    query: str,
+    k: int = 10,
+    course_ids: Optional[Collection[str]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> List[Tuple[str, str, float]]:
+    """Like federated_search, but the top-k as (course id, doc id, score), unhydrated."""
+    return [(course_id, doc_id, score) for _, course_id, doc_id, score in
+            _rank_shards(indices, query, k, course_ids, max_workers)]
+
+
+def _rank_shards(
+    indices: Mapping[str, BM25Index],
+    query: str,
+    k: int,
+    course_ids: Optional[Collection[str]],
+    max_workers: int,
+) -> List[Tuple[IndexSnapshot, str, str, float]]:
+    if not indices or k <= 0:
+        return []
+    with stage("tokenize"):
+        query_terms = next(iter(indices.values())).query_terms(query)
+
+    # One snapshot per course, so statistics and scores come from the same state.
+    snapshots = {course_id: index.snapshot() for course_id, index in indices.items()}
+    snapshots = {course_id: snap for course_id, snap in snapshots.items() if len(snap)}
+    shard_stats = {course_id: snap.collection_stats(query_terms) for course_id, snap in snapshots.items()}
+    stats = reduce(CollectionStats.merge, shard_stats.values(), CollectionStats())
+
+    shards = [
+        (course_id, snap)
+        for course_id, snap in snapshots.items()
+        if shard_stats[course_id].df and (course_ids is None or course_id in course_ids)
+    ]
+    if not shards:
+        return []
+
+    def rank_shard(course_id: str, snap: IndexSnapshot) -> List[Tuple[IndexSnapshot, str, str, float]]:
+        return [(snap, course_id, doc_id, score) for doc_id, score in snap.rank_terms(query_terms, k, stats)]
+
+    with stage("retrieve"):
+        if len(shards) == 1:
+            per_shard = [rank_shard(*shards[0])]
+        else:
+            executor = _get_executor(max_workers)
+            futures = [executor.submit(rank_shard, course_id, snap) for course_id, snap in shards]
+            per_shard = [f.result() for f in futures]
+        return _merge_top_k(per_shard, k)
+
+
+def federated_vector_search(
+    indices: Mapping[str, VectorIndex],
+    query: str,
+    k: int = 10,
+    course_ids: Optional[Collection[str]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> List[Tuple[str, str, float]]:
+    """Top-k (course id, doc id, cosine similarity) over the allowed vector indices."""
+    shards = {
+        course_id: index
+        for course_id, index in indices.items()
+        if len(index) and (course_ids is None or course_id in course_ids)
+    }
+    if not shards or k <= 0:
+        return []
+
+    query_vector = next(iter(shards.values())).embedder.embed([query])
+
+    def search_shard(course_id: str, index: VectorIndex) -> List[Tuple[str, str, float]]:
+        return [(course_id, doc_id, score) for doc_id, score in index.search_vectors(query_vector, k)[0]]
+
+    if len(shards) == 1:
+        per_shard = [search_shard(*next(iter(shards.items())))]
+    else:
+        executor = _get_executor(max_workers)
+        futures = [executor.submit(search_shard, course_id, index) for course_id, index in shards.items()]
+        per_shard = [f.result() for f in futures]
+
+    return _merge_top_k(per_shard, k)
+
+
+def _merge_top_k(per_shard: List[list], k: int) -> list:
+    # Each list is already sorted by descending score (its last element).
+    merged = heapq.merge(*per_shard, key=lambda hit: hit[-1], reverse=True)
+    return [hit for _, hit in zip(range(k), merged)]
@@ -0,0 +1,135 @@
+"""
+Hybrid retrieval: lexical (BM25) and vector legs run concurrently and their
+rankings are merged with reciprocal rank fusion,
+
+    score(d) = sum over legs of 1 / (rrf_k + rank of d in that leg)
+
+which needs no score normalization between BM25 and cosine similarity.
+
+Each leg has its own deadline. A leg that misses it (or fails) is dropped and
+the request is served from the remaining legs instead of waiting; the result
+is then marked partial so that it is not cached. Only when every leg is lost
+does the search fail.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (ref, score): a ref is anything hashable naming the document, e.g. (course id, doc id)
+Hit = Tuple[Hashable, float]
+
+DEFAULT_RRF_K = 60
+DEFAULT_MAX_WORKERS = 8
+
+# One shared pool per size, so every caller gets the concurrency it asked for
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+class HybridSearchError(Exception):
+    """Raised when no retrieval leg produced a result in time."""
+
+
+@dataclass
+class LegTiming:
+    name: str
+    seconds: float
+    status: str = "ok"  # "ok", "timeout" or "error"
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f"hybrid-leg-{max_workers}"
+            )
+        return executor
+
+
+def _timed(fn: Callable[[], List[Hit]]) -> Callable[[], Tuple[List[Hit], float]]:
+    def run():
+        started = time.perf_counter()
+        hits = fn()
+        return hits, time.perf_counter() - started
+    return run
+
+
+def run_legs(
+    legs: Dict[str, Callable[[], List[Hit]]],
+    deadlines: Dict[str, float],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Tuple[Dict[str, List[Hit]], List[LegTiming]]:
+    """
+    Run every leg concurrently; wait for each at most its deadline (seconds,
+    measured from the start of this call). Returns the rankings of the legs
+    that finished in time, and a timing for every leg.
+    """
+    executor = _get_executor(max_workers)
+    started = time.perf_counter()
+    # Each leg gets its own copy of the request context, so it records into the request's stage timer.
+    futures = {name: executor.submit(contextvars.copy_context().run, _timed(fn)) for name, fn in legs.items()}
+
+    rankings: Dict[str, List[Hit]] = {}
+    timings: List[LegTiming] = []
+    for name, future in futures.items():
+        remaining = started + deadlines[name] - time.perf_counter()
+        try:
+            hits, seconds = future.result(timeout=max(0.0, remaining))
+        except FutureTimeout:
+            # The leg keeps running on its thread; its result is just ignored.
+            logger.warning("Hybrid %s leg missed its %.0f ms deadline", name, deadlines[name] * 1000)
+            timings.append(LegTiming(name, time.perf_counter() - started, "timeout"))
+            continue
+        except Exception:
+            logger.exception("Hybrid %s leg failed", name)
+            timings.append(LegTiming(name, time.perf_counter() - started, "error"))
+            continue
+        rankings[name] = hits
+        timings.append(LegTiming(name, seconds))
+
+    return rankings, timings
+
+
+def reciprocal_rank_fusion(rankings: List[List[Hit]], k: int, rrf_k: int = DEFAULT_RRF_K) -> List[Hit]:
+    fused: Dict[Hashable, float] = {}  # ref -> fused score
+    for ranking in rankings:
+        for rank, (ref, _) in enumerate(ranking, start=1):
+            fused[ref] = fused.get(ref, 0.0) + 1.0 / (rrf_k + rank)
+
+    # sorted() is stable: ties keep the order of the first leg that returned them
+    ranked = sorted(fused.items(), key=lambda entry: entry[1], reverse=True)
+    return ranked[:k]
+
+
+def hybrid_search(
+    legs: Dict[str, Callable[[int], List[Hit]]],
+    k: int,
+    deadlines: Dict[str, float],
+    rrf_k: int = DEFAULT_RRF_K,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Tuple[List[Hit], List[LegTiming], bool]:
+    """
+    Fused top-k over `legs` (name -> rank(k) callable). Returns the hits, the
+    per-leg timings (plus one for fusion) and whether any leg was dropped.
+    """
+    rankings, timings = run_legs(
+        {name: (lambda rank=rank: rank(k)) for name, rank in legs.items()},
+        deadlines,
+        max_workers,
+    )
+    if not rankings:
+        raise HybridSearchError("All retrieval legs failed or timed out")
+
+    started = time.perf_counter()
+    hits = reciprocal_rank_fusion(list(rankings.values()), k, rrf_k)
+    timings.append(LegTiming("fusion", time.perf_counter() - started))
+    return hits, timings, len(rankings) < len(legs)
@@ -1,66 +1,678 @@
-from typing import List, Dict, Tuple
-import bm25s
+import hashlib
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock, RLock, Thread
+from typing import Any, Iterable, List, Dict, Mapping, MutableMapping, Optional, Tuple
+
+import numpy as np
 import Stemmer
+from bm25s.stopwords import STOPWORDS_EN
+
+from .chunks import ChunkStore
 from .models import DocumentChunk
 
 
-class BM25Index:
+# Same splitting rules as bm25s.tokenize(stopwords="en"), so scores stay
+# identical to the old "rebuild a bm25s.BM25 from scratch" implementation.
+_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+_STOPWORDS = frozenset(STOPWORDS_EN)
+
+# bm25s defaults (method="lucene")
+K1 = 1.5
+B = 0.75
+
+DEFAULT_TOKEN_CACHE_SIZE = 100_000
+DEFAULT_COMPACT_THRESHOLD = 0.2
+DEFAULT_COMPACT_MIN_ROWS = 1024
+
+# Pads the unused capacity of posting buffers: above every row, so rows stay ascending
+_ROW_SENTINEL = np.iinfo(np.int32).max
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class Vocabulary:
+    """Thread-safe stemmed-term <-> id mapping shared by every BM25Index."""
+
     def __init__(self):
-        self.docs: Dict[str, DocumentChunk] = {}
-        self.doc_ids: List[str] = []
-        self.bm25 = None
+        self._ids: Dict[str, int] = {}
+        self._terms: List[str] = []
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def get(self, term: str) -> Optional[int]:
+        return self._ids.get(term)
+
+    def term(self, term_id: int) -> str:
+        return self._terms[term_id]
+
+    def add_many(self, terms: List[str]) -> np.ndarray:
+        ids = self._ids
+        missing = [t for t in terms if t not in ids]
+        if missing:
+            with self._lock:
+                for term in missing:
+                    if term not in ids:
+                        ids[term] = len(self._terms)
+                        self._terms.append(term)
+        return np.fromiter((ids[t] for t in terms), dtype=np.int32, count=len(terms))
+
+
+shared_vocabulary = Vocabulary()
+
+
+@dataclass
+class CollectionStats:
+    """
+    BM25 corpus statistics for a set of query terms. Summed across several
+    indices, they let each one score as part of a single combined corpus.
+    """
+
+    num_docs: int = 0
+    total_len: int = 0
+    df: Dict[int, int] = field(default_factory=dict)
+
+    def merge(self, other: "CollectionStats") -> "CollectionStats":
+        df = dict(self.df)
+        for term, count in other.df.items():
+            df[term] = df.get(term, 0) + count
+        return CollectionStats(self.num_docs + other.num_docs, self.total_len + other.total_len, df)
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """
+    Immutable view of a BM25Index at one generation. Searches score against a
+    single snapshot, so they never see a half-applied write or compaction.
+
+    ``doc_ids``, ``doc_len`` and ``postings`` may be shared with the live
+    index, which only appends to them: posting lists are buffers whose spare
+    capacity is padded with a sentinel row, and new postings are written into
+    that capacity in place. Rows from ``num_rows`` on (sentinels included) are
+    not part of this snapshot, and since posting rows are ascending they are
+    clipped off the end.
+    """
+
+    generation: int
+    num_rows: int
+    num_dead: int
+    total_len: int
+    doc_ids: List[str]
+    doc_len: np.ndarray
+    dead: Optional[np.ndarray]  # tombstone bitmap of the first num_rows rows; None if there are none
+    postings: Dict[int, Tuple[np.ndarray, np.ndarray]]
+    docs: Mapping[str, DocumentChunk]
+
+    def __len__(self) -> int:
+        return self.num_rows - self.num_dead
+
+    def _postings(self, term: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        postings = self.postings.get(term)
+        if postings is None:
+            return None
+        rows, tfs = postings
+        if len(rows) and rows[-1] >= self.num_rows:
+            end = int(np.searchsorted(rows, self.num_rows))
+            if end == 0:
+                return None
+            rows, tfs = rows[:end], tfs[:end]
+        return rows, tfs
+
+    def collection_stats(self, query_terms: Iterable[int]) -> CollectionStats:
+        df = {}
+        for term in set(query_terms):
+            postings = self._postings(term)
+            if postings is not None:
+                df[term] = len(postings[0])
+        return CollectionStats(self.num_rows, self.total_len, df)
+
+    def score(self, query_terms: List[int], stats: Optional[CollectionStats] = None) -> np.ndarray:
+        num_docs = self.num_rows
+        scores = np.zeros(num_docs, dtype=np.float32)
+        if self.total_len == 0:
+            return scores
+
+        if stats is None:
+            corpus_docs, avgdl = num_docs, self.total_len / num_docs
+        else:
+            corpus_docs, avgdl = stats.num_docs, stats.total_len / stats.num_docs
+        doc_len = self.doc_len[:num_docs]
+
+        # Repeated query terms count once per occurrence, as in bm25s.
+        for term in query_terms:
+            postings = self._postings(term)
+            if postings is None:
+                continue
+
+            rows, tfs = postings
+            df = len(rows) if stats is None else stats.df.get(term, len(rows))
+            idf = math.log(1 + (corpus_docs - df + 0.5) / (df + 0.5))
+
+            norm = K1 * (1 - B + B * doc_len[rows] / avgdl)
+            scores[rows] += idf * tfs / (tfs + norm)
+
+        return scores
+
+    def search_terms(
+        self,
+        query_terms: List[int],
+        k: int = 10,
+        stats: Optional[CollectionStats] = None,
+    ) -> List[Tuple[DocumentChunk, float]]:
+        return self.hydrate(self.rank_terms(query_terms, k, stats))
+
+    def rank_terms(
+        self,
+        query_terms: List[int],
+        k: int = 10,
+        stats: Optional[CollectionStats] = None,
+    ) -> List[Tuple[str, float]]:
+        """Top-k (doc id, score), without building the chunks."""
+        # Don't return more docs than we actually have
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+
+        scores = self.score(query_terms, stats)
+        if self.dead is not None:
+            scores[self.dead] = -np.inf
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        doc_ids = self.doc_ids
+        return [(doc_ids[idx], score) for idx, score in zip(top.tolist(), scores[top].tolist())]
+
+    def hydrate(self, ranked: List[Tuple[str, float]]) -> List[Tuple[DocumentChunk, float]]:
+        """The chunks of ranked (doc id, score) pairs."""
+        docs = self.docs
+        return [(docs[doc_id], score) for doc_id, score in ranked]
+
+
+class BM25Index:
+    """
+    Incremental BM25 index.
+
+    Each chunk occupies one row. The inverted index maps a term id to two
+    parallel NumPy arrays (rows, term frequencies); per-row document lengths
+    live in a flat array, so corpus statistics (N, avgdl, IDF) are derived
+    lazily at query time and adding a chunk only touches that chunk's terms.
+
+    Writes are append-only: a new or changed chunk gets a fresh row, whose
+    postings are buffered per term and folded into the arrays at most once
+    per ``upsert_many``/``delete_many`` batch, or on the next ``search()``
+    when ``lazy=True``.
+
+    Stemmed token-id sequences are cached by content hash, so re-uploading an
+    unchanged chunk, or a PATCH that only touches title/metadata, never
+    re-tokenizes.
+
+    Deletes, and the old row of an updated chunk, only set a bit in a
+    tombstone bitmap that retrieval masks out. Like Lucene, tombstoned rows
+    still count towards N, avgdl and document frequencies until a compaction
+    pass drops them; that pass runs on a background thread once
+    ``compact_threshold`` of the rows are dead.
+
+    Searches never take a lock: every write batch (and compaction) builds its
+    state off to the side and then publishes a new immutable IndexSnapshot
+    with a single reference assignment. A search reads that reference once and
+    scores against it, however many writes complete meanwhile.
+    """
+
+    def __init__(
+        self,
+        lazy: bool = False,
+        vocabulary: Optional[Vocabulary] = None,
+        token_cache_size: int = DEFAULT_TOKEN_CACHE_SIZE,
+        compact_threshold: float = DEFAULT_COMPACT_THRESHOLD,
+        compact_min_rows: int = DEFAULT_COMPACT_MIN_ROWS,
+        compress_text: bool = True,
+    ):
+        self.lazy = lazy
+        self.compress_text = compress_text
+        self.compact_threshold = compact_threshold
+        self.compact_min_rows = compact_min_rows
+        self.vocabulary = vocabulary or shared_vocabulary
+        self.docs: MutableMapping[str, DocumentChunk] = ChunkStore(compress=compress_text)
+        self.doc_ids: List[str] = []  # row -> doc id, including tombstoned rows
         self.stemmer = Stemmer.Stemmer("english")
+        # Bumped by every write batch that changes the index; published with the snapshot
+        self._generation = 0
+
+        self._rows: Dict[str, int] = {}  # live doc id -> row
+        self._doc_len = np.zeros(16, dtype=np.float32)
+        self._doc_hash = np.zeros((16, 16), dtype=np.uint8)  # row -> content hash
+        self._dead = np.zeros(16, dtype=bool)  # tombstone bitmap
+        self._num_dead = 0
+        self._total_len = 0
+
+        # Serializes writers and compaction. Searches never take it.
+        self._write_lock = RLock()
+        self._compacting = False
+        self.compactions = 0
+        self.last_compaction_seconds = 0.0
+
+        # term id -> (rows, tfs) buffers used by _score(); the first _posting_len[term] entries are
+        # postings, the rest is spare capacity with sentinel rows
+        self._postings: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._posting_len: Dict[int, int] = {}
+        # term id -> [(row, tf), ...] appended since the last refresh
+        self._pending: Dict[int, List[Tuple[int, int]]] = {}
+        # Rows whose postings have been folded into _postings
+        self._refreshed_rows = 0
+
+        # content hash -> token ids, most recently used last
+        self._token_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._token_cache_size = token_cache_size
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+
+        self._snapshot: IndexSnapshot
+        self._publish()
+
+    @classmethod
+    def from_arrays(
+        cls,
+        terms: List[str],
+        term_ptr: np.ndarray,
+        post_rows: np.ndarray,
+        post_tfs: np.ndarray,
+        doc_ids: List[str],
+        doc_len: np.ndarray,
+        doc_hash: np.ndarray,
+        docs: MutableMapping[str, DocumentChunk],
+        generation: int = 0,
+        **kwargs,
+    ) -> "BM25Index":
+        """
+        Build an index around existing CSR posting arrays without copying them,
+        e.g. arrays memory-mapped from a snapshot. They are treated as read-only;
+        the first write that needs more capacity copies the per-row arrays.
+        """
+        index = cls(**kwargs)
+        term_ids = index.vocabulary.add_many(terms).tolist()
+        bounds = term_ptr.tolist()
+        # Plain ndarray views slice much faster than np.memmap (no subclass hooks).
+        post_rows = post_rows.view(np.ndarray)
+        post_tfs = post_tfs.view(np.ndarray)
+        index._postings = {
+            term_id: (post_rows[bounds[i]:bounds[i + 1]], post_tfs[bounds[i]:bounds[i + 1]])
+            for i, term_id in enumerate(term_ids)
+        }
+        # No spare capacity: the first append to a term copies its postings into a buffer
+        index._posting_len = {term_id: bounds[i + 1] - bounds[i] for i, term_id in enumerate(term_ids)}
+        index.doc_ids = list(doc_ids)
+        index._rows = {doc_id: row for row, doc_id in enumerate(index.doc_ids)}
+        index._doc_len = doc_len
+        index._doc_hash = doc_hash
+        index._dead = np.zeros(len(index.doc_ids), dtype=bool)
+        index._total_len = int(doc_len.sum(dtype=np.float64))
+        index._refreshed_rows = len(index.doc_ids)
+        index.docs = ChunkStore(docs, compress=index.compress_text)
+        index.generation = generation
+        return index
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """
+        Compact, then return the index as CSR posting arrays plus per-row data
+        (the inverse of ``from_arrays``). Term ids are resolved to strings since
+        vocabulary ids are only meaningful inside this process.
+        """
+        with self._write_lock:
+            self._compact_locked()
+            terms: List[str] = []
+            lengths: List[int] = []
+            rows_parts: List[np.ndarray] = []
+            tfs_parts: List[np.ndarray] = []
+            for term_id, (rows, tfs) in self._postings.items():
+                n = self._posting_len[term_id]
+                terms.append(self.vocabulary.term(term_id))
+                lengths.append(n)
+                rows_parts.append(rows[:n])
+                tfs_parts.append(tfs[:n])
+
+            term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=term_ptr[1:])
+            num_rows = len(self.doc_ids)
+            return {
+                "terms": terms,
+                "term_ptr": term_ptr,
+                "post_rows": np.concatenate(rows_parts) if rows_parts else np.zeros(0, np.int32),
+                "post_tfs": np.concatenate(tfs_parts) if tfs_parts else np.zeros(0, np.float32),
+                "doc_ids": list(self.doc_ids),
+                "doc_len": np.array(self._doc_len[:num_rows]),
+                "doc_hash": np.array(self._doc_hash[:num_rows]),
+                "docs": [self.docs[doc_id] for doc_id in self.doc_ids],
+                "generation": self.generation,
+            }
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending)
+
+    @property
+    def generation(self) -> int:
+        """Generation of the published snapshot, i.e. of what searches see."""
+        return self._snapshot.generation
+
+    @generation.setter
+    def generation(self, value: int):
+        with self._write_lock:
+            self._generation = value
+            self._publish()
+
+    def snapshot(self) -> IndexSnapshot:
+        """The current immutable view; folds pending postings first when lazy."""
+        self._refresh_if_dirty()
+        return self._snapshot
+
+    def _publish(self):
+        """Atomically make the current (refreshed) state visible to searches. Needs the write lock."""
+        num_rows = self._refreshed_rows
+        dead = self._dead[:num_rows].copy() if self._num_dead else None
+        self._snapshot = IndexSnapshot(
+            generation=self._generation,
+            num_rows=num_rows,
+            num_dead=int(dead.sum()) if dead is not None else 0,
+            total_len=self._total_len if num_rows == len(self.doc_ids) else int(self._doc_len[:num_rows].sum(dtype=np.float64)),
+            doc_ids=self.doc_ids,
+            doc_len=self._doc_len,
+            dead=dead,
+            postings=self._postings,
+            docs=self.docs.freeze(),
+        )
+
+    @property
+    def dead_fraction(self) -> float:
+        return self._num_dead / len(self.doc_ids) if self.doc_ids else 0.0
+
+    def tokenize(self, text: str) -> List[str]:
+        return self.tokenize_many([text])[0]
+
+    def tokenize_many(self, texts: List[str]) -> List[List[str]]:
+        # Stem each distinct word once per batch, like bm25s.tokenize does.
+        split = [
+            [w for w in _TOKEN_PATTERN.findall(text.lower()) if w not in _STOPWORDS]
+            for text in texts
+        ]
+        unique = list({w for words in split for w in words})
+        stems = dict(zip(unique, self.stemmer.stemWords(unique)))
+        return [[stems[w] for w in words] for words in split]
 
     def upsert(self, doc: DocumentChunk):
-        if doc.id not in self.docs:
-            self.doc_ids.append(doc.id)
-        self.docs[doc.id] = doc
-        self._rebuild_index()
+        self.upsert_many([doc])
 
     def delete(self, doc_id: str):
-        if doc_id in self.docs:
-            del self.docs[doc_id]
-            self.doc_ids.remove(doc_id)
-            self._rebuild_index()
-
-    def _rebuild_index(self):
-        if not self.docs:
-            self.bm25 = None
+        self.delete_many([doc_id])
+
+    def token_cache_stats(self) -> Dict[str, Any]:
+        lookups = self.token_cache_hits + self.token_cache_misses
+        return {
+            "size": len(self._token_cache),
+            "hits": self.token_cache_hits,
+            "misses": self.token_cache_misses,
+            "hit_rate": round(self.token_cache_hits / lookups * 100, 2) if lookups else 0.0,
+        }
+
+    def _token_ids_many(self, texts: List[str], hashes: List[bytes]) -> List[np.ndarray]:
+        token_ids: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        misses: Dict[bytes, List[int]] = {}
+        for i, h in enumerate(hashes):
+            cached = self._token_cache.get(h)
+            if cached is not None:
+                self._token_cache.move_to_end(h)
+                token_ids[i] = cached
+                self.token_cache_hits += 1
+            elif h in misses:
+                # Same content twice in one batch: tokenized once below.
+                misses[h].append(i)
+                self.token_cache_hits += 1
+            else:
+                misses[h] = [i]
+                self.token_cache_misses += 1
+
+        if misses:
+            positions = list(misses.values())
+            tokenized = self.tokenize_many([texts[p[0]] for p in positions])
+            for h, pos, terms in zip(misses, positions, tokenized):
+                ids = self.vocabulary.add_many(terms)
+                self._token_cache[h] = ids
+                for i in pos:
+                    token_ids[i] = ids
+
+            while len(self._token_cache) > self._token_cache_size:
+                self._token_cache.popitem(last=False)
+
+        return token_ids
+
+    def upsert_many(self, docs: Iterable[DocumentChunk]):
+        with self._write_lock:
+            self._upsert_many(list(docs))
+            if not self.lazy:
+                self.refresh()
+        self._maybe_compact()
+
+    def delete_many(self, doc_ids: Iterable[str]):
+        with self._write_lock:
+            if self._delete_many(doc_ids):
+                self.refresh()
+        self._maybe_compact()
+
+    def write_batch(self, upserts: Iterable[DocumentChunk], deletes: Iterable[str]):
+        """Apply upserts and deletes (of other ids) together, as a single published change."""
+        with self._write_lock:
+            self._upsert_many(list(upserts))
+            deleted = self._delete_many(deletes)
+            if deleted or not self.lazy:
+                self.refresh()
+        self._maybe_compact()
+
+    def _delete_many(self, doc_ids: Iterable[str]) -> bool:
+        deleted = False
+        for doc_id in doc_ids:
+            row = self._rows.pop(doc_id, None)
+            if row is not None:
+                del self.docs[doc_id]
+                self._tombstone(row)
+                deleted = True
+        if deleted:
+            self._generation += 1
+        return deleted
+
+    def _upsert_many(self, docs: List[DocumentChunk]):
+        if not docs:
             return
 
-        corpus = [self.docs[doc_id].content for doc_id in self.doc_ids]
+        # Chunks whose content is unchanged only need their stored model
+        # swapped (e.g. a PATCH of title or metadata): no tokenization at all.
+        changed, hashes = [], []
+        for doc in docs:
+            h = content_hash(doc.content)
+            row = self._rows.get(doc.id)
+            if row is not None and self._doc_hash[row].tobytes() == h:
+                self.docs[doc.id] = doc
+                self.token_cache_hits += 1
+            else:
+                changed.append(doc)
+                hashes.append(h)
 
-        # Tokenize the corpus
-        tokenized_corpus = bm25s.tokenize(
-            corpus, stopwords="en", stemmer=self.stemmer
-        )
+        token_ids = self._token_ids_many([d.content for d in changed], hashes)
+        for doc, h, ids in zip(changed, hashes, token_ids):
+            self._append_row(doc, h, ids)
+        self._generation += 1
 
-        self.bm25 = bm25s.BM25()
-        self.bm25.index(tokenized_corpus)
+    def _append_row(self, doc: DocumentChunk, doc_hash: bytes, token_ids: np.ndarray):
+        old_row = self._rows.get(doc.id)
+        if old_row is not None:
+            self._tombstone(old_row)
 
-    def search(self, query: str, k: int = 10) -> List[Tuple[DocumentChunk, float]]:
-        if not self.bm25:
-            return []
+        row = len(self.doc_ids)
+        if row >= len(self._doc_len):
+            self._grow(max(16, 2 * row))
 
-        # Don't ask bm25s for more docs than we actually have
-        num_docs = len(self.doc_ids)
-        if num_docs == 0:
-            return []
+        self.doc_ids.append(doc.id)
+        self._rows[doc.id] = row
+        self.docs[doc.id] = doc
+        self._doc_hash[row] = np.frombuffer(doc_hash, dtype=np.uint8)
+        self._doc_len[row] = len(token_ids)
+        self._total_len += len(token_ids)
 
-        k = min(k, num_docs)
+        freqs: Dict[int, int] = {}
+        for term in token_ids.tolist():
+            freqs[term] = freqs.get(term, 0) + 1
+        for term, tf in freqs.items():
+            self._pending.setdefault(term, []).append((row, tf))
 
-        query_tokens = bm25s.tokenize(
-            query,
-            stopwords="en",
-            stemmer=self.stemmer,
-        )
+    def _tombstone(self, row: int):
+        self._dead[row] = True
+        self._num_dead += 1
+
+    def _grow(self, capacity: int):
+        num_rows = len(self.doc_ids)
+        doc_len = np.zeros(capacity, dtype=np.float32)
+        doc_len[:num_rows] = self._doc_len[:num_rows]
+        doc_hash = np.zeros((capacity, 16), dtype=np.uint8)
+        doc_hash[:num_rows] = self._doc_hash[:num_rows]
+        dead = np.zeros(capacity, dtype=bool)
+        dead[:num_rows] = self._dead[:num_rows]
+        self._doc_len, self._doc_hash, self._dead = doc_len, doc_hash, dead
+
+    def refresh(self):
+        """
+        Fold postings appended since the last refresh into the scoring arrays
+        and publish a new snapshot.
+        """
+        with self._write_lock:
+            # Published snapshots share these buffers and clip off the rows
+            # appended after them, so postings are appended in place. Only a
+            # full buffer is copied, into one of twice the capacity: each
+            # posting is copied O(1) times on average.
+            postings, lengths = self._postings, self._posting_len
+            for term, added in self._pending.items():
+                n, count = lengths.get(term, 0), len(added)
+                buffers = postings.get(term)
+                if buffers is None or n + count > len(buffers[0]):
+                    capacity = max(4, 2 * (n + count))
+                    rows = np.full(capacity, _ROW_SENTINEL, dtype=np.int32)
+                    tfs = np.zeros(capacity, dtype=np.float32)
+                    if n:
+                        rows[:n] = buffers[0][:n]
+                        tfs[:n] = buffers[1][:n]
+                    postings[term] = buffers = (rows, tfs)
+                rows, tfs = buffers
+                # tfs first: a search may read these buffers concurrently, and only
+                # ever uses entries whose row is below its snapshot's num_rows
+                tfs[n:n + count] = [tf for _, tf in added]
+                rows[n:n + count] = [r for r, _ in added]
+                lengths[term] = n + count
+            self._pending = {}
+            self._refreshed_rows = len(self.doc_ids)
+            self._publish()
 
-        indices, scores = self.bm25.retrieve(query_tokens, k=k)
+    def _maybe_compact(self):
+        if (
+            self._compacting
+            or len(self.doc_ids) < self.compact_min_rows
+            or self.dead_fraction < self.compact_threshold
+        ):
+            return
+        self._compacting = True
+        Thread(target=self.compact, name="bm25-compaction", daemon=True).start()
+
+    def compact(self):
+        """
+        Physically drop tombstoned rows and renumber the survivors.
+
+        Holds the write lock, so concurrent writers wait, but searches keep
+        scoring the previous snapshot until the compacted one is published.
+        """
+        try:
+            with self._write_lock:
+                self._compact_locked()
+        finally:
+            self._compacting = False
+
+    def _compact_locked(self):
+        self.refresh()
+        num_rows = len(self.doc_ids)
+        if self._num_dead == 0:
+            return
+        started = time.perf_counter()
+
+        live = np.flatnonzero(~self._dead[:num_rows])
+        remap = np.full(num_rows, -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
 
-        results: List[Tuple[DocumentChunk, float]] = []
-        for idx, score in zip(indices[0], scores[0]):
-            doc_id = self.doc_ids[int(idx)]
-            results.append((self.docs[doc_id], float(score)))
+        postings: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        lengths: Dict[int, int] = {}
+        for term, (rows, tfs) in self._postings.items():
+            n = self._posting_len[term]
+            new_rows = remap[rows[:n]]
+            keep = new_rows >= 0
+            if keep.all():
+                postings[term] = (new_rows, tfs[:n].copy())
+            elif keep.any():
+                postings[term] = (new_rows[keep], tfs[:n][keep])
+            else:
+                continue
+            lengths[term] = len(postings[term][0])
 
-        return results
+        doc_ids = [self.doc_ids[r] for r in live.tolist()]
+        capacity = max(16, len(live))
+        doc_len = np.zeros(capacity, dtype=np.float32)
+        doc_len[: len(live)] = self._doc_len[live]
+        doc_hash = np.zeros((capacity, 16), dtype=np.uint8)
+        doc_hash[: len(live)] = self._doc_hash[live]
+
+        self._postings = postings
+        self._posting_len = lengths
+        self._doc_len = doc_len
+        self._doc_hash = doc_hash
+        self._dead = np.zeros(capacity, dtype=bool)
+        self._num_dead = 0
+        self._total_len = int(doc_len.sum(dtype=np.float64))
+        self._rows = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+        self.doc_ids = doc_ids
+        self._refreshed_rows = len(doc_ids)
+        self.compactions += 1
+        self._publish()
+        self.last_compaction_seconds = time.perf_counter() - started
+
+    def query_terms(self, query: str) -> List[int]:
+        """Vocabulary ids of the query's terms; terms never indexed anywhere are dropped."""
+        term_ids = [self.vocabulary.get(t) for t in self.tokenize(query)]
+        return [t for t in term_ids if t is not None]
+
+    def collection_stats(self, query_terms: Iterable[int]) -> CollectionStats:
+        return self.snapshot().collection_stats(query_terms)
+
+    def _refresh_if_dirty(self):
+        # Lazy refresh, unless a writer or compaction currently holds the lock:
+        # whatever it is doing will leave the arrays fresh when it finishes.
+        if self.dirty and self._write_lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._write_lock.release()
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[DocumentChunk, float]]:
+        return self.search_terms(self.query_terms(query), k)
 
+    def search_terms(
+        self,
+        query_terms: List[int],
+        k: int = 10,
+        stats: Optional[CollectionStats] = None,
+    ) -> List[Tuple[DocumentChunk, float]]:
+        """
+        Top-k for already tokenized query terms. `stats` overrides this index's
+        own corpus statistics, e.g. with ones aggregated across several indices.
+        """
+        return self.snapshot().search_terms(query_terms, k, stats)
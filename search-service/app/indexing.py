@@ -0,0 +1,282 @@
+"""
+Asynchronous indexing: writes are acknowledged once durable, and applied to
+the indices by a background worker.
+
+Each submitted write becomes an Operation with an id and a *target
+generation*: the course index generation from which the write is guaranteed
+to be visible to searches. Targets are reserved per course in submission
+order (one above the previous target, or the current generation).
+
+The worker waits ``coalesce_seconds`` after a write arrives so that a burst
+piles up. It then folds everything pending for a course into one set of
+upserts and deletes (last write per document id wins), applies them as a
+single published index change, and moves the index generation up to the
+highest target it covered. That change bumps the generation at most twice but
+covers at least as many targets (a single write bumps it once), so the
+generation never reaches a target whose write is not visible yet.
+
+Callers wait for their writes with ``wait_for_generation``; operations can be
+polled with ``get``.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COALESCE_SECONDS = 0.05
+DEFAULT_MAX_PENDING_DOCS = 100_000
+# Finished operations kept for polling
+DEFAULT_MAX_FINISHED = 10_000
+_RECHECK_SECONDS = 0.1
+
+
+class QueueFull(Exception):
+    """Too many documents are waiting to be indexed."""
+
+
+@dataclass
+class Operation:
+    id: str
+    course_id: str
+    kind: str  # "upsert" or "delete"
+    target_generation: int
+    document_count: int
+    status: str = "pending"  # "pending", "succeeded" or "failed"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    # Not reported: the payload and the WAL record it came from
+    payload: Any = field(default=None, repr=False)
+    lsn: Optional[int] = field(default=None, repr=False)
+
+
+class IndexingQueue:
+    def __init__(
+        self,
+        apply: Callable[[str, List[DocumentChunk], List[str], int], None],
+        get_generation: Callable[[str], int],
+        release_lsn: Optional[Callable[[int], None]] = None,
+        pin_lsn: Optional[Callable[[int], None]] = None,
+        coalesce_seconds: float = DEFAULT_COALESCE_SECONDS,
+        max_pending_docs: int = DEFAULT_MAX_PENDING_DOCS,
+        max_finished: int = DEFAULT_MAX_FINISHED,
+    ):
+        """
+        `apply(course_id, upserts, deletes, target_generation)` applies one
+        coalesced batch and must leave the course generation at no less than
+        `target_generation`. `release_lsn` is called for the WAL record of
+        every operation that succeeded, `pin_lsn` for those of failed ones, which
+        must stay in the log to be replayed.
+        """
+        self._apply = apply
+        self._get_generation = get_generation
+        self._release_lsn = release_lsn
+        self._pin_lsn = pin_lsn
+        self.coalesce_seconds = coalesce_seconds
+        self.max_pending_docs = max_pending_docs
+        self.max_finished = max_finished
+
+        self._cond = threading.Condition()
+        self._pending: Dict[str, List[Operation]] = defaultdict(list)
+        self._pending_docs = 0
+        self._reserved: Dict[str, int] = {}
+        self._operations: "OrderedDict[str, Operation]" = OrderedDict()
+        # course id -> operations taken out of _pending but not applied yet
+        self._taken: Dict[str, int] = {}
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.batches = 0
+        self.coalesced_operations = 0
+
+    # ------------------------------------------------------------------
+    # Submitting
+    # ------------------------------------------------------------------
+
+    def reserve(self, course_id: str) -> int:
+        """Next target generation of `course_id`. Needs the caller to hold the course's write lock."""
+        with self._cond:
+            target = max(self._reserved.get(course_id, 0), self._get_generation(course_id)) + 1
+            self._reserved[course_id] = target
+            return target
+
+    def ensure_room(self, num_docs: int):
+        """Raise QueueFull if `num_docs` more documents would exceed the backlog limit."""
+        with self._cond:
+            if self._pending_docs + num_docs > self.max_pending_docs:
+                raise QueueFull(f"More than {self.max_pending_docs} documents are waiting to be indexed")
+
+    def submit(self, course_id: str, kind: str, payload: list, lsn: Optional[int] = None) -> Operation:
+        """
+        Queue an upsert (payload: DocumentChunks) or delete (payload: ids).
+        Calls for one course must be serialized by the caller, in WAL order.
+        """
+        with self._cond:
+            op = Operation(
+                id=uuid.uuid4().hex,
+                course_id=course_id,
+                kind=kind,
+                target_generation=self.reserve(course_id),
+                document_count=len(payload),
+                payload=payload,
+                lsn=lsn,
+            )
+            self._pending[course_id].append(op)
+            self._pending_docs += len(payload)
+            self._remember(op)
+            self._ensure_worker()
+            self._cond.notify_all()
+            return op
+
+    def record_applied(self, course_id: str, kind: str, document_count: int) -> Operation:
+        """Record a write that was applied synchronously, so it can be polled like the rest."""
+        with self._cond:
+            generation = self._get_generation(course_id)
+            self._reserved[course_id] = max(self._reserved.get(course_id, 0), generation)
+            op = Operation(
+                id=uuid.uuid4().hex,
+                course_id=course_id,
+                kind=kind,
+                target_generation=generation,
+                document_count=document_count,
+                status="succeeded",
+                finished_at=time.time(),
+            )
+            self._remember(op)
+            self._cond.notify_all()
+            return op
+
+    def _remember(self, op: Operation):
+        self._operations[op.id] = op
+        while len(self._operations) > self.max_finished:
+            oldest = next(iter(self._operations.values()))
+            if oldest.status == "pending":
+                break
+            self._operations.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Waiting and polling
+    # ------------------------------------------------------------------
+
+    def get(self, operation_id: str) -> Optional[Operation]:
+        with self._cond:
+            return self._operations.get(operation_id)
+
+    def wait_for_generation(self, course_id: str, generation: int, timeout: float) -> bool:
+        """Block until the course index reaches `generation` (True) or `timeout` passes (False)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._get_generation(course_id) < generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                # Generations also move without a notify (e.g. compaction), so re-check now and then.
+                self._cond.wait(min(remaining, _RECHECK_SECONDS))
+            return True
+
+    def drain(self, course_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is pending or being applied for `course_id`."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending.get(course_id) and not self._taken.get(course_id), timeout
+            )
+
+    def notify(self):
+        """Wake waiters after a generation changed outside the queue."""
+        with self._cond:
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="indexing-worker", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Apply everything still pending, then stop the worker."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    return
+            # Let a burst of writes accumulate, then take everything.
+            if not self._stopping:
+                time.sleep(self.coalesce_seconds)
+            with self._cond:
+                pending, self._pending = self._pending, defaultdict(list)
+                # Courses wait their turn after leaving _pending; drain() must still see them.
+                for course_id, ops in pending.items():
+                    self._taken[course_id] = self._taken.get(course_id, 0) + len(ops)
+            for course_id, ops in pending.items():
+                self._apply_course(course_id, ops)
+
+    def _apply_course(self, course_id: str, ops: List[Operation]):
+        latest: Dict[str, Optional[DocumentChunk]] = {}  # doc id -> final version, None = deleted
+        for op in ops:
+            if op.kind == "upsert":
+                for doc in op.payload:
+                    latest[doc.id] = doc
+            else:
+                for doc_id in op.payload:
+                    latest[doc_id] = None
+        upserts = [doc for doc in latest.values() if doc is not None]
+        deletes = [doc_id for doc_id, doc in latest.items() if doc is None]
+        target = max(op.target_generation for op in ops)
+
+        error = None
+        try:
+            self._apply(course_id, upserts, deletes, target)
+        except Exception as e:
+            logger.exception("Indexing batch for course %s failed", course_id)
+            error = str(e) or type(e).__name__
+
+        with self._cond:
+            now = time.time()
+            for op in ops:
+                op.status = "failed" if error else "succeeded"
+                op.error = error
+                op.finished_at = now
+                op.payload = None
+                self._pending_docs -= op.document_count
+                if op.lsn is None:
+                    continue
+                if error is None and self._release_lsn:
+                    self._release_lsn(op.lsn)
+                elif error is not None and self._pin_lsn:
+                    self._pin_lsn(op.lsn)
+            self._taken[course_id] -= len(ops)
+            if not self._taken[course_id]:
+                del self._taken[course_id]
+            self.batches += 1
+            self.coalesced_operations += len(ops)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending_operations": sum(len(ops) for ops in self._pending.values()),
+                "pending_documents": self._pending_docs,
+                "batches": self.batches,
+                "operations_applied": self.coalesced_operations,
+                "operations_per_batch": round(self.coalesced_operations / self.batches, 2) if self.batches else 0.0,
+            }
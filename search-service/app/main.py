@@ -5,11 +5,20 @@
 #    - Input: BatchCreateRequest
 #    - Output: BatchCreateResponse
 #    - Description: Creates or updates a batch of document chunks for a specific course.
+#      With INDEXING_ASYNC the write is logged and indexed in the background: the response is
+#      202 with an operation id and the target generation at which the chunks become searchable.
+#
+#  - GET /v1/operations/{operation_id}
+#    - Output: OperationResponse
+#    - Description: Status of a batch write (see indexing.py).
 #
 #  - POST /v1/courses/{course_id}/documents:search
 #    - Input: SearchRequest
 #    - Output: SearchResponse
 #    - Description: Performs a full-text search on the documents of a specific course.
+#      Responses carry a signed `next_page_token`; passing it back as `page_token`
+#      returns the next page of the same ranking (see pagination.py). `min_generation`
+#      waits (bounded) until the course index has caught up with a write.
 #
 #  - PATCH /v1/courses/{course_id}/documents/{document_id}
 #    - Input: UpdateDocumentChunk
@@ -27,10 +36,24 @@
 #
 # Storage:
 #  - The service uses an in-memory dictionary (`course_indices`) to store a BM25Index object for each course.
-#    This is not suitable for production but is acceptable for the current development phase.
-
-from fastapi import FastAPI, HTTPException, Path, Depends
-from typing import Dict, List, Optional
+#  - When VECTOR_SEARCH_ENABLED is on, chunks are also embedded into a per-course VectorIndex
+#    (`course_vectors`, see vector_index.py), which serves mode="vector". mode="hybrid" runs both
+#    and fuses the rankings (see hybrid.py); search responses carry per-stage Server-Timing.
+#  - Cross-course searches are federated over the course indices (see federated.py); chunks are
+#    indexed only once.
+#  - When INDEX_SNAPSHOT_DIR is set, indices are snapshotted to disk periodically and on shutdown,
+#    and restored memory-mapped on startup (see snapshot.py). Every mutation is also appended to a
+#    write-ahead log before it is applied (see wal.py), and the log tail is replayed on startup.
+#  - With SERVICE_ROLE=reader the process owns no state: it serves searches from the snapshots an
+#    indexer process publishes to the same INDEX_SNAPSHOT_DIR, swapping in new generations as they
+#    appear (see replica.py), and rejects writes. Readers can run as `uvicorn --workers N`.
+
+import logging
+import os
+from contextlib import asynccontextmanager, nullcontext
+from threading import Lock
+from fastapi import FastAPI, HTTPException, Path, Depends, Response
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 from pydantic import BaseModel  # <-- NEW: for RAG-specific response models
 
@@ -38,6 +61,7 @@ from .models import (
     BatchCreateRequest,
     BatchCreateResponse,
     DocumentChunk,
+    OperationResponse,
     SearchRequest,
     SearchResponse,
     SearchResult,
@@ -45,17 +69,118 @@ from .models import (
     UserProfile,
     UpsertMeRequest,
 )
-from .index import BM25Index
-from .auth import get_current_user
+from .index import BM25Index, shared_vocabulary
+from .chunks import text_cache
+from .federated import federated_rank, federated_vector_search
+from .embeddings import create_embedder
+from .embedding_pipeline import EmbeddingCache, EmbeddingPipeline
+from .vector_index import VectorIndex
+from .indexing import IndexingQueue, Operation, QueueFull
+from .hybrid import HybridSearchError, hybrid_search
+from .pagination import InvalidPageToken, PartialRanking, Paginator, StalePageToken
+from .query_cache import QueryCache
+from .auth import auth_stats, get_current_user, token_verifier
 from .roles import is_teacher
-from .monitoring import MonitoringMiddleware, monitoring_service
+from .monitoring import MonitoringMiddleware, ProcessSampler, monitoring_service
 from .health import router as health_router
+from .config import get_settings
+from .replica import ReplicaSync
+from .snapshot import SnapshotManager, load_generation, load_vectors
+from .timing import record_stage, stage
+from .wal import WriteAheadLog
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+is_reader = settings.SERVICE_ROLE == "reader"
+if is_reader and not settings.INDEX_SNAPSHOT_DIR:
+    raise RuntimeError("SERVICE_ROLE=reader needs INDEX_SNAPSHOT_DIR, where the indexer publishes its snapshots")
+if is_reader and not settings.PAGE_TOKEN_SECRET:
+    logger.warning("PAGE_TOKEN_SECRET is unset: page tokens only work on the reader process that issued them")
+
+snapshots = (
+    SnapshotManager(settings.INDEX_SNAPSHOT_DIR, settings.INDEX_SNAPSHOT_INTERVAL_SECONDS)
+    if settings.INDEX_SNAPSHOT_DIR
+    else None
+)
+
+
+wal = (
+    WriteAheadLog(
+        os.path.join(settings.INDEX_SNAPSHOT_DIR, "wal"),
+        group_commit_ms=settings.WAL_GROUP_COMMIT_MS,
+        fsync=settings.WAL_FSYNC,
+    )
+    if settings.INDEX_SNAPSHOT_DIR and not is_reader
+    else None
+)
+
+
+def save_snapshots() -> int:
+    """
+    Snapshot changed indices, then checkpoint the WAL up to what they cover.
+
+    Every record <= `lsn` was applied before any index is copied, so every
+    snapshot on disk contains it. A record applied while the snapshots are
+    written may be missing from them; it stays in the WAL, and its course is
+    saved again next cycle because the manager records the generation each
+    snapshot actually holds, not the live one.
+    """
+    lsn = wal.applied_lsn() if wal else 0
+    profiles = [p.model_dump() for p in list(user_profiles.values())]
+    written = snapshots.save_all(course_indices, dict(course_vectors))
+    if not snapshots.last_failed:
+        snapshots.write_checkpoint(lsn, profiles)
+        if wal:
+            wal.checkpoint(lsn)
+    return written
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    monitoring_service.sampler.start()
+    if token_verifier:
+        token_verifier.certificates.start()
+    if replica:
+        replica.poll()
+        replica.start()
+    elif snapshots:
+        course_indices.update(snapshots.load_courses(**index_kwargs()))
+        if embedder:
+            course_vectors.update(snapshots.load_vectors(embedder, **vector_index_kwargs()))
+        # Courses snapshotted without (usable) embeddings are re-embedded, mostly from the
+        # embedding cache, before replaying the WAL on top.
+        for course_id, index in course_indices.items():
+            if course_id not in course_vectors:
+                apply_vector_upserts(course_id, index.docs.values())
+        for profile in snapshots.load_profiles():
+            apply_profile(UserProfile.model_validate(profile))
+        wal.replay(snapshots.load_checkpoint(), apply_record)
+        snapshots.start(save_snapshots)
+
+    yield
+
+    if replica:
+        replica.stop()
+    # Index what is still queued, so the final snapshot covers every acknowledged write.
+    indexing_queue.stop()
+    if snapshots and not is_reader:
+        snapshots.stop()
+        save_snapshots()
+        wal.close()
+    if embedding_pipeline:
+        embedding_pipeline.close()
+    if token_verifier:
+        token_verifier.certificates.stop()
+    monitoring_service.sampler.stop()
 
 
 app = FastAPI(
     title="Search Service",
     description="Document search service with BM25 indexing",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 @app.get("/")
@@ -71,8 +196,98 @@ app.include_router(health_router)
 # In-memory storage for course indices
 # In a production environment, you'd use a persistent database.
 course_indices: Dict[str, BM25Index] = {}
-global_index = BM25Index()
 user_profiles: Dict[str, UserProfile] = {}
+course_vectors: Dict[str, VectorIndex] = {}
+embedder = (
+    create_embedder(settings.EMBEDDER, dim=settings.EMBEDDING_DIM)
+    if settings.VECTOR_SEARCH_ENABLED
+    else None
+)
+embedding_cache_path = settings.EMBEDDING_CACHE_PATH or (
+    os.path.join(settings.INDEX_SNAPSHOT_DIR, "embeddings.sqlite") if settings.INDEX_SNAPSHOT_DIR else None
+)
+embedding_pipeline = (
+    EmbeddingPipeline(
+        embedder,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        workers=settings.EMBEDDING_WORKERS,
+        cache=EmbeddingCache(embedding_cache_path) if embedding_cache_path else None,
+    )
+    if embedder
+    else None
+)
+
+# Writers to the same course (or profile) are serialized so that WAL order
+# matches the order mutations are applied in; different keys commit in parallel.
+_write_locks: Dict[str, Lock] = {}
+_write_locks_guard = Lock()
+
+
+def write_lock(key: str) -> Lock:
+    with _write_locks_guard:
+        return _write_locks.setdefault(key, Lock())
+
+
+def log_mutation(record: dict):
+    """Context manager that makes `record` durable in the WAL before the body applies it."""
+    return wal.record(record) if wal else nullcontext()
+
+
+def apply_upserts(course_id: str, docs: List[DocumentChunk]) -> None:
+    # One tokenize pass and one refresh per index for the whole batch.
+    get_course_index(course_id).upsert_many(docs)
+    apply_vector_upserts(course_id, docs)
+
+
+def apply_vector_upserts(course_id: str, docs: Iterable[DocumentChunk]) -> None:
+    # Only chunks whose content changed are embedded, through the cache and in fixed-size batches.
+    if embedder:
+        get_vector_index(course_id).upsert_many(docs)
+
+
+def apply_deletes(course_id: str, document_ids: List[str]) -> None:
+    get_course_index(course_id).delete_many(document_ids)
+    if embedder:
+        get_vector_index(course_id).delete_many(document_ids)
+
+
+def apply_indexing_batch(course_id: str, upserts: List[DocumentChunk], deletes: List[str], target: int) -> None:
+    """Apply one coalesced batch from the indexing queue and publish it at `target` or later."""
+    # Vectors first: vector hits are resolved through the BM25 snapshot, so chunks
+    # only become visible once the BM25 batch below is published.
+    if embedder:
+        vectors = get_vector_index(course_id)
+        vectors.upsert_many(upserts)
+        vectors.delete_many(deletes)
+    index = get_course_index(course_id)
+    index.write_batch(upserts, deletes)
+    if index.generation < target:
+        index.generation = target
+
+
+def apply_profile(profile: UserProfile) -> None:
+    user_profiles[profile.uid] = profile
+
+
+def require_writer():
+    """Dependency of the write endpoints: readers only serve searches."""
+    if is_reader:
+        raise HTTPException(
+            status_code=503,
+            detail="This is a read-only replica; send writes to the indexer",
+        )
+
+
+def apply_record(record: dict) -> None:
+    """Re-apply a WAL record during startup replay."""
+    op = record["op"]
+    if op == "upsert":
+        docs = [DocumentChunk.model_validate(d) for d in record["documents"]]
+        apply_upserts(record["course_id"], docs)
+    elif op == "delete":
+        apply_deletes(record["course_id"], record["document_ids"])
+    elif op == "profile":
+        apply_profile(UserProfile.model_validate(record["profile"]))
 
 @app.get("/v1/users/me", response_model=UserProfile)
 def get_me(current_user: dict = Depends(get_current_user)):
@@ -80,30 +295,377 @@ def get_me(current_user: dict = Depends(get_current_user)):
     return user_profiles.get(uid) or UserProfile(uid=uid, role=current_user.get("role", "student"))
 
 
-@app.post("/v1/users/me", response_model=UserProfile)
+@app.post("/v1/users/me", response_model=UserProfile, dependencies=[Depends(require_writer)])
 def upsert_me(payload: UpsertMeRequest, current_user: dict = Depends(get_current_user)):
     uid = current_user["uid"]
-    existing = user_profiles.get(uid) or UserProfile(uid=uid, role=current_user.get("role", "student"))
-
-    data = payload.model_dump(exclude_unset=True)
-    updated = existing.model_copy(update={
-        **data,
-        "uid": uid,
-        # keep token role as fallback if role not sent
-        "role": data.get("role", existing.role),
-        "updated_at": datetime.utcnow().isoformat()
-    })
-
-    user_profiles[uid] = updated
+    with write_lock(f"user:{uid}"):
+        existing = user_profiles.get(uid) or UserProfile(uid=uid, role=current_user.get("role", "student"))
+
+        data = payload.model_dump(exclude_unset=True)
+        updated = existing.model_copy(update={
+            **data,
+            "uid": uid,
+            # keep token role as fallback if role not sent
+            "role": data.get("role", existing.role),
+            "updated_at": datetime.utcnow().isoformat()
+        })
+
+        with log_mutation({"op": "profile", "profile": updated.model_dump()}):
+            apply_profile(updated)
     return updated
 
 
 
+def index_kwargs() -> dict:
+    return dict(
+        compact_threshold=settings.INDEX_COMPACT_THRESHOLD,
+        compress_text=settings.CHUNK_COMPRESSION,
+    )
+
+
 def get_course_index(course_id: str) -> BM25Index:
     if course_id not in course_indices:
-        course_indices[course_id] = BM25Index()
+        course_indices[course_id] = BM25Index(**index_kwargs())
     return course_indices[course_id]
 
+
+# Background indexing of batch writes (INDEXING_ASYNC). The worker applies
+# batches without taking the course write locks; writers that must see the
+# current index (PATCH, DELETE) drain the course's queue first instead.
+indexing_queue = IndexingQueue(
+    apply_indexing_batch,
+    lambda course_id: get_course_index(course_id).generation,
+    release_lsn=wal.mark_applied if wal else None,
+    pin_lsn=wal.mark_failed if wal else None,
+    coalesce_seconds=settings.INDEXING_COALESCE_MS / 1000,
+    max_pending_docs=settings.INDEXING_MAX_PENDING_DOCS,
+)
+
+
+def drain_indexing(course_id: str) -> None:
+    """Wait until queued writes of `course_id` are applied. Needs the course write lock."""
+    if settings.INDEXING_ASYNC:
+        indexing_queue.drain(course_id)
+
+
+def wait_for_generation(course_id: str, request: SearchRequest) -> None:
+    if request.min_generation is None:
+        return
+    timeout = settings.MIN_GENERATION_TIMEOUT_MS / 1000
+    if not indexing_queue.wait_for_generation(course_id, request.min_generation, timeout):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Index of course {course_id} has not reached generation {request.min_generation} yet",
+            headers={"Retry-After": "1"},
+        )
+
+
+def reject_min_generation(request: SearchRequest) -> None:
+    # Generations are per course; there is no cross-course generation to wait for.
+    if request.min_generation is not None:
+        raise HTTPException(status_code=400, detail="min_generation is only supported for course searches")
+
+
+monitoring_service.sampler = ProcessSampler(
+    interval_seconds=settings.PROCESS_SAMPLE_INTERVAL_MS / 1000,
+    capacity=settings.PROCESS_SAMPLE_HISTORY,
+)
+
+# Decompressed text of the chunks searches return most often
+text_cache.max_bytes = int(settings.CHUNK_TEXT_CACHE_MB * 1024 * 1024)
+
+# Rankings are cached per (scope, normalized query, mode, allowed courses) and
+# tagged with the index generation, so a write only invalidates its own course.
+query_cache = QueryCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+)
+def vector_index_kwargs() -> dict:
+    return dict(
+        dtype=settings.VECTOR_DTYPE,
+        compact_threshold=settings.INDEX_COMPACT_THRESHOLD,
+        ann_min_rows=settings.VECTOR_ANN_MIN_ROWS or None,
+        nprobe=settings.VECTOR_ANN_NPROBE,
+        pipeline=embedding_pipeline,
+    )
+
+
+def get_vector_index(course_id: str) -> VectorIndex:
+    if course_id not in course_vectors:
+        course_vectors[course_id] = VectorIndex(embedder, **vector_index_kwargs())
+    return course_vectors[course_id]
+
+
+def swap_in_course(course_id: str, path: str) -> None:
+    """Reader: load a course generation published by the indexer and replace the one in use."""
+    index = load_generation(path, verify=False, **index_kwargs())
+    if embedder:
+        vectors = load_vectors(path, embedder, verify=False, **vector_index_kwargs())
+        if vectors is None:
+            logger.warning("No usable embeddings in %s; re-embedding course %s", path, course_id)
+            vectors = VectorIndex(embedder, **vector_index_kwargs())
+            vectors.upsert_many(index.docs.values())
+        course_vectors[course_id] = vectors
+    # Searches already running keep the objects they looked up. Vectors go first, as in
+    # apply_indexing_batch: vector hits only count once the BM25 index has their chunks.
+    course_indices[course_id] = index
+
+
+def replace_profiles(profiles: List[dict]) -> None:
+    loaded = {p.uid: p for p in (UserProfile.model_validate(d) for d in profiles)}
+    user_profiles.update(loaded)
+    for uid in set(user_profiles) - set(loaded):
+        user_profiles.pop(uid, None)
+
+
+replica = (
+    ReplicaSync(
+        snapshots,
+        swap_in_course,
+        replace_profiles,
+        interval_seconds=settings.REPLICA_POLL_INTERVAL_MS / 1000,
+    )
+    if is_reader
+    else None
+)
+
+
+def _require_vectors():
+    if embedder is None:
+        raise HTTPException(status_code=400, detail="Vector search is disabled")
+
+
+Hits = List[Tuple[DocumentChunk, float]]
+# (course id, doc id) refs with their scores: what rankings and the query cache hold
+Ranking = List[Tuple[Tuple[str, str], float]]
+
+
+def rank_mode(mode: str, legs: Dict[str, Callable[[int], Ranking]], k: int) -> Ranking:
+    """
+    Top-k refs from the leg named by `mode`, or from fusing all of them for
+    mode="hybrid". Each leg's wall time is recorded as a stage.
+    """
+    if mode != "lexical":
+        _require_vectors()
+    if mode != "hybrid":
+        with stage(mode):
+            return legs[mode](k)
+
+    try:
+        ranked, leg_timings, partial = hybrid_search(
+            legs,
+            k,
+            deadlines={
+                "lexical": settings.HYBRID_LEXICAL_DEADLINE_MS / 1000,
+                "vector": settings.HYBRID_VECTOR_DEADLINE_MS / 1000,
+            },
+            rrf_k=settings.HYBRID_RRF_K,
+        )
+    except HybridSearchError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    for timing in leg_timings:
+        record_stage(timing.name, timing.seconds, None if timing.status == "ok" else timing.status)
+    # Rankings missing a leg are served, but not cached for the following pages.
+    return PartialRanking(ranked) if partial else ranked
+
+
+def _matching(ranked: Ranking) -> Ranking:
+    # BM25 pads short result lists with zero-score documents; they must not earn fusion credit.
+    return [hit for hit in ranked if hit[1] > 0]
+
+
+def rank_course(course_id: str, request: SearchRequest, k: int) -> Ranking:
+    """Top-k refs in one course for the request's mode."""
+    index = get_course_index(course_id)
+
+    def lexical(n: int) -> Ranking:
+        snapshot = index.snapshot()
+        with stage("tokenize"):
+            query_terms = index.query_terms(request.query)
+        with stage("retrieve"):
+            ranked = [((course_id, doc_id), score) for doc_id, score in snapshot.rank_terms(query_terms, n)]
+        return _matching(ranked) if request.mode == "hybrid" else ranked
+
+    def vector(n: int) -> Ranking:
+        with stage("retrieve"):
+            hits = get_vector_index(course_id).search(request.query, n)
+        docs = index.snapshot().docs
+        return [((course_id, doc_id), score) for doc_id, score in hits if doc_id in docs]
+
+    return rank_mode(request.mode, {"lexical": lexical, "vector": vector}, k)
+
+
+def rank_all_courses(request: SearchRequest, allowed: Optional[set[str]], k: int) -> Ranking:
+    """Top-k refs across the allowed courses (all of them when `allowed` is None)."""
+
+    def lexical(n: int) -> Ranking:
+        hits = federated_rank(
+            dict(course_indices),
+            query=request.query,
+            k=n,
+            course_ids=allowed,
+            max_workers=settings.FEDERATED_SEARCH_WORKERS,
+        )
+        ranked = [((course_id, doc_id), score) for course_id, doc_id, score in hits]
+        return _matching(ranked) if request.mode == "hybrid" else ranked
+
+    def vector(n: int) -> Ranking:
+        with stage("retrieve"):
+            hits = federated_vector_search(
+                dict(course_vectors),
+                request.query,
+                k=n,
+                course_ids=allowed,
+                max_workers=settings.FEDERATED_SEARCH_WORKERS,
+            )
+        ranked = []
+        for course_id, doc_id, score in hits:
+            # A reader installs a course's vectors before its BM25 index (see swap_in_course)
+            index = course_indices.get(course_id)
+            if index is not None and doc_id in index.snapshot().docs:
+                ranked.append(((course_id, doc_id), score))
+        return ranked
+
+    return rank_mode(request.mode, {"lexical": lexical, "vector": vector}, k)
+
+
+def hydrate(ranked: Ranking) -> Hits:
+    """The chunks of ranked refs; chunks deleted since the ranking are skipped."""
+    with stage("hydrate"):
+        docs_by_course = {}
+        hits = []
+        for (course_id, doc_id), score in ranked:
+            if course_id not in docs_by_course:
+                index = course_indices.get(course_id)
+                docs_by_course[course_id] = index.snapshot().docs if index is not None else {}
+            doc = docs_by_course[course_id].get(doc_id)
+            if doc is not None:
+                hits.append((doc, score))
+        return hits
+
+
+paginator = Paginator(
+    secret=settings.PAGE_TOKEN_SECRET.encode("utf-8") if settings.PAGE_TOKEN_SECRET else None,
+    ttl_seconds=settings.PAGE_TOKEN_TTL_SECONDS,
+    cache=query_cache,
+)
+
+
+def corpus_generation() -> int:
+    """Changes whenever any course index changes (generations only ever grow)."""
+    return sum(index.generation for index in list(course_indices.values()))
+
+
+def search_page(
+    scope: str,
+    generation: int,
+    request: SearchRequest,
+    allowed: Optional[set[str]],
+    rank: Callable[[int], Ranking],
+) -> Tuple[Hits, Optional[str]]:
+    """
+    One page of results for `request`, plus the token for the next page.
+    A page served from the query cache is reported as a "cache" stage.
+    """
+    digest = Paginator.search_digest(request.query, request.mode, allowed)
+    ranked = []
+
+    def rank_once(k: int) -> Ranking:
+        ranked.append(k)
+        return rank(k)
+
+    try:
+        page = paginator.page(scope, digest, generation, request.page_size, request.page_token, rank_once, hydrate)
+    except StalePageToken as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except InvalidPageToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not ranked:
+        record_stage("cache", 0.0, "hit")
+    return page
+
+
+def json_response(model: BaseModel) -> Response:
+    """
+    `model` encoded by pydantic-core in one pass. Returning the model instead
+    would make FastAPI validate it against response_model again, then build a
+    dict copy of it and json.dumps that.
+    """
+    return Response(model.model_dump_json(), media_type="application/json")
+
+
+def get_index_stats() -> dict:
+    """Index sizes and token-cache counters, reported by /health/json."""
+    indices = list(course_indices.values())
+    hits = sum(i.token_cache_hits for i in indices)
+    misses = sum(i.token_cache_misses for i in indices)
+    return {
+        "courses": len(course_indices),
+        "documents": sum(len(i.docs) for i in course_indices.values()),
+        "vocabulary_size": len(shared_vocabulary),
+        "token_cache": {
+            "size": sum(i.token_cache_stats()["size"] for i in indices),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses) * 100, 2) if hits + misses else 0.0,
+        },
+    }
+
+
+def get_vector_stats() -> dict:
+    vectors = list(course_vectors.values())
+    return {
+        "embedder": embedder.id,
+        "dtype": settings.VECTOR_DTYPE,
+        "rows": sum(len(v) for v in vectors),
+        "memory_bytes": sum(v.memory_bytes() for v in vectors),
+        "embedded_chunks": sum(v.embedded for v in vectors),
+        "ann_courses": sum(1 for v in vectors if v.ann is not None),
+        "pipeline": embedding_pipeline.stats(),
+    }
+
+
+# Prometheus gauges (/metrics), one sample per course
+monitoring_service.register_gauge(
+    "search_index_documents", "Chunks in each course's BM25 index.",
+    lambda: {course_id: len(index.docs) for course_id, index in list(course_indices.items())},
+    label="course_id",
+)
+monitoring_service.register_gauge(
+    "search_index_dead_fraction", "Fraction of tombstoned rows awaiting compaction.",
+    lambda: {course_id: index.dead_fraction for course_id, index in list(course_indices.items())},
+    label="course_id",
+)
+monitoring_service.register_gauge(
+    "search_index_compaction_seconds", "Duration of each course's last BM25 index compaction.",
+    lambda: {course_id: index.last_compaction_seconds for course_id, index in list(course_indices.items())},
+    label="course_id",
+)
+monitoring_service.register_gauge("search_vocabulary_terms", "Distinct terms across all indices.",
+                                  lambda: len(shared_vocabulary))
+if embedder:
+    monitoring_service.register_gauge(
+        "search_vector_rows", "Embedded chunks in each course's vector index.",
+        lambda: {course_id: len(vectors) for course_id, vectors in list(course_vectors.items())},
+        label="course_id",
+    )
+    monitoring_service.register_gauge(
+        "search_vector_ann_training_seconds", "Duration of each course's last IVF (re)build.",
+        lambda: {course_id: v.last_ann_training_seconds for course_id, v in list(course_vectors.items())},
+        label="course_id",
+    )
+monitoring_service.register_collector("indices", get_index_stats)
+monitoring_service.register_collector("query_cache", query_cache.stats)
+monitoring_service.register_collector("chunk_text_cache", text_cache.stats)
+monitoring_service.register_collector("auth", auth_stats)
+if embedder:
+    monitoring_service.register_collector("vectors", get_vector_stats)
+if wal:
+    monitoring_service.register_collector("wal", wal.stats)
+monitoring_service.register_collector("indexing", indexing_queue.stats)
+if replica:
+    monitoring_service.register_collector("replica", replica.stats)
+
 def get_allowed_course_ids(current_user: dict) -> Optional[set[str]]:
     """
     Returns:
@@ -128,20 +690,70 @@ def get_allowed_course_ids(current_user: dict) -> Optional[set[str]]:
 
 
 
-@app.post("/v1/courses/{course_id}/documents:batchCreate", response_model=BatchCreateResponse)
+@app.post(
+    "/v1/courses/{course_id}/documents:batchCreate",
+    response_model=BatchCreateResponse,
+    dependencies=[Depends(require_writer)],
+)
 def batch_create(
     course_id: str,
     request: BatchCreateRequest,
+    response: Response,
     current_user: dict = Depends(is_teacher),
 ):
-    index = get_course_index(course_id)
     created_documents = []
     for doc in request.documents:
         doc.course_id = course_id
-        index.upsert(doc)
-        global_index.upsert(doc)
         created_documents.append(doc)
-    return BatchCreateResponse(documents=created_documents)
+
+    record = {
+        "op": "upsert",
+        "course_id": course_id,
+        "documents": [doc.model_dump() for doc in created_documents],
+    }
+    if settings.INDEXING_ASYNC:
+        with write_lock(f"course:{course_id}"):
+            # Checked before logging: a rejected write must not come back on WAL replay.
+            try:
+                indexing_queue.ensure_room(len(created_documents))
+            except QueueFull as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+            lsn = wal.append(record) if wal else None
+            op = indexing_queue.submit(course_id, "upsert", created_documents, lsn)
+        response.status_code = 202
+    else:
+        with write_lock(f"course:{course_id}"):
+            with log_mutation(record):
+                apply_upserts(course_id, created_documents)
+            op = indexing_queue.record_applied(course_id, "upsert", len(created_documents))
+    return BatchCreateResponse(
+        documents=created_documents,
+        operation_id=op.id,
+        target_generation=op.target_generation,
+    )
+
+
+def _timestamp(t: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(t).isoformat() if t is not None else None
+
+
+@app.get("/v1/operations/{operation_id}", response_model=OperationResponse)
+def get_operation(operation_id: str, current_user: dict = Depends(is_teacher)):
+    op: Optional[Operation] = indexing_queue.get(operation_id)
+    if op is None:
+        raise HTTPException(status_code=404, detail="Operation not found")
+    return OperationResponse(
+        id=op.id,
+        course_id=op.course_id,
+        kind=op.kind,
+        status=op.status,
+        document_count=op.document_count,
+        target_generation=op.target_generation,
+        current_generation=get_course_index(op.course_id).generation,
+        created_at=_timestamp(op.created_at),
+        finished_at=_timestamp(op.finished_at),
+        error=op.error,
+    )
 
 @app.post("/v1/documents:search", response_model=SearchResponse)
 def search_all_courses(
@@ -150,35 +762,39 @@ def search_all_courses(
 ):
 
     allowed = get_allowed_course_ids(current_user)
-
-    # pull more than page_size so filtering still leaves enough results
-    raw = global_index.search(query=request.query, k=request.page_size * 5)
-
-    if allowed is not None:
-        raw = [(doc, score) for (doc, score) in raw if doc.course_id in allowed]
-
-    results = raw[: request.page_size]
-
-    search_results = [
-        SearchResult(
-            id=doc.id,
-            score=score,
-            course_id=doc.course_id,
-            source=doc.source,
-            chunk_index=doc.chunk_index,
-            title=doc.title,
-            snippet=doc.content[:200],
-            metadata=doc.metadata,
-        )
-        for doc, score in results
-    ]
-
-    return SearchResponse(
-        query=request.query,
-        mode=request.mode,
-        results=search_results,
+    reject_min_generation(request)
+
+    # Only the allowed courses are searched, so no over-fetching or post-filtering
+    results, next_page_token = search_page(
+        "all",
+        corpus_generation(),
+        request,
+        allowed,
+        lambda k: rank_all_courses(request, allowed, k),
     )
 
+    with stage("serialize"):
+        search_results = [
+            SearchResult(
+                id=doc.id,
+                score=score,
+                course_id=doc.course_id,
+                source=doc.source,
+                chunk_index=doc.chunk_index,
+                title=doc.title,
+                snippet=doc.content[:200],
+                metadata=doc.metadata,
+            )
+            for doc, score in results
+        ]
+
+        return json_response(SearchResponse(
+            query=request.query,
+            mode=request.mode,
+            results=search_results,
+            next_page_token=next_page_token,
+        ))
+
 @app.post("/v1/courses/{course_id}/documents:search", response_model=SearchResponse)
 def search(
     course_id: str,
@@ -191,31 +807,44 @@ def search(
     if allowed is not None and course_id not in allowed:
         raise HTTPException(status_code=403, detail="Not allowed to search this course")
 
+    wait_for_generation(course_id, request)
     index = get_course_index(course_id)
-    results = index.search(query=request.query, k=request.page_size)
-
-    search_results = [
-        SearchResult(
-            id=doc.id,
-            score=score,
-            course_id=doc.course_id,
-            source=doc.source,
-            chunk_index=doc.chunk_index,
-            title=doc.title,
-            snippet=doc.content[:200],  # Simple snippet
-            metadata=doc.metadata,
-        )
-        for doc, score in results
-    ]
-
-    return SearchResponse(
-        query=request.query,
-        mode=request.mode,
-        results=search_results,
+    results, next_page_token = search_page(
+        f"course:{course_id}",
+        index.generation,
+        request,
+        allowed,
+        lambda k: rank_course(course_id, request, k),
     )
 
-
-@app.patch("/v1/courses/{course_id}/documents/{document_id}", response_model=DocumentChunk)
+    with stage("serialize"):
+        search_results = [
+            SearchResult(
+                id=doc.id,
+                score=score,
+                course_id=doc.course_id,
+                source=doc.source,
+                chunk_index=doc.chunk_index,
+                title=doc.title,
+                snippet=doc.content[:200],  # Simple snippet
+                metadata=doc.metadata,
+            )
+            for doc, score in results
+        ]
+
+        return json_response(SearchResponse(
+            query=request.query,
+            mode=request.mode,
+            results=search_results,
+            next_page_token=next_page_token,
+        ))
+
+
+@app.patch(
+    "/v1/courses/{course_id}/documents/{document_id}",
+    response_model=DocumentChunk,
+    dependencies=[Depends(require_writer)],
+)
 def update_document(
     course_id: str,
     document_id: str,
@@ -224,22 +853,30 @@ def update_document(
 ):
     index = get_course_index(course_id)
 
-    if document_id not in index.docs:
-        raise HTTPException(status_code=404, detail="Document not found")
+    with write_lock(f"course:{course_id}"):
+        drain_indexing(course_id)
+        if document_id not in index.docs:
+            raise HTTPException(status_code=404, detail="Document not found")
 
-    existing_doc = index.docs[document_id]
+        existing_doc = index.docs[document_id]
 
-    update_data = payload.model_dump(exclude_unset=True)
-    updated_doc = existing_doc.model_copy(update=update_data)
-    updated_doc.updated_at = datetime.utcnow().isoformat()
+        update_data = payload.model_dump(exclude_unset=True)
+        updated_doc = existing_doc.model_copy(update=update_data)
+        updated_doc.updated_at = datetime.utcnow().isoformat()
 
-    index.upsert(updated_doc)
-    global_index.upsert(updated_doc)
+        record = {"op": "upsert", "course_id": course_id, "documents": [updated_doc.model_dump()]}
+        with log_mutation(record):
+            apply_upserts(course_id, [updated_doc])
+    indexing_queue.notify()
 
     return updated_doc
 
 
-@app.delete("/v1/courses/{course_id}/documents/{document_id}", status_code=204)
+@app.delete(
+    "/v1/courses/{course_id}/documents/{document_id}",
+    status_code=204,
+    dependencies=[Depends(require_writer)],
+)
 def delete_document(
     course_id: str,
     document_id: str,
@@ -247,11 +884,15 @@ def delete_document(
 ):
     index = get_course_index(course_id)
 
-    if document_id not in index.docs:
-        raise HTTPException(status_code=404, detail="Document not found")
+    with write_lock(f"course:{course_id}"):
+        drain_indexing(course_id)
+        if document_id not in index.docs:
+            raise HTTPException(status_code=404, detail="Document not found")
 
-    index.delete(document_id)
-    global_index.delete(document_id)
+        record = {"op": "delete", "course_id": course_id, "document_ids": [document_id]}
+        with log_mutation(record):
+            apply_deletes(course_id, [document_id])
+    indexing_queue.notify()
 
     return None
 
@@ -276,6 +917,7 @@ class RagSearchResponse(BaseModel):
     query: str
     mode: str  # reuse SearchRequest.mode for now
     results: List[RagSearchResult]
+    next_page_token: Optional[str] = None
 
 
 @app.post("/v1/courses/{course_id}/documents:ragSearch", response_model=RagSearchResponse)
@@ -291,64 +933,77 @@ def rag_search(
     for each hit instead of just a short snippet. This is what the RAG service
     will call to build its LLM context.
     """
+    wait_for_generation(course_id, request)
     index = get_course_index(course_id)
-    results = index.search(query=request.query, k=request.page_size)
-
-    rag_results = [
-        RagSearchResult(
-            id=doc.id,
-            score=score,
-            course_id=doc.course_id,
-            source=doc.source,
-            chunk_index=doc.chunk_index,
-            title=doc.title,
-            content=doc.content,
-            metadata=doc.metadata,
-        )
-        for doc, score in results
-    ]
-
-    return RagSearchResponse(
-        query=request.query,
-        mode=request.mode,
-        results=rag_results,
+    results, next_page_token = search_page(
+        f"course:{course_id}",
+        index.generation,
+        request,
+        None,
+        lambda k: rank_course(course_id, request, k),
     )
 
+    with stage("serialize"):
+        rag_results = [
+            RagSearchResult(
+                id=doc.id,
+                score=score,
+                course_id=doc.course_id,
+                source=doc.source,
+                chunk_index=doc.chunk_index,
+                title=doc.title,
+                content=doc.content,
+                metadata=doc.metadata,
+            )
+            for doc, score in results
+        ]
+
+        return json_response(RagSearchResponse(
+            query=request.query,
+            mode=request.mode,
+            results=rag_results,
+            next_page_token=next_page_token,
+        ))
+
 @app.post("/v1/documents:ragSearch", response_model=RagSearchResponse)
 def rag_search_all_courses(
     request: SearchRequest,
     current_user: dict = Depends(get_current_user),
 ):
     allowed = get_allowed_course_ids(current_user)
-
-    # pull more than page_size so filtering still leaves enough results
-    raw = global_index.search(query=request.query, k=request.page_size * 5)
-
-    if allowed is not None:
-        raw = [(doc, score) for (doc, score) in raw if doc.course_id in allowed]
-
-    results = raw[: request.page_size]
-
-    rag_results = [
-        RagSearchResult(
-            id=doc.id,
-            score=score,
-            course_id=doc.course_id,
-            source=doc.source,
-            chunk_index=doc.chunk_index,
-            title=doc.title,
-            content=doc.content,
-            metadata=doc.metadata,
-        )
-        for doc, score in results
-    ]
-
-    return RagSearchResponse(
-        query=request.query,
-        mode=request.mode,
-        results=rag_results,
+    reject_min_generation(request)
+
+    # Only the allowed courses are searched, so no over-fetching or post-filtering
+    results, next_page_token = search_page(
+        "all",
+        corpus_generation(),
+        request,
+        allowed,
+        lambda k: rank_all_courses(request, allowed, k),
     )
 
+    with stage("serialize"):
+        rag_results = [
+            RagSearchResult(
+                id=doc.id,
+                score=score,
+                course_id=doc.course_id,
+                source=doc.source,
+                chunk_index=doc.chunk_index,
+                title=doc.title,
+                content=doc.content,
+                metadata=doc.metadata,
+            )
+            for doc, score in results
+        ]
+
+        return json_response(RagSearchResponse(
+            query=request.query,
+            mode=request.mode,
+            results=rag_results,
+            next_page_token=next_page_token,
+        ))
+
 
 import os
 
@@ -24,6 +24,21 @@ class BatchCreateRequest(BaseModel):
 
 class BatchCreateResponse(BaseModel):
     documents: List[DocumentChunk]
+    # Poll GET /v1/operations/{operation_id}, or search with min_generation=target_generation
+    operation_id: Optional[str] = None
+    target_generation: Optional[int] = None
+
+class OperationResponse(BaseModel):
+    id: str
+    course_id: str
+    kind: Literal["upsert", "delete"]
+    status: Literal["pending", "succeeded", "failed"]
+    document_count: int
+    target_generation: int
+    current_generation: int
+    created_at: str
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
 
 class SearchResult(BaseModel):
     id: str
@@ -39,6 +54,10 @@ class SearchRequest(BaseModel):
     query: str
     page_size: int = 10
     mode: Literal["lexical", "vector", "hybrid"] = "lexical"
+    # next_page_token from the previous page of the same search
+    page_token: Optional[str] = None
+    # Wait (up to MIN_GENERATION_TIMEOUT_MS) until the course index has reached this generation
+    min_generation: Optional[int] = None
 
 class SearchResponse(BaseModel):
     query: str
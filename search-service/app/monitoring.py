@@ -2,18 +2,40 @@
 Monitoring service for the Search Service.
 
 Tracks request metrics, system resources, and provides health data.
+
+Request latencies go into bucketed histograms per (method, route, status).
+Every thread records into its own shard of counters, without locking; a
+health or /metrics scrape merges the shards. Routes are labelled by their
+path template ("/v1/courses/{course_id}/documents:search"), so the number of
+series stays bounded whatever ids clients send. The stages a request
+records with app.timing (auth, tokenize, retrieve, ...) get one histogram per
+stage name, and are sent back to the client as a Server-Timing header.
+
+Process resources (CPU, RSS, threads, open file descriptors) are sampled by a
+background thread into a fixed-size ring buffer. Health endpoints read the
+latest sample instead of measuring CPU inline, which used to block the event
+loop for 100ms per call.
+
+The dashboard is a static page subscribed to a server-sent events stream; a
+MetricsFeed turns successive scrapes into events holding only the values that
+changed. Dashboard traffic is not counted in the request metrics it shows.
 """
 
+import math
 import time
 import platform
 import sys
+import threading
+from bisect import bisect_left
 from datetime import datetime
-from typing import Dict, Any
-from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass
 from threading import Lock
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .timing import finish_timer, start_timer
 
 try:
     import psutil
@@ -22,37 +44,249 @@ except ImportError:
     HAS_PSUTIL = False
 
 
+# Upper bounds (seconds) of the latency buckets; a last, unbounded bucket catches the rest
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+UNMATCHED_ROUTE = "unmatched"
+# Requests to these paths (the dashboard and the feeds it polls) are not recorded
+DASHBOARD_PATHS = frozenset({"/health/dashboard", "/health/stream", "/health/history"})
+
+SeriesKey = Tuple[str, str, int]  # (method, route, status)
+
+
 @dataclass
-class RequestMetrics:
-    """Tracks request-related metrics."""
-    total_requests: int = 0
-    successful_requests: int = 0
-    failed_requests: int = 0
-    total_response_time: float = 0.0
-    start_time: float = field(default_factory=time.time)
+class LatencyHistogram:
+    """Request counts per latency bucket (the last one unbounded) and their total seconds."""
+    bounds: Sequence[float]
+    counts: List[int]
+    total_seconds: float = 0.0
 
     @property
-    def average_response_time(self) -> float:
-        """Average response time in milliseconds."""
-        if self.total_requests == 0:
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total_seconds += other.total_seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated `q` quantile in seconds, interpolating linearly inside the
+        bucket it falls in (as Prometheus' histogram_quantile does). Requests
+        beyond the last bound report that bound.
+        """
+        count = self.count
+        if count == 0:
             return 0.0
-        return (self.total_response_time / self.total_requests) * 1000
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
 
-    @property
-    def success_rate(self) -> float:
-        """Success rate as percentage."""
-        if self.total_requests == 0:
-            return 100.0
-        return (self.successful_requests / self.total_requests) * 100
 
-    def record_request(self, response_time: float, status_code: int) -> None:
+class _Shard:
+    """One thread's counters. Only that thread writes them."""
+    __slots__ = ("series", "stages", "in_flight")
+
+    def __init__(self):
+        # series key -> [count per bucket..., total seconds]
+        self.series: Dict[SeriesKey, List[float]] = {}
+        # stage name -> [count per bucket..., total seconds]
+        self.stages: Dict[str, List[float]] = {}
+        self.in_flight = 0
+
+
+def _observe(table: Dict[Any, List[float]], key: Any, seconds: float, buckets: Sequence[float]) -> None:
+    entry = table.get(key)
+    if entry is None:
+        entry = table[key] = [0] * (len(buckets) + 1) + [0.0]
+    entry[bisect_left(buckets, seconds)] += 1
+    entry[-1] += seconds
+
+
+class RequestMetrics:
+    """Per-route and per-status latency histograms and in-flight requests, sharded by thread."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.start_time = time.time()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = Lock()  # taken once per thread, when its shard is created
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record_request(self, response_time: float, status_code: int,
+                       route: str = UNMATCHED_ROUTE, method: str = "GET") -> None:
         """Record a completed request."""
-        self.total_requests += 1
-        self.total_response_time += response_time
-        if 200 <= status_code < 400:
-            self.successful_requests += 1
-        else:
-            self.failed_requests += 1
+        _observe(self._shard().series, (method, route, status_code), response_time, self.buckets)
+
+    def record_stages(self, stages: Sequence[Tuple[str, float]]) -> None:
+        """Record the (name, seconds) stages of a completed request."""
+        table = self._shard().stages
+        for name, seconds in stages:
+            _observe(table, name, seconds, self.buckets)
+
+    def request_started(self) -> None:
+        self._shard().in_flight += 1
+
+    def request_finished(self) -> None:
+        # A request may finish on another thread than it started on; only the sum matters.
+        self._shard().in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return sum(shard.in_flight for shard in shards)
+
+    def histograms(self) -> Dict[SeriesKey, LatencyHistogram]:
+        """Every series, merged across threads."""
+        return self._merged("series")
+
+    def stage_histograms(self) -> Dict[str, LatencyHistogram]:
+        """Every request stage, merged across threads."""
+        return self._merged("stages")
+
+    def _merged(self, table: str) -> Dict[Any, LatencyHistogram]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[Any, LatencyHistogram] = {}
+        for shard in shards:
+            # list() copies under the GIL, so a recording thread cannot resize what we iterate
+            for key, entry in list(getattr(shard, table).items()):
+                entry = list(entry)
+                histogram = LatencyHistogram(self.buckets, entry[:-1], entry[-1])
+                if key in merged:
+                    merged[key].merge(histogram)
+                else:
+                    merged[key] = histogram
+        return merged
+
+
+def _latency_summary(histogram: LatencyHistogram) -> Dict[str, Any]:
+    return {
+        "count": histogram.count,
+        "average_ms": round(histogram.total_seconds / histogram.count * 1000, 2) if histogram.count else 0.0,
+        "p50_ms": round(histogram.quantile(0.5) * 1000, 2),
+        "p90_ms": round(histogram.quantile(0.9) * 1000, 2),
+        "p99_ms": round(histogram.quantile(0.99) * 1000, 2),
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}" if labels else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+GaugeValue = Union[float, Dict[str, float]]
+
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 1.0
+DEFAULT_SAMPLE_CAPACITY = 600
+
+
+@dataclass
+class ProcessSample:
+    """This process's resource usage at one moment."""
+    timestamp: float
+    cpu_percent: float
+    memory_mb: float
+    threads: int
+    open_fds: int
+
+
+class ProcessSampler:
+    """Samples process resources every `interval_seconds` into a ring buffer of `capacity` points."""
+
+    FIELDS = ("timestamp", "cpu_percent", "memory_mb", "threads", "open_fds")
+
+    def __init__(self, interval_seconds: float = DEFAULT_SAMPLE_INTERVAL_SECONDS,
+                 capacity: int = DEFAULT_SAMPLE_CAPACITY):
+        self.interval_seconds = interval_seconds
+        self.capacity = capacity
+        self._points: List[Optional[ProcessSample]] = [None] * capacity
+        self._written = 0  # samples ever recorded; the next goes to _written % capacity
+        self._lock = Lock()
+        self._process = psutil.Process() if HAS_PSUTIL else None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> Optional[ProcessSample]:
+        """Measure and record one point. Never blocks: CPU is measured since the previous sample."""
+        if self._process is None:
+            return None
+        try:
+            process = self._process
+            with process.oneshot():
+                point = ProcessSample(
+                    timestamp=time.time(),
+                    cpu_percent=round(process.cpu_percent(interval=None), 2),
+                    memory_mb=round(process.memory_info().rss / (1024 * 1024), 2),
+                    threads=process.num_threads(),
+                    open_fds=process.num_fds() if hasattr(process, "num_fds") else process.num_handles(),
+                )
+        except Exception:
+            return None
+        with self._lock:
+            self._points[self._written % self.capacity] = point
+            self._written += 1
+        return point
+
+    def latest(self) -> Optional[ProcessSample]:
+        with self._lock:
+            return self._points[(self._written - 1) % self.capacity] if self._written else None
+
+    def history(self, seconds: Optional[float] = None) -> List[ProcessSample]:
+        """Samples oldest first, optionally only those of the last `seconds`."""
+        with self._lock:
+            count = min(self._written, self.capacity)
+            start = self._written - count
+            points = [self._points[i % self.capacity] for i in range(start, self._written)]
+        if seconds is not None:
+            since = time.time() - seconds
+            points = [p for p in points if p.timestamp >= since]
+        return points
+
+    def start(self) -> None:
+        if self._process is None or self._thread is not None:
+            return
+
+        def run():
+            self.sample()  # primes cpu_percent, which compares against the previous call
+            while not self._stop.wait(self.interval_seconds):
+                self.sample()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="process-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
 
 class MonitoringService:
@@ -61,14 +295,152 @@ class MonitoringService:
     """
 
     def __init__(self):
-        self._lock = Lock()
         self._start_time = time.time()
         self._request_metrics = RequestMetrics()
+        self.sampler = ProcessSampler()
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        # name -> (help, label name or None, collect)
+        self._gauges: Dict[str, Tuple[str, Optional[str], Callable[[], GaugeValue]]] = {}
 
-    def record_request(self, response_time: float, status_code: int) -> None:
-        """Thread-safe request recording."""
-        with self._lock:
-            self._request_metrics.record_request(response_time, status_code)
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+        """Include the dict returned by `collector` under `name` in the health data."""
+        self._collectors[name] = collector
+
+    def get_collected_stats(self) -> Dict[str, Any]:
+        """Run every registered collector. A failing collector reports its error."""
+        stats = {}
+        for name, collector in self._collectors.items():
+            try:
+                stats[name] = collector()
+            except Exception as e:
+                stats[name] = {"error": str(e)}
+        return stats
+
+    def register_gauge(self, name: str, help_text: str, collect: Callable[[], GaugeValue],
+                       label: Optional[str] = None) -> None:
+        """
+        Export `collect()` as a Prometheus gauge. With `label`, `collect`
+        returns {label value: value}, one sample per entry.
+        """
+        self._gauges[name] = (help_text, label, collect)
+
+    def record_request(self, response_time: float, status_code: int,
+                       route: str = UNMATCHED_ROUTE, method: str = "GET") -> None:
+        """Record a completed request. Lock-free: counts go to the calling thread's shard."""
+        self._request_metrics.record_request(response_time, status_code, route, method)
+
+    def record_stages(self, stages: Sequence[Tuple[str, float]]) -> None:
+        """Record a completed request's (name, seconds) stages, see app.timing."""
+        self._request_metrics.record_stages(stages)
+
+    def request_started(self) -> None:
+        self._request_metrics.request_started()
+
+    def request_finished(self) -> None:
+        self._request_metrics.request_finished()
+
+    def get_in_flight(self) -> int:
+        return self._request_metrics.in_flight
+
+    def get_latency_histogram(self) -> LatencyHistogram:
+        """All requests merged into one histogram."""
+        buckets = self._request_metrics.buckets
+        overall = LatencyHistogram(buckets, [0] * (len(buckets) + 1))
+        for histogram in self._request_metrics.histograms().values():
+            overall.merge(histogram)
+        return overall
+
+    def get_request_stats(self) -> Dict[str, Any]:
+        """Request totals and latency percentiles, overall and per route."""
+        histograms = self._request_metrics.histograms()
+        overall = LatencyHistogram(self._request_metrics.buckets, [0] * (len(self._request_metrics.buckets) + 1))
+        routes: Dict[str, LatencyHistogram] = {}
+        successful = failed = 0
+        for (method, route, status), histogram in sorted(histograms.items()):
+            overall.merge(histogram)
+            if 200 <= status < 400:
+                successful += histogram.count
+            else:
+                failed += histogram.count
+            by_route = routes.setdefault(
+                f"{method} {route}",
+                LatencyHistogram(histogram.bounds, [0] * len(histogram.counts)),
+            )
+            by_route.merge(histogram)
+
+        total = successful + failed
+        summary = _latency_summary(overall)
+        return {
+            "total": total,
+            "successful": successful,
+            "failed": failed,
+            "success_rate": round(successful / total * 100, 2) if total else 100.0,
+            "average_response_time_ms": summary["average_ms"],
+            "p50_ms": summary["p50_ms"],
+            "p90_ms": summary["p90_ms"],
+            "p99_ms": summary["p99_ms"],
+            "in_flight": self.get_in_flight(),
+            "routes": {name: _latency_summary(h) for name, h in routes.items()},
+            "stages": {
+                name: _latency_summary(h)
+                for name, h in sorted(self._request_metrics.stage_histograms().items())
+            },
+        }
+
+    def prometheus_text(self) -> str:
+        """All request metrics and registered gauges in the Prometheus text format (0.0.4)."""
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by method, route and status.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), histogram in sorted(self._request_metrics.histograms().items()):
+            cumulative = 0
+            for bound, n in zip(list(histogram.bounds) + [math.inf], histogram.counts):
+                cumulative += n
+                labels = _labels(method=method, route=route, status=status, le=_number(bound))
+                lines.append(f"http_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(method=method, route=route, status=status)
+            lines.append(f"http_request_duration_seconds_sum{labels} {_number(histogram.total_seconds)}")
+            lines.append(f"http_request_duration_seconds_count{labels} {cumulative}")
+
+        lines += [
+            "# HELP http_request_stage_duration_seconds Time spent in each stage of a request.",
+            "# TYPE http_request_stage_duration_seconds histogram",
+        ]
+        for name, histogram in sorted(self._request_metrics.stage_histograms().items()):
+            cumulative = 0
+            for bound, n in zip(list(histogram.bounds) + [math.inf], histogram.counts):
+                cumulative += n
+                lines.append(f"http_request_stage_duration_seconds_bucket{_labels(stage=name, le=_number(bound))} {cumulative}")
+            lines.append(f"http_request_stage_duration_seconds_sum{_labels(stage=name)} {_number(histogram.total_seconds)}")
+            lines.append(f"http_request_stage_duration_seconds_count{_labels(stage=name)} {cumulative}")
+
+        gauges = {
+            "http_requests_in_flight": ("Requests being served.", None, lambda: self._request_metrics.in_flight),
+            "process_uptime_seconds": ("Seconds since the service started.", None, self.get_uptime),
+            "process_cpu_percent": ("Sampled CPU use of this process.", None,
+                                    lambda: self.sampler.latest().cpu_percent),
+            "process_resident_memory_bytes": ("Sampled resident memory of this process.", None,
+                                              lambda: int(self.sampler.latest().memory_mb * 1024 * 1024)),
+            "process_threads": ("Sampled thread count of this process.", None,
+                                lambda: self.sampler.latest().threads),
+            "process_open_fds": ("Sampled open file descriptors of this process.", None,
+                                 lambda: self.sampler.latest().open_fds),
+            **self._gauges,
+        }
+        for name, (help_text, label, collect) in gauges.items():
+            try:
+                value = collect()
+            except Exception:
+                continue  # a broken gauge must not take the whole scrape down
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if label is None:
+                lines.append(f"{name} {_number(value)}")
+            else:
+                for label_value, sample in sorted(value.items()):
+                    lines.append(f"{name}{_labels(**{label: label_value})} {_number(sample)}")
+        return "\n".join(lines) + "\n"
 
     def get_uptime(self) -> float:
         """Server uptime in seconds."""
@@ -93,25 +465,32 @@ class MonitoringService:
         return " ".join(parts)
 
     def get_process_stats(self) -> Dict[str, Any]:
-        """Get this process's resource usage. Returns zeros if psutil unavailable."""
-        if HAS_PSUTIL:
-            try:
-                process = psutil.Process()
-                cpu_percent = process.cpu_percent(interval=0.1)
-                memory_info = process.memory_info()
-                memory_mb = memory_info.rss / (1024 * 1024)  # RSS = actual RAM used
-                return {
-                    "cpu_percent": round(cpu_percent, 2),
-                    "memory_mb": round(memory_mb, 2),
-                    "psutil_available": True
-                }
-            except Exception:
-                pass
+        """This process's latest sampled resource usage. Returns zeros if psutil unavailable."""
+        point = self.sampler.latest() or self.sampler.sample()
+        if point is None:
+            return {
+                "cpu_percent": 0.0,
+                "memory_mb": 0.0,
+                "threads": 0,
+                "open_fds": 0,
+                "psutil_available": False,
+            }
+        return {
+            "cpu_percent": point.cpu_percent,
+            "memory_mb": point.memory_mb,
+            "threads": point.threads,
+            "open_fds": point.open_fds,
+            "sampled_at": datetime.utcfromtimestamp(point.timestamp).isoformat(),
+            "psutil_available": True,
+        }
 
+    def get_process_history(self, seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Sampled process resources as one list per field, oldest first, for charts."""
+        points = self.sampler.history(seconds)
         return {
-            "cpu_percent": 0.0,
-            "memory_mb": 0.0,
-            "psutil_available": False
+            "interval_seconds": self.sampler.interval_seconds,
+            "points": len(points),
+            **{name: [getattr(p, name) for p in points] for name in ProcessSampler.FIELDS},
         }
 
     def get_environment_info(self) -> Dict[str, str]:
@@ -125,9 +504,6 @@ class MonitoringService:
 
     def get_health_data(self) -> Dict[str, Any]:
         """Get comprehensive health data for monitoring."""
-        with self._lock:
-            metrics = self._request_metrics
-
         process_stats = self.get_process_stats()
         env_info = self.get_environment_info()
 
@@ -136,42 +512,122 @@ class MonitoringService:
             "status": "healthy",
             "uptime_seconds": round(self.get_uptime(), 2),
             "uptime_formatted": self.get_uptime_formatted(),
-            "requests": {
-                "total": metrics.total_requests,
-                "successful": metrics.successful_requests,
-                "failed": metrics.failed_requests,
-                "success_rate": round(metrics.success_rate, 2),
-                "average_response_time_ms": round(metrics.average_response_time, 2)
-            },
-            "process": {
-                "cpu_percent": process_stats["cpu_percent"],
-                "memory_mb": process_stats["memory_mb"],
-                "psutil_available": process_stats["psutil_available"]
-            },
-            "environment": env_info
+            "requests": self.get_request_stats(),
+            "process": process_stats,
+            "environment": env_info,
+            **self.get_collected_stats()
+        }
+
+
+def _flatten(stats: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Nested collector stats as {"query_cache.hit_rate": 12.5, ...}, scalar leaves only."""
+    flat: Dict[str, Any] = {}
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif value is None or isinstance(value, (int, float, str, bool)):
+            flat[name] = value
+    return flat
+
+
+class MetricsFeed:
+    """
+    One dashboard subscriber's view of the service. Each ``next_event`` returns
+    the current values that differ from the previous event's: the first event
+    holds everything, later ones are small. Request rate and percentiles cover
+    the requests since the previous event, not the whole uptime.
+    """
+
+    def __init__(self, service: MonitoringService):
+        self.service = service
+        self._sent: Dict[str, Any] = {}
+        self._histogram: Optional[LatencyHistogram] = None
+        self._at = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        histogram = self.service.get_latency_histogram()
+        recent = LatencyHistogram(histogram.bounds, list(histogram.counts), histogram.total_seconds)
+        if self._histogram is not None:
+            recent.counts = [a - b for a, b in zip(histogram.counts, self._histogram.counts)]
+            recent.total_seconds -= self._histogram.total_seconds
+        elapsed = now - self._at if self._histogram is not None else self.service.get_uptime()
+        self._histogram, self._at = histogram, now
+
+        process = self.service.sampler.latest()
+        values: Dict[str, Any] = {
+            "requests.total": histogram.count,
+            "requests.per_second": round(recent.count / elapsed, 2) if elapsed > 0 else 0.0,
+            "requests.in_flight": self.service.get_in_flight(),
+            **{f"requests.{k}": v for k, v in _latency_summary(recent).items() if k.startswith("p")},
+            "uptime_seconds": int(self.service.get_uptime()),
         }
+        if process is not None:
+            values.update({
+                "process.cpu_percent": process.cpu_percent,
+                "process.memory_mb": process.memory_mb,
+                "process.threads": process.threads,
+                "process.open_fds": process.open_fds,
+            })
+        values.update(_flatten(self.service.get_environment_info(), "environment."))
+        values.update(_flatten(self.service.get_collected_stats()))
+        return values
 
+    def next_event(self) -> Dict[str, Any]:
+        values = self.snapshot()
+        changed = {k: v for k, v in values.items() if k not in self._sent or self._sent[k] != v}
+        self._sent = values
+        changed["t"] = round(self._at, 3)
+        return changed
 
-class MonitoringMiddleware(BaseHTTPMiddleware):
-    """FastAPI middleware that tracks request metrics."""
 
-    def __init__(self, app, monitoring_service: MonitoringService):
-        super().__init__(app)
+class MonitoringMiddleware:
+    """
+    ASGI middleware that tracks request metrics and stage timings.
+
+    Plain ASGI rather than BaseHTTPMiddleware: the request runs in the
+    middleware's own task and context, so the StageTimer it starts is the one
+    the endpoint records into, and responses stream through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, monitoring_service: MonitoringService,
+                 exclude_paths: frozenset = DASHBOARD_PATHS):
+        self.app = app
         self.monitoring_service = monitoring_service
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+        timer, token = start_timer()
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if timer:
+                    headers = MutableHeaders(scope=message)
+                    if "server-timing" not in headers:
+                        headers.append("Server-Timing", timer.header())
+            await send(message)
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        """Record request metrics for each request."""
-        start_time = time.time()
+        self.monitoring_service.request_started()
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            self.monitoring_service.request_finished()
+            # Set by the router once it matched a route; missing for 404s on unknown paths
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
             self.monitoring_service.record_request(
-                time.time() - start_time, 
-                response.status_code
+                time.perf_counter() - start_time, status_code, route, scope["method"]
             )
-            return response
-        except Exception as e:
-            self.monitoring_service.record_request(time.time() - start_time, 500)
-            raise
+            self.monitoring_service.record_stages(timer.stages())
+            finish_timer(token)
 
 
 # Global instance
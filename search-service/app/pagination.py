@@ -0,0 +1,195 @@
+"""
+Cursor pagination for the search endpoints.
+
+A ``next_page_token`` is an opaque, HMAC-signed blob recording which search it
+continues (scope plus a digest of the normalized query, mode and the caller's
+allowed courses), the index generation it was issued against, the offset of
+the next page and the last (ref, score) already returned.
+
+A ranking is a list of (ref, score) pairs, best first, where a ref is a tuple
+of strings naming a hit (e.g. course id and doc id). Rankings are kept in a
+QueryCache, keyed by scope and search digest and tagged with the index
+generation, so a repeated search or a followed token slices the cached list
+instead of rescoring. Only the slice a page returns is hydrated into chunks. A token is rejected once the
+generation it carries no longer matches the index: any write since then
+could have reordered the results.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import DocumentChunk
+from .query_cache import QueryCache, normalize_query
+
+Ref = Tuple[str, ...]
+Ranked = Tuple[Ref, float]
+Hit = Tuple[DocumentChunk, float]
+
+DEFAULT_TTL_SECONDS = 300.0
+DEFAULT_PREFETCH_PAGES = 5
+
+
+class InvalidPageToken(ValueError):
+    """The token is malformed, tampered with, expired, or belongs to another search."""
+
+
+class StalePageToken(InvalidPageToken):
+    """The index changed since the token was issued."""
+
+
+class PartialRanking(list):
+    """A ranking built from incomplete inputs (e.g. a timed-out hybrid leg); served but not cached."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class Paginator:
+    def __init__(
+        self,
+        secret: Optional[bytes] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        prefetch_pages: int = DEFAULT_PREFETCH_PAGES,
+        cache: Optional[QueryCache] = None,
+    ):
+        self._secret = secret or secrets.token_bytes(32)
+        self.ttl_seconds = ttl_seconds
+        self.prefetch_pages = prefetch_pages
+        # (scope, search digest) -> (ranked refs, complete), tagged with the generation
+        self.cache = cache if cache is not None else QueryCache()
+
+    # ------------------------------------------------------------------
+    # Tokens
+    # ------------------------------------------------------------------
+
+    def _sign(self, body: bytes) -> str:
+        return _b64encode(hmac.new(self._secret, body, hashlib.sha256).digest()[:16])
+
+    def encode_token(self, payload: Dict) -> str:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        return f"{_b64encode(body)}.{self._sign(body)}"
+
+    def decode_token(self, token: str) -> Dict:
+        try:
+            body_part, signature = token.split(".", 1)
+            body = _b64decode(body_part)
+            signature_bytes = signature.encode("ascii")
+        except ValueError:  # also UnicodeEncodeError: base64 is ASCII
+            raise InvalidPageToken("Malformed page token")
+        if not hmac.compare_digest(signature_bytes, self._sign(body).encode("ascii")):
+            raise InvalidPageToken("Page token signature mismatch")
+        try:
+            payload = json.loads(body)
+            expired = payload["exp"] < time.time()
+        except (ValueError, TypeError, KeyError):
+            raise InvalidPageToken("Malformed page token")
+        if expired:
+            raise InvalidPageToken("Page token expired")
+        return payload
+
+    @staticmethod
+    def search_digest(query: str, *parts) -> str:
+        """
+        Digest identifying one search (normalized query plus e.g. mode and the
+        caller's allowed courses): tokens only continue the search they came from.
+        """
+        raw = json.dumps([normalize_query(query), *parts], separators=(",", ":"), default=sorted)
+        return _b64encode(hashlib.blake2b(raw.encode("utf-8"), digest_size=12).digest())
+
+    # ------------------------------------------------------------------
+    # Paging
+    # ------------------------------------------------------------------
+
+    def page(
+        self,
+        scope: str,
+        digest: str,
+        generation: int,
+        page_size: int,
+        page_token: Optional[str],
+        rank: Callable[[int], List[Ranked]],
+        hydrate: Callable[[List[Ranked]], List[Hit]],
+    ) -> Tuple[List[Hit], Optional[str]]:
+        """
+        Return one page of the ranking produced by `rank(k)` (the top-k refs,
+        best first), hydrated by `hydrate`, plus the token for the next page,
+        if there is one.
+        """
+        offset, last = 0, None
+        if page_token:
+            payload = self.decode_token(page_token)
+            try:
+                if payload["scope"] != scope or payload["search"] != digest:
+                    raise InvalidPageToken("Page token belongs to a different search")
+                if payload["gen"] != generation:
+                    raise StalePageToken("The index changed since this page token was issued")
+                offset, last = int(payload["offset"]), (tuple(payload["last_ref"]), payload["last_score"])
+            except (TypeError, KeyError):
+                raise InvalidPageToken("Malformed page token")
+
+        # One extra hit tells us whether another page exists.
+        needed = offset + page_size + 1
+        ranked = self._ranked_list(scope, digest, generation, needed, rank)
+
+        if last is not None:
+            offset = self._resume_offset(ranked, offset, last)
+
+        page = ranked[offset:offset + page_size]
+        next_token = None
+        if page and len(ranked) > offset + page_size:
+            ref, score = page[-1]
+            next_token = self.encode_token({
+                "scope": scope,
+                "search": digest,
+                "gen": generation,
+                "offset": offset + len(page),
+                "last_ref": ref,
+                "last_score": score,
+                "exp": time.time() + self.ttl_seconds,
+            })
+        return hydrate(page), next_token
+
+    @staticmethod
+    def _resume_offset(ranked: List[Ranked], offset: int, last: Tuple[Ref, float]) -> int:
+        last_ref, last_score = last
+        if 0 < offset <= len(ranked) and tuple(ranked[offset - 1][0]) == last_ref:
+            return offset
+        # Fall back to searching by position; only a reordered ranking fails here.
+        for i, (ref, score) in enumerate(ranked):
+            if tuple(ref) == last_ref and score == last_score:
+                return i + 1
+        raise StalePageToken("The index changed since this page token was issued")
+
+    def _ranked_list(
+        self,
+        scope: str,
+        digest: str,
+        generation: int,
+        needed: int,
+        rank: Callable[[int], List[Ranked]],
+    ) -> List[Ranked]:
+        key = (scope, digest)
+        entry = self.cache.get(key, generation)
+        if entry is not None:
+            ranked, complete = entry
+            # A cached ranking serves any page it is deep enough for.
+            if complete or len(ranked) >= needed:
+                return ranked
+
+        # Rank a few pages ahead so following pages are served from the cache.
+        k = max(needed, (needed - 1) * self.prefetch_pages + 1)
+        ranked = rank(k)
+        if isinstance(ranked, PartialRanking):
+            return ranked
+        self.cache.put(key, generation, (ranked, len(ranked) < k))
+        return ranked
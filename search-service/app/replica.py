@@ -0,0 +1,115 @@
+"""
+Read-only replicas of the indices published by an indexer process.
+
+One indexer process owns every write (and the WAL) and publishes each changed
+course as a new immutable snapshot generation (see snapshot.py). Any number of
+reader processes, e.g. ``uvicorn --workers N`` with SERVICE_ROLE=reader, map
+those generation files read-only: the posting, vector and chunk files sit in
+the page cache once, however many readers map them.
+
+A ReplicaSync polls the CURRENT pointer of every course. When one moves, the
+new generation is loaded and handed to ``swap``, which replaces the course's
+entry in the reader's index dicts; searches already running keep the index
+object they started with. A generation that is removed by the indexer while it
+is being loaded (it was superseded twice in the meantime) fails to load and is
+picked up again at the next poll. User profiles are reloaded whenever the
+indexer rewrites them.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .snapshot import SnapshotError, SnapshotManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 0.5
+
+
+class ReplicaSync:
+    def __init__(
+        self,
+        snapshots: SnapshotManager,
+        swap: Callable[[str, str], None],
+        load_profiles: Callable[[List[Dict]], None],
+        interval_seconds: float = DEFAULT_POLL_SECONDS,
+    ):
+        """
+        `swap(course_id, generation_dir)` loads and installs one course
+        generation; `load_profiles(profiles)` replaces the user profiles.
+        """
+        self.snapshots = snapshots
+        self.interval_seconds = interval_seconds
+        self._swap = swap
+        self._load_profiles = load_profiles
+        self._loaded: Dict[str, str] = {}  # course id -> generation directory in use
+        self._profiles_stamp: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.swaps = 0
+        self.failed_loads = 0
+        self.last_poll_at: Optional[float] = None
+
+    def poll(self) -> int:
+        """Load every course whose published generation moved. Returns how many were swapped."""
+        swapped = 0
+        with self._lock:
+            for course_id in self.snapshots.course_ids():
+                path = self.snapshots.current_path(course_id)
+                if path is None or self._loaded.get(course_id) == path:
+                    continue
+                try:
+                    self._swap(course_id, path)
+                except (SnapshotError, OSError) as e:
+                    logger.warning("Could not load %s for course %s, retrying: %s", path, course_id, e)
+                    self.failed_loads += 1
+                    continue
+                self._loaded[course_id] = path
+                swapped += 1
+            self._poll_profiles()
+            self.swaps += swapped
+            self.last_poll_at = time.time()
+        return swapped
+
+    def _poll_profiles(self):
+        path = os.path.join(self.snapshots.root, SnapshotManager.PROFILES_FILE)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._profiles_stamp:
+            self._load_profiles(self.snapshots.load_profiles())
+            self._profiles_stamp = stamp
+
+    def start(self) -> None:
+        def run():
+            while not self._stop.wait(self.interval_seconds):
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("Replica poll failed")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="replica-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "courses": len(self._loaded),
+                "swaps": self.swaps,
+                "failed_loads": self.failed_loads,
+                "seconds_since_poll": round(time.time() - self.last_poll_at, 3) if self.last_poll_at else None,
+            }
@@ -0,0 +1,460 @@
+"""
+On-disk snapshots of BM25 indices.
+
+Layout (one directory per course index)::
+
+    <root>/courses/<quoted course id>/CURRENT          -> "gen-000000000042"
+    <root>/courses/<quoted course id>/gen-000000000042/
+        manifest.json    format version, generation, per-file size + CRC32
+        terms.json       stemmed terms, in CSR order
+        term_ptr.npy     CSR offsets into post_rows / post_tfs
+        post_rows.npy    posting rows (int32)
+        post_tfs.npy     posting term frequencies (float32)
+        doc_len.npy      per-row document length
+        doc_hash.npy     per-row content hash
+        doc_ids.json     row -> chunk id
+        chunks.jsonl     one DocumentChunk per line, in row order
+        chunk_ptr.npy    byte offsets of each line in chunks.jsonl
+        vectors.npy, vector_scales.npy, vector_doc_hash.npy, vector_doc_ids.json
+                         the course's VectorIndex rows, when it has one
+
+Arrays are loaded memory-mapped and chunks are parsed on first access, so
+restoring an index never re-tokenizes (or re-embeds). Generation directories
+are immutable once CURRENT points at them, which also lets reader processes
+map the same files and share one copy of them in the page cache (see
+replica.py). A corrupted posting file is detected via
+its checksum and the index is rebuilt from chunks.jsonl; a corrupted chunk
+store cannot be recovered and raises SnapshotError.
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import zlib
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from .embeddings import Embedder
+from .index import BM25Index
+from .models import DocumentChunk
+from .vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+_INDEX_FILES = ("terms.json", "term_ptr.npy", "post_rows.npy", "post_tfs.npy", "doc_len.npy", "doc_hash.npy")
+_CHUNK_FILES = ("doc_ids.json", "chunks.jsonl", "chunk_ptr.npy")
+_VECTOR_FILES = ("vectors.npy", "vector_scales.npy", "vector_doc_hash.npy", "vector_doc_ids.json")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, unsupported, or unrecoverably corrupted."""
+
+
+class SnapshotChunks(Mapping):
+    """
+    Read-only chunk store backed by a memory-mapped JSONL file.
+
+    Chunks are parsed into DocumentChunk objects only when accessed (i.e. for
+    the top-k of a search). The index layers later writes on top of it (see
+    chunks.ChunkStore).
+    """
+
+    def __init__(self, path: str, offsets: np.ndarray, doc_ids: List[str]):
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b""
+        self._offsets = offsets
+        self._rows: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+
+    def __getitem__(self, doc_id: str) -> DocumentChunk:
+        row = self._rows[doc_id]
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return DocumentChunk.model_validate_json(self._data[start:end])
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def _crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                return crc
+            crc = zlib.crc32(block, crc)
+
+
+def _fsync_path(path: str) -> None:
+    """Flush a file, or a directory's entries, to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_json(path: str, data) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def save_snapshot(
+    index: BM25Index, directory: str, keep: int = 2, vectors: Optional[VectorIndex] = None
+) -> Tuple[str, int]:
+    """
+    Write a new snapshot generation of `index` (and of the course's `vectors`)
+    under `directory` and point CURRENT at it. The previous generations beyond
+    `keep` are removed. Returns the generation directory and the generation it
+    holds: writes that land while the snapshot is written are not in it, so
+    `index.generation` may already be ahead.
+    """
+    arrays = index.to_arrays()
+    generation = arrays["generation"]
+    name = f"gen-{generation:012d}"
+    os.makedirs(directory, exist_ok=True)
+
+    tmp = os.path.join(directory, f".{name}.tmp-{os.getpid()}-{threading.get_ident()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    _write_json(os.path.join(tmp, "terms.json"), arrays["terms"])
+    _write_json(os.path.join(tmp, "doc_ids.json"), arrays["doc_ids"])
+    for key in ("term_ptr", "post_rows", "post_tfs", "doc_len", "doc_hash"):
+        np.save(os.path.join(tmp, f"{key}.npy"), arrays[key])
+
+    offsets = [0]
+    with open(os.path.join(tmp, "chunks.jsonl"), "wb") as f:
+        for doc in arrays["docs"]:
+            line = doc.model_dump_json().encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(tmp, "chunk_ptr.npy"), np.asarray(offsets, dtype=np.int64))
+
+    filenames = _INDEX_FILES + _CHUNK_FILES
+    vector_info = None
+    if vectors is not None:
+        vector_arrays = vectors.to_arrays()
+        np.save(os.path.join(tmp, "vectors.npy"), vector_arrays["vectors"])
+        np.save(os.path.join(tmp, "vector_scales.npy"), vector_arrays["scales"])
+        np.save(os.path.join(tmp, "vector_doc_hash.npy"), vector_arrays["doc_hash"])
+        _write_json(os.path.join(tmp, "vector_doc_ids.json"), vector_arrays["doc_ids"])
+        vector_info = {"embedder": vector_arrays["embedder"], "dtype": vector_arrays["dtype"]}
+        filenames += _VECTOR_FILES
+
+    files = {}
+    for filename in filenames:
+        _fsync_path(os.path.join(tmp, filename))
+        path = os.path.join(tmp, filename)
+        files[filename] = {"size": os.path.getsize(path), "crc32": _crc32(path)}
+    _write_json(os.path.join(tmp, MANIFEST_FILE), {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "generation": generation,
+        "num_docs": len(arrays["doc_ids"]),
+        "files": files,
+        "vectors": vector_info,
+    })
+
+    _fsync_path(os.path.join(tmp, MANIFEST_FILE))
+    _fsync_path(tmp)
+
+    # Never replace an existing generation directory: readers may have it mapped. One left over
+    # from a crash before CURRENT was updated gets a fresh name next to it.
+    final = os.path.join(directory, name)
+    attempt = 0
+    while os.path.exists(final):
+        attempt += 1
+        final = os.path.join(directory, f"{name}-{attempt}")
+    name = os.path.basename(final)
+    os.replace(tmp, final)
+    _fsync_path(directory)
+
+    current_tmp = os.path.join(directory, f".{CURRENT_FILE}.tmp-{os.getpid()}-{threading.get_ident()}")
+    with open(current_tmp, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+    # Durable before the caller checkpoints the WAL records this generation covers
+    _fsync_path(directory)
+    _fsync_path(os.path.dirname(os.path.abspath(directory)))
+
+    generations = sorted(d for d in os.listdir(directory) if d.startswith("gen-") and d != name)
+    for old in generations[:max(0, len(generations) - keep + 1)]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+    return final, generation
+
+
+def current_generation_dir(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name)
+
+
+def _read_manifest(path: str) -> Dict:
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Unreadable manifest in {path}: {e}") from e
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')} in {path}")
+    return manifest
+
+
+def _damaged(path: str, manifest: Dict, filenames, verify: bool) -> List[str]:
+    bad = []
+    for filename in filenames:
+        expected = manifest["files"].get(filename, {})
+        file_path = os.path.join(path, filename)
+        if (
+            not os.path.exists(file_path)
+            or os.path.getsize(file_path) != expected.get("size")
+            or (verify and _crc32(file_path) != expected.get("crc32"))
+        ):
+            bad.append(filename)
+    return bad
+
+
+def load_snapshot(directory: str, verify: bool = True, **index_kwargs) -> BM25Index:
+    """
+    Load the CURRENT snapshot generation under `directory` memory-mapped.
+
+    With `verify`, every file is checked against the manifest checksums first.
+    If only posting files are damaged the index is rebuilt from the chunk store.
+    """
+    path = current_generation_dir(directory)
+    if path is None:
+        raise SnapshotError(f"No snapshot in {directory}")
+    return load_generation(path, verify, **index_kwargs)
+
+
+def load_generation(path: str, verify: bool = True, **index_kwargs) -> BM25Index:
+    """Load the BM25 index of one snapshot generation directory (see load_snapshot)."""
+    manifest = _read_manifest(path)
+
+    def damaged(filenames) -> List[str]:
+        return _damaged(path, manifest, filenames, verify)
+
+    bad_chunks = damaged(_CHUNK_FILES)
+    if bad_chunks:
+        raise SnapshotError(f"Corrupted chunk store in {path}: {', '.join(bad_chunks)}")
+
+    with open(os.path.join(path, "doc_ids.json"), encoding="utf-8") as f:
+        doc_ids = json.load(f)
+    chunk_ptr = np.load(os.path.join(path, "chunk_ptr.npy"), mmap_mode="r")
+    docs = SnapshotChunks(os.path.join(path, "chunks.jsonl"), chunk_ptr, doc_ids)
+    generation = manifest["generation"]
+
+    bad_index = damaged(_INDEX_FILES)
+    if bad_index:
+        logger.warning("Rebuilding index from chunks, damaged snapshot files in %s: %s", path, ", ".join(bad_index))
+        index = BM25Index(**index_kwargs)
+        index.upsert_many(docs[doc_id] for doc_id in doc_ids)
+        index.generation = generation
+        return index
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+    with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+        terms = json.load(f)
+
+    return BM25Index.from_arrays(
+        terms=terms,
+        term_ptr=load("term_ptr"),
+        post_rows=load("post_rows"),
+        post_tfs=load("post_tfs"),
+        doc_ids=doc_ids,
+        doc_len=load("doc_len"),
+        doc_hash=load("doc_hash"),
+        docs=docs,
+        generation=generation,
+        **index_kwargs,
+    )
+
+
+def load_vectors(path: str, embedder: Embedder, verify: bool = True, **vector_kwargs) -> Optional[VectorIndex]:
+    """
+    Load the VectorIndex of one snapshot generation directory memory-mapped.
+    Returns None when the generation has no vectors, or vectors from another
+    embedder or dtype than asked for, or damaged ones: the caller re-embeds.
+    """
+    manifest = _read_manifest(path)
+    info = manifest.get("vectors")
+    if not info or info["embedder"] != embedder.id:
+        return None
+    if vector_kwargs.get("dtype", info["dtype"]) != info["dtype"]:
+        return None
+    bad = _damaged(path, manifest, _VECTOR_FILES, verify)
+    if bad:
+        logger.warning("Ignoring damaged vector files in %s: %s", path, ", ".join(bad))
+        return None
+
+    with open(os.path.join(path, "vector_doc_ids.json"), encoding="utf-8") as f:
+        doc_ids = json.load(f)
+    vector_kwargs.pop("dtype", None)
+    return VectorIndex.from_arrays(
+        embedder,
+        doc_ids=doc_ids,
+        vectors=np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+        scales=np.load(os.path.join(path, "vector_scales.npy"), mmap_mode="r"),
+        doc_hash=np.load(os.path.join(path, "vector_doc_hash.npy"), mmap_mode="r"),
+        **vector_kwargs,
+    )
+
+
+class SnapshotManager:
+    """
+    Persists the course indices under a root directory and restores them on startup. A background thread snapshots
+    every index whose generation moved since its last snapshot.
+
+    User profiles are small and are written whole at each checkpoint, together
+    with the WAL position the checkpoint covers.
+    """
+
+    PROFILES_FILE = "profiles.json"
+    CHECKPOINT_FILE = "CHECKPOINT"
+
+    def __init__(self, root: str, interval_seconds: float = 60.0):
+        self.root = root
+        self.interval_seconds = interval_seconds
+        self._saved_generations: Dict[str, int] = {}
+        self._loaded_paths: Dict[str, str] = {}  # key -> generation directory it was loaded from
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.last_failed: List[str] = []
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, "courses", quote(key, safe=""))
+
+    def course_ids(self) -> List[str]:
+        courses_root = os.path.join(self.root, "courses")
+        if not os.path.isdir(courses_root):
+            return []
+        return [unquote(name) for name in sorted(os.listdir(courses_root))]
+
+    def current_path(self, key: str) -> Optional[str]:
+        """The generation directory CURRENT points at for `key`, if any."""
+        return current_generation_dir(self._dir(key))
+
+    def _load(self, key: str, **index_kwargs) -> Optional[BM25Index]:
+        try:
+            path = self.current_path(key)
+            if path is None:
+                raise SnapshotError(f"No snapshot in {self._dir(key)}")
+            index = load_generation(path, **index_kwargs)
+        except SnapshotError as e:
+            logger.error("Skipping snapshot %s: %s", key, e)
+            return None
+        self._saved_generations[key] = index.generation
+        self._loaded_paths[key] = path
+        return index
+
+    def load_courses(self, **index_kwargs) -> Dict[str, BM25Index]:
+        indices: Dict[str, BM25Index] = {}
+        for course_id in self.course_ids():
+            index = self._load(course_id, **index_kwargs)
+            if index is not None:
+                indices[course_id] = index
+        return indices
+
+    def load_vectors(self, embedder: Embedder, **vector_kwargs) -> Dict[str, VectorIndex]:
+        """Vector indices of the generations load_courses loaded, where usable (see load_vectors)."""
+        vectors: Dict[str, VectorIndex] = {}
+        for key, path in self._loaded_paths.items():
+            try:
+                index = load_vectors(path, embedder, **vector_kwargs)
+            except SnapshotError as e:
+                logger.error("Skipping vector snapshot %s: %s", key, e)
+                continue
+            if index is not None:
+                vectors[key] = index
+        return vectors
+
+    def save_all(self, courses: Dict[str, BM25Index], vectors: Optional[Dict[str, VectorIndex]] = None) -> int:
+        """Snapshot every changed index, with its course's vectors. Returns how many were written."""
+        vectors = vectors or {}
+        targets = list(courses.items())
+        written = 0
+        with self._lock:
+            self.last_failed = []
+            for key, index in targets:
+                if self._saved_generations.get(key) == index.generation:
+                    continue
+                try:
+                    _, generation = save_snapshot(index, self._dir(key), vectors=vectors.get(key))
+                except OSError as e:
+                    logger.error("Snapshot %s failed: %s", key, e)
+                    self.last_failed.append(key)
+                    continue
+                # What was written, not index.generation: a write since the copy is saved next time
+                self._saved_generations[key] = generation
+                written += 1
+        return written
+
+    def _write_atomic(self, filename: str, data) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, filename)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_path(self.root)
+
+    def write_checkpoint(self, lsn: int, profiles: List[Dict]) -> None:
+        """Record that every WAL record <= `lsn` is covered by the snapshots on disk."""
+        self._write_atomic(self.PROFILES_FILE, profiles)
+        self._write_atomic(self.CHECKPOINT_FILE, {"lsn": lsn})
+
+    def load_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.root, self.CHECKPOINT_FILE), encoding="utf-8") as f:
+                return int(json.load(f)["lsn"])
+        except FileNotFoundError:
+            return 0
+
+    def load_profiles(self) -> List[Dict]:
+        try:
+            with open(os.path.join(self.root, self.PROFILES_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def start(self, save: Callable[[], int]) -> None:
+        """Run `save` (typically a closure over save_all) every interval."""
+        def run():
+            while not self._stop.wait(self.interval_seconds):
+                save()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="index-snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
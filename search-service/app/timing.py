@@ -0,0 +1,113 @@
+"""
+Per-request stage timings.
+
+The monitoring middleware starts a StageTimer for every request and keeps it
+in a context variable. Code on the request path wraps its steps in
+``with stage("retrieve"):`` and needs no handle on the request; outside a
+request, stage() does nothing. Stages with the same name add up, e.g. the
+hydration of both hybrid legs. When the response starts, the middleware sends
+the stages as a ``Server-Timing`` header and adds them to the monitoring
+service's per-stage histograms.
+
+The search path records:
+
+- auth: ID token cache lookup and verification
+- tokenize: query analysis into vocabulary term ids
+- retrieve: scoring and top-k selection (BM25 or vectors)
+- hydrate: building DocumentChunks for the ranked ids
+- serialize: building and encoding the response body
+
+plus the wall time of each ranking leg (lexical, vector, fusion), and
+``cache;desc="hit"`` when a page was served from the query cache.
+
+Worker threads do not inherit context variables. Code handing request work
+to a pool submits ``contextvars.copy_context().run`` (see hybrid.run_legs).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_current: ContextVar[Optional["StageTimer"]] = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """Named durations of one request, in the order they were first recorded."""
+
+    __slots__ = ("_stages", "_lock")
+
+    def __init__(self):
+        # name -> [seconds, description or None]
+        self._stages: Dict[str, List] = {}
+        self._lock = threading.Lock()  # hybrid legs record from two threads
+
+    def add(self, name: str, seconds: float, desc: Optional[str] = None) -> None:
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                self._stages[name] = [seconds, desc]
+            else:
+                entry[0] += seconds
+                if desc:
+                    entry[1] = desc
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def __bool__(self) -> bool:
+        return bool(self._stages)
+
+    def stages(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            return [(name, seconds) for name, (seconds, _) in self._stages.items()]
+
+    def header(self) -> str:
+        """The stages as a Server-Timing header value (durations in ms)."""
+        with self._lock:
+            stages = [(name, seconds, desc) for name, (seconds, desc) in self._stages.items()]
+        parts = []
+        for name, seconds, desc in stages:
+            part = f"{name};dur={seconds * 1000:.2f}" if seconds or not desc else name
+            if desc:
+                part += f';desc="{desc}"'
+            parts.append(part)
+        return ", ".join(parts)
+
+
+def start_timer() -> Tuple[StageTimer, Token]:
+    """Make a new timer current; pass the token to ``finish_timer``."""
+    timer = StageTimer()
+    return timer, _current.set(timer)
+
+
+def finish_timer(token: Token) -> None:
+    _current.reset(token)
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as stage `name` of the current request, if there is one."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def record_stage(name: str, seconds: float, desc: Optional[str] = None) -> None:
+    """Add an already measured duration to the current request's stages."""
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, seconds, desc)
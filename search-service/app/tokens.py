@@ -0,0 +1,318 @@
+"""
+Firebase ID token verification without blocking on Google.
+
+``firebase_admin.auth.verify_id_token`` checks the RS256 signature against
+Google's public certificates, fetching them over HTTP whenever its cached copy
+has expired, all on the calling thread. Here:
+
+- verified claims are cached by token hash until the token's ``exp`` (bounded
+  LRU), so a client's repeated requests verify its token once;
+- a CertificateRefresher keeps the certificates loaded, refreshing them in a
+  background thread before their ``Cache-Control: max-age`` runs out. Only a
+  token signed with a key id it has never seen (Google rotated its keys) makes
+  a request fetch them;
+- a cache miss is verified locally with PyJWT, and callers on the event loop
+  run it in the thread pool.
+
+A FakeIssuer replaces Google for offline load tests: it signs tokens with a
+local RSA key and serves the matching certificates to the refresher, so every
+request goes through the same verification and cache as in production.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import jwt
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+logger = logging.getLogger(__name__)
+
+ID_TOKEN_CERT_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+ID_TOKEN_ISSUER_PREFIX = "https://securetoken.google.com/"
+
+DEFAULT_MAX_ENTRIES = 10_000
+# Refresh this long before the certificates' max-age runs out
+_REFRESH_MARGIN_SECONDS = 300.0
+_DEFAULT_MAX_AGE_SECONDS = 3600.0
+_RETRY_SECONDS = 30.0
+# Unknown key ids fetch the certificates at most this often
+_MIN_REFETCH_SECONDS = 30.0
+_FETCH_TIMEOUT_SECONDS = 10.0
+
+
+class InvalidToken(ValueError):
+    """The token is malformed, badly signed, expired or not for this project."""
+
+
+class CertificatesUnavailable(Exception):
+    """The signing certificates could not be fetched."""
+
+
+def token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class TokenCache:
+    """Verified claims by token hash, each dropped at its token's ``exp``."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        # token hash -> (exp, claims), most recently used last
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            exp, claims = entry
+            if exp <= time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(claims)
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        if self.max_entries <= 0 or not isinstance(claims.get("exp"), (int, float)):
+            return
+        with self._lock:
+            self._entries[token_key(token)] = (float(claims["exp"]), dict(claims))
+            self._entries.move_to_end(token_key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            }
+
+
+def fetch_google_certificates() -> Tuple[Dict[str, str], float]:
+    """Google's ID token certificates (key id -> PEM) and how long they may be used."""
+    try:
+        response = requests.get(ID_TOKEN_CERT_URL, timeout=_FETCH_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        certificates = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise CertificatesUnavailable(str(e)) from e
+    match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return certificates, float(match.group(1)) if match else _DEFAULT_MAX_AGE_SECONDS
+
+
+class CertificateRefresher:
+    """Public keys by key id, kept fresh by a background thread."""
+
+    def __init__(self, fetch: Callable[[], Tuple[Dict[str, str], float]] = fetch_google_certificates):
+        self._fetch = fetch
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()  # one fetch at a time
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh_at: Optional[float] = None
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        certificates, max_age = self._fetch()
+        self._keys = {
+            kid: x509.load_pem_x509_certificate(pem.encode("utf-8")).public_key()
+            for kid, pem in certificates.items()
+        }
+        self.last_refresh_at = time.time()
+        self._expires_at = self.last_refresh_at + max_age
+        self.refreshes += 1
+
+    def key(self, kid: str) -> Any:
+        """
+        The public key `kid`. Fetches the certificates if the background
+        refresh fell behind, or if `kid` is new (rate limited, since anyone can
+        send a token with a made-up key id). Stale keys are used while Google
+        cannot be reached.
+        """
+        keys = self._keys
+        if kid not in keys or time.time() >= self._expires_at:
+            with self._lock:
+                now = time.time()
+                due = now >= self._expires_at or now - (self.last_refresh_at or 0) >= _MIN_REFETCH_SECONDS
+                if self._keys is keys and due:  # else another thread just refreshed
+                    try:
+                        self._refresh()
+                    except CertificatesUnavailable:
+                        self.failures += 1
+                        self._expires_at = max(self._expires_at, now + _RETRY_SECONDS)  # keep the stale keys a while
+                        if kid not in keys:
+                            raise
+            keys = self._keys
+        if kid not in keys:
+            raise InvalidToken(f'Token signed with unknown key id "{kid}"')
+        return keys[kid]
+
+    def start(self) -> None:
+        stop = self._stop = threading.Event()  # a thread still fetching after stop() keeps its own
+
+        def run():
+            wait = 0.0
+            while not stop.wait(wait):
+                try:
+                    self.refresh()
+                    wait = max(_RETRY_SECONDS, self._expires_at - time.time() - _REFRESH_MARGIN_SECONDS)
+                except Exception as e:
+                    self.failures += 1
+                    logger.warning("Could not refresh ID token certificates, retrying: %s", e)
+                    wait = _RETRY_SECONDS
+
+        self._thread = threading.Thread(target=run, name="token-certificates", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            # Not waiting out a fetch that hangs until its timeout
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._keys),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "seconds_until_stale": round(self._expires_at - time.time(), 1) if self._keys else None,
+        }
+
+
+class TokenVerifier:
+    """Verifies Firebase ID tokens the way ``auth.verify_id_token`` does."""
+
+    def __init__(self, project_id: str, certificates: Optional[CertificateRefresher] = None):
+        self.project_id = project_id
+        self.issuer = ID_TOKEN_ISSUER_PREFIX + project_id
+        self.certificates = certificates or CertificateRefresher()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Claims of `token`, plus ``uid``. May fetch certificates, so it blocks."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e)) from e
+        if header.get("alg") != "RS256" or not header.get("kid"):
+            raise InvalidToken("ID tokens must be RS256 signed and carry a key id")
+        try:
+            claims = jwt.decode(
+                token,
+                self.certificates.key(header["kid"]),
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e)) from e
+        subject = claims["sub"]
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidToken('ID token has an invalid "sub" (subject) claim')
+        claims["uid"] = subject
+        return claims
+
+
+class FakeIssuer:
+    """
+    Signs Firebase-shaped ID tokens with a local RSA key, for offline load
+    tests. The key is kept in `key_path` (created on first use), so a load
+    generator in another process can mint tokens the service accepts.
+    """
+
+    KEY_ID = "fake-issuer"
+
+    def __init__(self, project_id: str, key_path: str):
+        self.project_id = project_id
+        if os.path.exists(key_path):
+            with open(key_path, "rb") as f:
+                self._key = serialization.load_pem_private_key(f.read(), password=None)
+        else:
+            self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            tmp = key_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(self._key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption(),
+                ))
+            os.replace(tmp, key_path)
+
+    def mint(self, uid: str, ttl_seconds: float = 3600.0, **claims: Any) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": ID_TOKEN_ISSUER_PREFIX + self.project_id,
+            "aud": self.project_id,
+            "auth_time": now,
+            "iat": now,
+            "exp": now + int(ttl_seconds),
+            "sub": uid,
+            **claims,
+        }
+        return jwt.encode(payload, self._key, algorithm="RS256", headers={"kid": self.KEY_ID})
+
+    def certificates(self) -> Tuple[Dict[str, str], float]:
+        """A self-signed certificate for the key, in the shape fetch_google_certificates returns."""
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, self.KEY_ID)])
+        now = time.time()
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self._key.public_key())
+            .serial_number(1)
+            .not_valid_before(_utc(now - 60))
+            .not_valid_after(_utc(now + 86400))
+            .sign(self._key, hashes.SHA256())
+        )
+        pem = certificate.public_bytes(serialization.Encoding.PEM).decode("ascii")
+        return {self.KEY_ID: pem}, _DEFAULT_MAX_AGE_SECONDS
+
+
+def _utc(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
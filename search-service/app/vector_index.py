@@ -0,0 +1,430 @@
+"""
+Exact dense retrieval over chunk embeddings.
+
+All of a course's embeddings live in one contiguous (rows, dim) matrix, stored
+as float32, float16 (half the memory) or int8 (a quarter, with a float32
+scale per row). A batch of queries is scored with a single matrix product;
+reduced-precision matrices are widened to float32 one block at a time, so the
+temporary memory stays bounded however large the course is.
+
+Like BM25Index, writes append rows and deletes set a tombstone bit, and rows
+whose content hash is unchanged are never re-embedded. Changed chunks are
+embedded through an EmbeddingPipeline when one is given (batching, process
+pool and a persistent embedding cache, see embedding_pipeline.py). Dead rows are dropped
+once they make up ``compact_threshold`` of the matrix.
+
+Once a course holds ``ann_min_rows`` chunks, an IVF structure (see ann.py) is
+trained on a background thread, and from then on queries only score the rows
+of the ``nprobe`` cells closest to them. New rows are assigned to cells as they
+are added; deleted rows are filtered by the tombstone bitmap like in exact
+search. The cells are retrained whenever the index has doubled in size.
+
+Every write, compaction and retraining publishes a VectorSnapshot holding the
+arrays, ids and cells that belong together; a search reads that one reference,
+so it never pairs compacted vectors or remapped cells with old ids.
+"""
+
+import time
+from threading import RLock, Thread
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .ann import IVFIndex, default_nlist
+from .embedding_pipeline import EmbeddingPipeline
+from .embeddings import Embedder
+from .index import DEFAULT_COMPACT_MIN_ROWS, DEFAULT_COMPACT_THRESHOLD, content_hash
+from .models import DocumentChunk
+
+DTYPES = ("float32", "float16", "int8")
+
+# Rows widened to float32 at a time when scoring float16 / int8 matrices
+_SCORE_BLOCK_ROWS = 32_768
+
+DEFAULT_NPROBE = 16
+
+
+class VectorSnapshot(NamedTuple):
+    """
+    What searches read. Rows past `num_rows` may be in the middle of a write;
+    the arrays up to it, and `dead`, are never modified once published.
+    """
+    doc_ids: List[str]  # row -> doc id; only the first num_rows entries belong to this snapshot
+    num_rows: int
+    num_live: int
+    vectors: np.ndarray
+    scales: np.ndarray
+    dead: np.ndarray
+    ann: Optional[IVFIndex]
+
+
+class VectorIndex:
+    def __init__(
+        self,
+        embedder: Embedder,
+        dtype: str = "float32",
+        compact_threshold: float = DEFAULT_COMPACT_THRESHOLD,
+        compact_min_rows: int = DEFAULT_COMPACT_MIN_ROWS,
+        ann_min_rows: Optional[int] = None,
+        nprobe: int = DEFAULT_NPROBE,
+        nlist: Optional[int] = None,
+        pipeline: Optional[EmbeddingPipeline] = None,
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        self.embedder = embedder
+        self.pipeline = pipeline
+        self.dim = embedder.dim
+        self.dtype = dtype
+        self.compact_threshold = compact_threshold
+        self.compact_min_rows = compact_min_rows
+        self.doc_ids: List[str] = []  # row -> doc id, including tombstoned rows
+        self.generation = 0
+        self.embedded = 0  # chunks embedded, as opposed to skipped as unchanged
+
+        self._rows: Dict[str, int] = {}  # live doc id -> row
+        self._vectors = np.zeros((16, self.dim), dtype=np.dtype(dtype))
+        self._scales = np.ones(16, dtype=np.float32)  # int8 only: row -> dequantization scale
+        self._doc_hash = np.zeros((16, 16), dtype=np.uint8)
+        self._dead = np.zeros(16, dtype=bool)
+        self._num_dead = 0
+        self._write_lock = RLock()
+        self.compactions = 0
+        self.last_ann_training_seconds = 0.0
+
+        # Approximate search; None until trained (None ann_min_rows = never automatically)
+        self.ann: Optional[IVFIndex] = None
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self._ann_trained_rows = 0
+        self._ann_training = False
+        self._publish()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def dead_fraction(self) -> float:
+        return self._num_dead / len(self.doc_ids) if self.doc_ids else 0.0
+
+    def memory_bytes(self) -> int:
+        num_rows = len(self.doc_ids)
+        per_row = self._vectors.itemsize * self.dim + self._doc_hash.itemsize * 16 + 1
+        if self.dtype == "int8":
+            per_row += self._scales.itemsize
+        return num_rows * per_row
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """The live rows (dead rows are dropped), for writing to a snapshot."""
+        with self._write_lock:
+            num_rows = len(self.doc_ids)
+            live = np.flatnonzero(~self._dead[:num_rows])
+            return {
+                "embedder": self.embedder.id,
+                "dtype": self.dtype,
+                "doc_ids": [self.doc_ids[row] for row in live.tolist()],
+                "vectors": self._vectors[live],
+                "scales": self._scales[live],
+                "doc_hash": self._doc_hash[live],
+            }
+
+    @classmethod
+    def from_arrays(
+        cls,
+        embedder: Embedder,
+        doc_ids: List[str],
+        vectors: np.ndarray,
+        scales: np.ndarray,
+        doc_hash: np.ndarray,
+        **kwargs,
+    ) -> "VectorIndex":
+        """
+        Build an index around existing arrays without copying them, e.g.
+        arrays memory-mapped from a snapshot. They are treated as read-only:
+        capacity equals the row count, so the first write copies them.
+        """
+        index = cls(embedder, dtype=str(vectors.dtype), **kwargs)
+        index._vectors = vectors.view(np.ndarray)
+        index._scales = scales.view(np.ndarray)
+        index._doc_hash = doc_hash.view(np.ndarray)
+        index._dead = np.zeros(len(doc_ids), dtype=bool)
+        index.doc_ids = list(doc_ids)
+        index._rows = {doc_id: row for row, doc_id in enumerate(index.doc_ids)}
+        index._publish()
+        index._maybe_train_ann()
+        return index
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def upsert_many(self, docs: Iterable[DocumentChunk]):
+        docs = list(docs)
+        hashes = [content_hash(doc.content) for doc in docs]
+        with self._write_lock:
+            changed = [
+                (doc.id, h, doc.content)
+                for doc, h in zip(docs, hashes)
+                if (row := self._rows.get(doc.id)) is None or self._doc_hash[row].tobytes() != h
+            ]
+            if not changed:
+                return
+            texts = [content for _, _, content in changed]
+            if self.pipeline:
+                vectors = self.pipeline.embed(texts, [h for _, h, _ in changed])
+            else:
+                vectors = self.embedder.embed(texts)
+            self.add_vectors([doc_id for doc_id, _, _ in changed], [h for _, h, _ in changed], vectors)
+            self.embedded += len(changed)
+
+    def add_vectors(self, doc_ids: List[str], hashes: List[bytes], vectors: np.ndarray):
+        """Store already computed embeddings (one row per doc id), replacing older rows."""
+        with self._write_lock:
+            start = len(self.doc_ids)
+            end = start + len(doc_ids)
+            if end > len(self._vectors):
+                self._grow(max(16, 2 * end))
+
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if self.dtype == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self._vectors[start:end] = np.round(vectors / scales[:, None]).astype(np.int8)
+                self._scales[start:end] = scales
+            else:
+                self._vectors[start:end] = vectors
+            self._doc_hash[start:end] = np.frombuffer(b"".join(hashes), dtype=np.uint8).reshape(-1, 16)
+
+            # Rows become visible to searches only once their vectors are written.
+            for offset, doc_id in enumerate(doc_ids):
+                old_row = self._rows.get(doc_id)
+                if old_row is not None:
+                    self._tombstone(old_row)
+                self._rows[doc_id] = start + offset
+            self.doc_ids.extend(doc_ids)
+            self.generation += 1
+
+            if self.ann is not None:
+                self.ann.add(np.arange(start, end, dtype=np.int32), vectors)
+            self._publish()
+            self._maybe_compact()
+        self._maybe_train_ann()
+
+    def delete_many(self, doc_ids: Iterable[str]):
+        with self._write_lock:
+            deleted = False
+            for doc_id in doc_ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._tombstone(row)
+                    deleted = True
+            if deleted:
+                self.generation += 1
+                self._publish()
+                self._maybe_compact()
+
+    def _publish(self):
+        """Make the current state visible to searches. Needs the write lock (or no readers yet)."""
+        num_rows = len(self.doc_ids)
+        self._snapshot = VectorSnapshot(
+            self.doc_ids, num_rows, len(self._rows), self._vectors, self._scales, self._dead, self.ann
+        )
+
+    def _tombstone(self, row: int):
+        if self._dead is self._snapshot.dead:
+            self._dead = self._dead.copy()  # the published bitmap stays as it was
+        self._dead[row] = True
+        self._num_dead += 1
+
+    def _grow(self, capacity: int):
+        num_rows = len(self.doc_ids)
+        vectors = np.zeros((capacity, self.dim), dtype=self._vectors.dtype)
+        vectors[:num_rows] = self._vectors[:num_rows]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:num_rows] = self._scales[:num_rows]
+        doc_hash = np.zeros((capacity, 16), dtype=np.uint8)
+        doc_hash[:num_rows] = self._doc_hash[:num_rows]
+        dead = np.zeros(capacity, dtype=bool)
+        dead[:num_rows] = self._dead[:num_rows]
+        self._vectors, self._scales, self._doc_hash, self._dead = vectors, scales, doc_hash, dead
+
+    def _maybe_compact(self):
+        if len(self.doc_ids) >= self.compact_min_rows and self.dead_fraction >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows. Searches keep using the old arrays until the swap."""
+        with self._write_lock:
+            num_rows = len(self.doc_ids)
+            if self._num_dead == 0:
+                return
+            live = np.flatnonzero(~self._dead[:num_rows])
+            remap = np.full(num_rows, -1, dtype=np.int32)
+            remap[live] = np.arange(len(live), dtype=np.int32)
+            capacity = max(16, len(live))
+            vectors = np.zeros((capacity, self.dim), dtype=self._vectors.dtype)
+            vectors[: len(live)] = self._vectors[live]
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[: len(live)] = self._scales[live]
+            doc_hash = np.zeros((capacity, 16), dtype=np.uint8)
+            doc_hash[: len(live)] = self._doc_hash[live]
+            doc_ids = [self.doc_ids[r] for r in live.tolist()]
+
+            self._vectors, self._scales, self._doc_hash = vectors, scales, doc_hash
+            self._dead = np.zeros(capacity, dtype=bool)
+            self._num_dead = 0
+            self._rows = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+            self.doc_ids = doc_ids
+            if self.ann is not None:
+                self.ann = self.ann.remapped(remap)
+            self.compactions += 1
+            self._publish()
+
+    # ------------------------------------------------------------------
+    # Approximate search
+    # ------------------------------------------------------------------
+
+    def _float_rows(self, rows) -> np.ndarray:
+        """Dequantized float32 vectors of `rows` (a slice or an index array)."""
+        vectors = self._vectors[rows].astype(np.float32)
+        if self.dtype == "int8":
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def _maybe_train_ann(self):
+        if (
+            self.ann_min_rows is None
+            or self._ann_training
+            or len(self) < self.ann_min_rows
+            or len(self) < 2 * self._ann_trained_rows
+        ):
+            return
+        self._ann_training = True
+        Thread(target=self.train_ann, name="ivf-training", daemon=True).start()
+
+    def train_ann(self):
+        """
+        (Re)build the IVF cells from the current rows. Runs without the write
+        lock; rows added meanwhile are assigned before the new cells go live.
+        """
+        started = time.perf_counter()
+        try:
+            with self._write_lock:
+                num_rows = len(self.doc_ids)
+                compactions = self.compactions
+                dead = self._dead[:num_rows].copy()
+            live = np.flatnonzero(~dead)
+            if len(live) == 0:
+                return
+
+            ivf = IVFIndex(self.nlist or default_nlist(len(live)))
+            rng = np.random.default_rng(ivf.seed)
+            sample = live
+            if len(live) > ivf.sample_size:
+                sample = np.sort(rng.choice(live, ivf.sample_size, replace=False))
+            ivf.train(self._float_rows(sample))
+            # Assign block by block to avoid a float32 copy of the whole matrix.
+            vectors = self._vectors
+            cells = np.concatenate([
+                ivf.assign(vectors[live[i:i + _SCORE_BLOCK_ROWS]])
+                for i in range(0, len(live), _SCORE_BLOCK_ROWS)
+            ])
+            ivf.add_assigned(live.astype(np.int32), cells)
+
+            with self._write_lock:
+                if self.compactions != compactions:
+                    return  # rows were renumbered; the next write retries
+                end = len(self.doc_ids)
+                ivf.add(np.arange(num_rows, end, dtype=np.int32), self._float_rows(slice(num_rows, end)))
+                self.ann = ivf
+                self._publish()
+                self._ann_trained_rows = len(live)
+                self.last_ann_training_seconds = time.perf_counter() - started
+        finally:
+            self._ann_training = False
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each query vector with every row, dead rows at -inf."""
+        return self._scores(queries)[1]
+
+    def _scores(self, queries: np.ndarray, snap: Optional[VectorSnapshot] = None) -> Tuple[List[str], np.ndarray]:
+        doc_ids, num_rows, _, vectors, scales, dead, _ = snap or self._snapshot
+        queries = np.asarray(queries, dtype=np.float32)
+
+        if vectors.dtype == np.float32:
+            out = queries @ vectors[:num_rows].T
+        else:
+            out = np.empty((len(queries), num_rows), dtype=np.float32)
+            for start in range(0, num_rows, _SCORE_BLOCK_ROWS):
+                end = min(start + _SCORE_BLOCK_ROWS, num_rows)
+                out[:, start:end] = queries @ vectors[start:end].astype(np.float32).T
+            if vectors.dtype == np.int8:
+                out *= scales[:num_rows]
+
+        if dead[:num_rows].any():
+            out[:, dead[:num_rows]] = -np.inf
+        return doc_ids, out
+
+    def search_vectors(
+        self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k (doc id, score) per query vector. Uses the IVF cells when they
+        exist and `nprobe` (default: self.nprobe) is below their count.
+        """
+        snap = self._snapshot  # read once: writes publish a new one
+        nprobe = nprobe or self.nprobe
+        if snap.ann is not None and nprobe < snap.ann.nlist:
+            return self._search_ann(snap, np.asarray(queries, dtype=np.float32), k, nprobe)
+
+        doc_ids, scores = self._scores(queries, snap)
+        k = min(k, snap.num_live, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in range(len(scores))]
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_top in zip(scores, top):
+            row_top = row_top[np.argsort(-row_scores[row_top], kind="stable")]
+            results.append([
+                (doc_ids[i], float(row_scores[i])) for i in row_top.tolist() if row_scores[i] > -np.inf
+            ])
+        return results
+
+    def _search_ann(
+        self, snap: VectorSnapshot, queries: np.ndarray, k: int, nprobe: int
+    ) -> List[List[Tuple[str, float]]]:
+        doc_ids, num_rows, _, vectors, scales, dead, ann = snap
+        results = []
+        for query, cells in zip(queries, ann.probe(queries, nprobe)):
+            rows = ann.candidates(cells)
+            rows = rows[rows < num_rows]
+            rows = rows[~dead[rows]]
+            if len(rows) == 0:
+                results.append([])
+                continue
+
+            scores = vectors[rows].astype(np.float32, copy=False) @ query
+            if vectors.dtype == np.int8:
+                scores *= scales[rows]
+            top_k = min(k, len(rows))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results.append([(doc_ids[rows[i]], float(scores[i])) for i in top.tolist()])
+        return results
+
+    def search_many(self, queries: List[str], k: int = 10) -> List[List[Tuple[str, float]]]:
+        return self.search_vectors(self.embedder.embed(queries), k)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (doc id, cosine similarity) for `query`."""
+        return self.search_many([query], k)[0]
@@ -0,0 +1,296 @@
+"""
+Append-only write-ahead log for document and profile mutations.
+
+Records are JSON payloads framed as::
+
+    <u32 payload length> <u64 lsn> <u32 crc32(payload)> <payload>
+
+and written to size-bounded segment files named after their first LSN. A
+single flusher thread group-commits: every writer appends its frame to a shared
+buffer and blocks until the flusher has written and fsynced a batch containing
+it, so concurrent writers share one fsync.
+
+Startup replays the records newer than the last snapshot checkpoint. A torn or
+corrupted tail (e.g. from a crash mid-write) ends replay and is truncated.
+
+A record whose application failed is never marked applied: it pins the
+checkpoint, so it stays in the log and is applied again by the next replay
+rather than being lost.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<IQI")
+SEGMENT_PREFIX = "wal-"
+SEGMENT_SUFFIX = ".log"
+
+
+class WALError(Exception):
+    """Raised when a record could not be made durable."""
+
+
+def _segment_name(first_lsn: int) -> str:
+    return f"{SEGMENT_PREFIX}{first_lsn:016d}{SEGMENT_SUFFIX}"
+
+
+def _read_frames(path: str) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (offset_after_frame, lsn, payload) until EOF or the first damaged frame."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, lsn, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        offset = start + length
+        yield offset, lsn, payload
+
+
+class WriteAheadLog:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        group_commit_ms: float = 2.0,
+        fsync: bool = True,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.group_commit_seconds = group_commit_ms / 1000
+        self.fsync = fsync
+
+        self._cond = threading.Condition()
+        self._buffer: List[bytes] = []
+        self._next_lsn = 1
+        self._durable_lsn = 0
+        self._unapplied: Set[int] = set()
+        self._failed: Set[int] = set()  # records whose apply raised; pinned until restart
+        self._error: Optional[BaseException] = None
+        self._closed = False
+
+        self._file = None
+        self._segment_first_lsn = 0
+        self._flusher: Optional[threading.Thread] = None
+
+        self.replay_seconds = 0.0
+        self.replayed_records = 0
+        self.appended_records = 0
+        self.fsyncs = 0
+
+    # ------------------------------------------------------------------
+    # Startup
+    # ------------------------------------------------------------------
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                first = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((first, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def replay(self, after_lsn: int, apply: Callable[[Dict[str, Any]], None]) -> int:
+        """
+        Apply, in order, every record with lsn > `after_lsn`, then open the log
+        for appending. Must be called once, before any append().
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+        last_lsn = after_lsn
+        replayed = 0
+
+        segments = self._segments()
+        for i, (_, path) in enumerate(segments):
+            valid_end = 0
+            for valid_end, lsn, payload in _read_frames(path):
+                last_lsn = max(last_lsn, lsn)
+                if lsn > after_lsn:
+                    apply(json.loads(payload))
+                    replayed += 1
+
+            if valid_end < os.path.getsize(path):
+                logger.warning("Truncating damaged WAL tail in %s at byte %d", path, valid_end)
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+                # Anything after a damaged frame is unreachable; drop later segments.
+                for _, later in segments[i + 1:]:
+                    os.remove(later)
+                break
+
+        self.replay_seconds = time.perf_counter() - started
+        self.replayed_records = replayed
+        self._next_lsn = last_lsn + 1
+        self._durable_lsn = last_lsn
+        self._open_segment(self._next_lsn)
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._flusher.start()
+        return replayed
+
+    def _open_segment(self, first_lsn: int):
+        if self._file is not None:
+            self._file.close()
+        self._segment_first_lsn = first_lsn
+        self._file = open(os.path.join(self.directory, _segment_name(first_lsn)), "ab")
+
+    # ------------------------------------------------------------------
+    # Appending
+    # ------------------------------------------------------------------
+
+    @property
+    def last_lsn(self) -> int:
+        return self._next_lsn - 1
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Append `record` and block until it is durable. Returns its LSN."""
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        crc = zlib.crc32(payload)
+
+        with self._cond:
+            if self._closed:
+                raise WALError("Write-ahead log is closed")
+            lsn = self._next_lsn
+            self._next_lsn += 1
+            self._unapplied.add(lsn)
+            self._buffer.append(_HEADER.pack(len(payload), lsn, crc) + payload)
+            self._cond.notify_all()
+
+            while self._durable_lsn < lsn and self._error is None:
+                self._cond.wait()
+            if self._durable_lsn < lsn:
+                self._unapplied.discard(lsn)
+                raise WALError(f"Failed to persist WAL record: {self._error}")
+
+        return lsn
+
+    def mark_applied(self, lsn: int) -> None:
+        with self._cond:
+            self._unapplied.discard(lsn)
+
+    def mark_failed(self, lsn: int) -> None:
+        """Keep `lsn` from being checkpointed: its record is applied again on the next replay."""
+        logger.error("WAL record %d could not be applied; it is kept for replay on restart", lsn)
+        with self._cond:
+            self._failed.add(lsn)
+
+    @contextmanager
+    def record(self, record: Dict[str, Any]) -> Iterator[int]:
+        """
+        Durably log `record`, then run the body that applies it. The record only
+        becomes eligible for checkpointing once the body has finished without
+        raising.
+        """
+        lsn = self.append(record)
+        try:
+            yield lsn
+        except BaseException:
+            self.mark_failed(lsn)
+            raise
+        self.mark_applied(lsn)
+
+    def applied_lsn(self) -> int:
+        """Highest LSN such that it and every earlier record have been applied."""
+        with self._cond:
+            if self._unapplied:
+                return min(self._unapplied) - 1
+            return self._next_lsn - 1
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer and self._closed:
+                    return
+
+            # Give concurrent writers a moment to join this commit group.
+            if self.group_commit_seconds:
+                time.sleep(self.group_commit_seconds)
+
+            with self._cond:
+                frames, self._buffer = self._buffer, []
+                upto = self._next_lsn - 1
+
+            try:
+                self._file.write(b"".join(frames))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                    self.fsyncs += 1
+                if self._file.tell() >= self.segment_bytes:
+                    self._open_segment(upto + 1)
+            except OSError as e:
+                logger.error("WAL write failed: %s", e)
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                self._durable_lsn = upto
+                self.appended_records += len(frames)
+                self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Checkpoints
+    # ------------------------------------------------------------------
+
+    def checkpoint(self, lsn: int) -> int:
+        """
+        Drop segments whose records are all <= `lsn` (i.e. covered by a
+        snapshot). The active segment is rotated first so it can be dropped too.
+        Returns the number of segments removed.
+        """
+        with self._cond:
+            if self._buffer or self._durable_lsn != self._next_lsn - 1:
+                rotate = False  # a commit is in flight; rotate next time
+            else:
+                rotate = self._durable_lsn <= lsn and self._file.tell() > 0
+            if rotate:
+                self._open_segment(self._next_lsn)
+
+        removed = 0
+        segments = self._segments()
+        for (first, path), (next_first, _) in zip(segments, segments[1:]):
+            if next_first - 1 <= lsn:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(path) for _, path in self._segments())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "last_lsn": self.last_lsn,
+            "size_bytes": self.size_bytes(),
+            "segments": len(self._segments()),
+            "appended_records": self.appended_records,
+            "fsyncs": self.fsyncs,
+            "records_per_fsync": round(self.appended_records / self.fsyncs, 2) if self.fsyncs else 0.0,
+            "replayed_records": self.replayed_records,
+            "replay_seconds": round(self.replay_seconds, 4),
+            "failed_records": len(self._failed),
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
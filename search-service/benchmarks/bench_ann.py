@@ -0,0 +1,89 @@
+"""
+Recall@k vs. QPS of IVF vector search compared with exact search.
+
+Usage (from search-service/):
+
+    python -m benchmarks.bench_ann --size 200000 --nprobe 1 2 4 8 16 32 64
+
+The synthetic corpus is a mixture of Gaussian clusters on the unit sphere
+(closer to real embeddings than uniform noise, which has no neighbourhood
+structure to exploit); queries are perturbed held-out points of it.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.embeddings import HashingEmbedder
+from app.vector_index import DTYPES, VectorIndex
+
+_ADD_BATCH = 50_000
+
+
+def clustered_corpus(n: int, dim: int, clusters: int, spread: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, _ADD_BATCH):
+        m = min(_ADD_BATCH, n - start)
+        block = centers[rng.integers(0, clusters, m)]
+        block += spread * rng.standard_normal((m, dim), dtype=np.float32)
+        out[start:start + m] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return out
+
+
+def _qps(index: VectorIndex, queries: np.ndarray, k: int, nprobe: int):
+    results = []
+    t0 = time.perf_counter()
+    for q in queries:
+        results.append(index.search_vectors(q[None, :], k, nprobe=nprobe)[0])
+    return len(queries) / (time.perf_counter() - t0), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--dtype", default="float32", choices=DTYPES)
+    parser.add_argument("--clusters", type=int, default=2_000)
+    parser.add_argument("--spread", type=float, default=1.0)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = clustered_corpus(args.size + args.queries, args.dim, args.clusters, args.spread)
+    queries, corpus = corpus[:args.queries], corpus[args.queries:]
+
+    index = VectorIndex(HashingEmbedder(dim=args.dim), dtype=args.dtype, nlist=args.nlist)
+    for start in range(0, len(corpus), _ADD_BATCH):
+        block = corpus[start:start + _ADD_BATCH]
+        index.add_vectors(
+            [f"doc-{start + i}" for i in range(len(block))],
+            [(start + i).to_bytes(16, "little") for i in range(len(block))],
+            block,
+        )
+    del corpus
+
+    t0 = time.perf_counter()
+    index.train_ann()
+    nlist = index.ann.nlist
+    print(f"{args.size} chunks, dim {args.dim}, {args.dtype}: "
+          f"trained {nlist} IVF cells in {time.perf_counter() - t0:.1f}s")
+
+    exact_qps, exact = _qps(index, queries, args.k, nprobe=nlist)
+    print(f"{'nprobe':>7} {'recall@' + str(args.k):>10} {'QPS':>8} {'speedup':>8}")
+    print(f"{'exact':>7} {1.0:>10.3f} {exact_qps:>8.0f} {1.0:>7.1f}x")
+    for nprobe in args.nprobe:
+        if nprobe >= nlist:
+            continue
+        qps, approx = _qps(index, queries, args.k, nprobe)
+        found = sum(len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approx, exact))
+        recall = found / sum(len(e) for e in exact)
+        print(f"{nprobe:>7} {recall:>10.3f} {qps:>8.0f} {qps / exact_qps:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+ID token verification throughput and event loop stalls, offline.
+
+Usage (from search-service/):
+
+    python -m benchmarks.bench_auth --users 1000 --requests 20000 --concurrency 64
+
+Tokens come from a FakeIssuer, so nothing talks to Google. Each request picks a
+user's token (a few users send most requests, as with real clients) and goes
+through the same path as get_current_user: the claims cache, then signature
+verification on a cache miss. Runs compare verifying on the event loop
+against verifying in the thread pool, with and without the cache; "max stall"
+is the longest the event loop went without running a 1 ms ticker.
+
+To load-test a running service instead, start it with
+AUTH_FAKE_ISSUER_KEY_PATH=<file> and mint tokens from the same file:
+
+    python -m benchmarks.bench_auth --key-path <file> --mint teacher1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from app.tokens import CertificateRefresher, FakeIssuer, TokenCache, TokenVerifier
+
+_PROJECT_ID = os.environ.get("FIREBASE_PROJECT_ID", "your-gcp-project-id")
+
+
+async def _ticker(stop: asyncio.Event, stalls: list):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last - 0.001)
+        last = now
+
+
+async def run(tokens, verifier, cache, requests: int, concurrency: int, offload: bool):
+    rng = random.Random(1)
+    weights = [1 / rank for rank in range(1, len(tokens) + 1)]
+    picks = iter(rng.choices(tokens, weights, k=requests))
+
+    async def current_user(token):
+        claims = cache.get(token)
+        if claims is None:
+            claims = await asyncio.to_thread(verifier.verify, token) if offload else verifier.verify(token)
+            cache.put(token, claims)
+        return claims
+
+    async def client():
+        for token in picks:
+            await current_user(token)
+
+    stop, stalls = asyncio.Event(), []
+    ticker = asyncio.create_task(_ticker(stop, stalls))
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return requests / elapsed, max(stalls, default=0.0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--key-path", default=None, help="fake issuer key file (default: a temporary one)")
+    parser.add_argument("--mint", metavar="UID", help="print a token for UID and exit")
+    parser.add_argument("--role", default=None, help="role claim of minted tokens")
+    args = parser.parse_args()
+
+    key_path = args.key_path or os.path.join(tempfile.mkdtemp(), "issuer.pem")
+    issuer = FakeIssuer(_PROJECT_ID, key_path)
+    extra = {"role": args.role} if args.role else {}
+    if args.mint:
+        print(issuer.mint(args.mint, **extra))
+        return
+
+    certificates = CertificateRefresher(issuer.certificates)
+    certificates.refresh()
+    verifier = TokenVerifier(_PROJECT_ID, certificates)
+    tokens = [issuer.mint(f"user{i}", **extra) for i in range(args.users)]
+
+    started = time.perf_counter()
+    for token in tokens[:200]:
+        verifier.verify(token)
+    verify_us = (time.perf_counter() - started) / min(200, len(tokens)) * 1e6
+    cache = TokenCache()
+    for token in tokens:
+        cache.put(token, verifier.verify(token))
+    started = time.perf_counter()
+    for token in tokens:
+        cache.get(token)
+    hit_us = (time.perf_counter() - started) / len(tokens) * 1e6
+    print(f"signature check {verify_us:.0f} us, cache hit {hit_us:.1f} us")
+
+    print(f"{args.requests} requests from {args.users} users, {args.concurrency} concurrent")
+    print(f"{'verify on':>12} {'cache':>6} {'req/s':>9} {'max stall ms':>13}")
+    for offload in (False, True):
+        for cached in (False, True):
+            cache = TokenCache(max_entries=10_000 if cached else 0)
+            rate, stall_ms = asyncio.run(run(tokens, verifier, cache, args.requests, args.concurrency, offload))
+            print(f"{'threads' if offload else 'event loop':>12} {'yes' if cached else 'no':>6} "
+                  f"{rate:>9.0f} {stall_ms:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
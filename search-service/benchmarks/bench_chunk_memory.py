@@ -0,0 +1,89 @@
+"""
+Memory per stored chunk: a dict of DocumentChunk models vs. the columnar ChunkStore, with and without text compression.
+
+Usage (from search-service/):
+
+    python -m benchmarks.bench_chunk_memory --size 100000 --content-chars 800
+
+Chunks come from benchmarks.corpus. Memory is what tracemalloc sees retained
+by the store after ingest, divided by the number of chunks; the text itself
+(about --content-chars bytes per chunk) is counted in all of them.
+
+Reads are timed twice over the same sample of chunks: "cold" with an empty
+decompressed-text cache, "hot" once every sampled chunk is cached.
+"""
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from app.chunks import ChunkStore, text_cache
+
+from .corpus import synthetic_chunks
+
+_FREEZE_EVERY = 1_000  # chunks per write batch (the index freezes its store once per batch)
+
+
+def measure(build, n: int, content_chars: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    store = build(synthetic_chunks(n, content_chars))
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return store, retained / n, elapsed
+
+
+def build_dict(chunks):
+    return {doc.id: doc for doc in chunks}
+
+
+def build_columnar(chunks, compress=False):
+    store = ChunkStore(compress=compress)
+    for i, doc in enumerate(chunks, 1):
+        store[doc.id] = doc
+        if i % _FREEZE_EVERY == 0:
+            store.freeze()
+    store.freeze()
+    return store
+
+
+def build_compressed(chunks):
+    return build_columnar(chunks, compress=True)
+
+
+def time_reads(store, ids) -> float:
+    started = time.perf_counter()
+    for doc_id in ids:
+        store[doc_id]
+    return (time.perf_counter() - started) / len(ids) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--content-chars", type=int, default=800)
+    parser.add_argument("--reads", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{args.size} chunks, {args.content_chars} chars of text each")
+    print(f"{'store':>10} {'bytes/chunk':>12} {'overhead':>9} {'ingest s':>9} {'cold us':>8} {'hot us':>7}")
+    builds = (("dict", build_dict), ("columnar", build_columnar), ("compressed", build_compressed))
+    for name, build in builds:
+        store, per_chunk, elapsed = measure(build, args.size, args.content_chars)
+        ids = random.Random(1).sample(list(store), min(args.reads, len(store)))
+        text_cache.clear()
+        cold_us = time_reads(store, ids)
+        hot_us = time_reads(store, ids)
+        print(f"{name:>10} {per_chunk:>12.0f} {per_chunk - args.content_chars:>9.0f} "
+              f"{elapsed:>9.2f} {cold_us:>8.1f} {hot_us:>7.1f}")
+        del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+BM25Index build, update and query latency at several corpus sizes, with peak RSS, as JSON.
+
+Usage (from search-service/):
+
+    python -m benchmarks.bench_index --sizes 1000 10000 100000 --output baseline.json
+    python -m benchmarks.bench_index --baseline baseline.json --output run.json
+    python -m benchmarks.bench_index --current run.json --baseline baseline.json
+
+For each size, a fresh process builds an index from synthetic lecture chunks
+(benchmarks.corpus) and measures:
+
+- bulk_upsert_us: one upsert_many of all the chunks, per chunk;
+- upsert_one_us: --ops further chunks upserted one at a time into the full
+  index, each published on its own, as single-document API writes are;
+- search_p50_ms / search_p99_ms / search_mean_ms: --queries queries of one to
+  three course terms, k=10;
+- delete_one_us: --ops chunks deleted one at a time (compactions included);
+- corpus_rss_mb / peak_rss_mb: the process's peak resident memory once the
+  chunks are generated, and at the end. The difference is what indexing took.
+
+With --baseline, each metric is compared to the baseline's for the same
+size; every metric is lower-is-better. The exit status is 1 if any got worse
+by more than --threshold (0.2 = 20%), so CI can gate on it. With --current,
+an existing run is compared instead of measuring a new one.
+"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.index import BM25Index, Vocabulary
+
+from .corpus import DEFAULT_CONTENT_CHARS, DEFAULT_VOCAB_SIZE, synthetic_chunks, synthetic_queries
+
+DEFAULT_THRESHOLD = 0.2
+METRICS = (
+    "bulk_upsert_us",
+    "upsert_one_us",
+    "search_p50_ms",
+    "search_p99_ms",
+    "search_mean_ms",
+    "delete_one_us",
+    "corpus_rss_mb",
+    "peak_rss_mb",
+)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def run_size(
+    size: int,
+    ops: int = 1000,
+    queries: int = 1000,
+    content_chars: int = DEFAULT_CONTENT_CHARS,
+    vocab_size: int = DEFAULT_VOCAB_SIZE,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """Every metric for one corpus size. Run it in a fresh process for a meaningful peak RSS."""
+    chunks = list(synthetic_chunks(size + ops, content_chars, seed, vocab_size))
+    texts = synthetic_queries(queries, seed, vocab_size)
+    corpus_rss = peak_rss_mb()
+
+    index = BM25Index(vocabulary=Vocabulary())
+    started = time.perf_counter()
+    index.upsert_many(chunks[:size])
+    bulk = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for doc in chunks[size:]:
+        index.upsert(doc)
+    upsert_one = time.perf_counter() - started
+
+    for query in texts[:10]:
+        index.search(query, k=10)
+    latencies = []
+    for query in texts:
+        started = time.perf_counter()
+        index.search(query, k=10)
+        latencies.append(time.perf_counter() - started)
+
+    doomed = random.Random(seed).sample([doc.id for doc in chunks], ops)
+    started = time.perf_counter()
+    for doc_id in doomed:
+        index.delete(doc_id)
+    delete_one = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "bulk_upsert_us": round(bulk / size * 1e6, 2),
+        "upsert_one_us": round(upsert_one / ops * 1e6, 2),
+        "search_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "search_p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "search_mean_ms": round(float(latencies_ms.mean()), 3),
+        "delete_one_us": round(delete_one / ops * 1e6, 2),
+        "corpus_rss_mb": round(corpus_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run(sizes: List[int], **params: Any) -> Dict[str, Any]:
+    """A full report: parameters, environment and the metrics of every size."""
+    results = {}
+    for size in sizes:
+        # One process per size, so each peak RSS is that size's alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results[str(size)] = pool.submit(run_size, size, **params).result()
+        print(format_row(size, results[str(size)]), flush=True)
+    return {
+        "benchmark": "bench_index",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "params": {"sizes": sizes, **params},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD
+) -> List[Tuple[str, str, float, float, float, bool]]:
+    """
+    (size, metric, baseline, current, current / baseline, regressed) for every
+    metric both reports measured at the same size.
+    """
+    rows = []
+    for size, metrics in current["results"].items():
+        before = baseline["results"].get(size)
+        if before is None:
+            continue
+        for metric in METRICS:
+            if metric not in metrics or metric not in before:
+                continue
+            old, new = before[metric], metrics[metric]
+            ratio = new / old if old else (1.0 if not new else float("inf"))
+            rows.append((size, metric, old, new, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def format_row(size: int, metrics: Dict[str, float]) -> str:
+    return f"{size:>8} " + " ".join(f"{metrics[m]:>{len(m)}}" for m in METRICS)
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--ops", type=int, default=1_000, help="single upserts and deletes per size")
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--content-chars", type=int, default=DEFAULT_CONTENT_CHARS)
+    parser.add_argument("--vocab-size", type=int, default=DEFAULT_VOCAB_SIZE, help="distinct words per course")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare against this report; exit 1 on regressions")
+    parser.add_argument("--current", help="compare this report instead of running the benchmark")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before a metric counts as regressed (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.current:
+        if not args.baseline:
+            parser.error("--current needs --baseline")
+        report = _load(args.current)
+    else:
+        print(f"{'chunks':>8} " + " ".join(METRICS))
+        report = run(
+            args.sizes,
+            ops=args.ops,
+            queries=args.queries,
+            content_chars=args.content_chars,
+            vocab_size=args.vocab_size,
+            seed=args.seed,
+        )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+        else:
+            print(json.dumps(report, indent=2))
+
+    if not args.baseline:
+        return
+    baseline = _load(args.baseline)
+    params = {k: v for k, v in report["params"].items() if k != "sizes"}
+    base_params = {k: v for k, v in baseline["params"].items() if k != "sizes"}
+    if params != base_params:
+        print(f"warning: parameters differ from the baseline's: {params} vs {base_params}")
+    rows = compare(report, baseline, args.threshold)
+    print(f"\n{'chunks':>8} {'metric':>15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for size, metric, old, new, ratio, regressed in rows:
+        print(f"{size:>8} {metric:>15} {old:>10} {new:>10} {(ratio - 1) * 100:>+7.1f}%"
+              + ("  REGRESSED" if regressed else ""))
+    regressions = sum(row[-1] for row in rows)
+    if not rows:
+        print("no sizes in common with the baseline")
+    elif regressions:
+        print(f"{regressions} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    else:
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
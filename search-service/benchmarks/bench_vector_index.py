@@ -0,0 +1,93 @@
+"""
+Memory and latency of exact VectorIndex search.
+
+Usage (from search-service/):
+
+    python -m benchmarks.bench_vector_index --sizes 10000 100000 1000000
+
+Index contents are random unit vectors, so corpus size is not limited by
+embedding speed; the embedder's own throughput is measured separately on
+synthetic text.
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.embeddings import HashingEmbedder
+from app.vector_index import DTYPES, VectorIndex
+
+_ADD_BATCH = 50_000
+
+
+def _random_unit(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _build(size: int, dim: int, dtype: str, rng: np.random.Generator) -> VectorIndex:
+    index = VectorIndex(HashingEmbedder(dim=dim), dtype=dtype)
+    for start in range(0, size, _ADD_BATCH):
+        n = min(_ADD_BATCH, size - start)
+        ids = [f"doc-{start + i}" for i in range(n)]
+        hashes = [i.to_bytes(16, "little") for i in range(start, start + n)]
+        index.add_vectors(ids, hashes, _random_unit(rng, n, dim))
+    return index
+
+
+def _latency_ms(index: VectorIndex, queries: np.ndarray, batch: int, k: int) -> list:
+    timings = []
+    for start in range(0, len(queries), batch):
+        q = queries[start:start + batch]
+        t0 = time.perf_counter()
+        index.search_vectors(q, k)
+        timings.append((time.perf_counter() - t0) * 1000 / len(q))
+    return timings
+
+
+def bench_search(sizes, dtypes, dim: int, num_queries: int, k: int):
+    rng = np.random.default_rng(0)
+    queries = _random_unit(rng, num_queries, dim)
+    print(f"{'chunks':>9} {'dtype':>8} {'MiB':>9} {'p50 ms':>8} {'p95 ms':>8} {'batch32 ms/q':>13}")
+    for size in sizes:
+        for dtype in dtypes:
+            index = _build(size, dim, dtype, rng)
+            single = _latency_ms(index, queries, 1, k)
+            batched = _latency_ms(index, queries, 32, k)
+            print(
+                f"{size:>9} {dtype:>8} {index.memory_bytes() / 2**20:>9.1f} "
+                f"{np.percentile(single, 50):>8.2f} {np.percentile(single, 95):>8.2f} "
+                f"{np.median(batched):>13.3f}"
+            )
+            del index
+
+
+def bench_embedder(dim: int, num_texts: int = 2000, words_per_text: int = 150):
+    rnd = random.Random(0)
+    vocabulary = [f"term{i}" for i in range(20_000)]
+    texts = [" ".join(rnd.choices(vocabulary, k=words_per_text)) for _ in range(num_texts)]
+    embedder = HashingEmbedder(dim=dim)
+    t0 = time.perf_counter()
+    embedder.embed(texts)
+    elapsed = time.perf_counter() - t0
+    print(f"HashingEmbedder(dim={dim}): {num_texts / elapsed:,.0f} chunks/s ({words_per_text} words each)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dtypes", nargs="+", default=list(DTYPES), choices=DTYPES)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    bench_embedder(args.dim)
+    bench_search(args.sizes, args.dtypes, args.dim, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Deterministic synthetic lecture chunks and queries for the benchmarks.
+
+Chunks look like ingested lecture chunks: a few courses and sources, ISO
+timestamps, a small metadata dict and a headings list. Text is drawn
+Zipf-style from a per-course vocabulary (common words first, then course
+terms and made-up identifiers), so term statistics and compressibility are
+about those of real lecture text rather than of uniformly random words.
+
+The same arguments always produce the same chunks and queries.
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from app.models import DocumentChunk
+
+_COMMON = ("the of and a to in is that for it as with on be by this we are or an at which from can "
+           "if each its one all so".split())
+_TOPICS = ("recursion stack heap sort merge graph tree hash table index query vector matrix proof lemma "
+           "pointer array list node edge vertex cost bound input output loop invariant base case call "
+           "frame memory cache page process thread lock queue search key value order time space").split()
+
+DEFAULT_VOCAB_SIZE = 600
+DEFAULT_CONTENT_CHARS = 800
+DEFAULT_COURSES = 20
+
+
+def vocabulary(rng: random.Random, size: int = DEFAULT_VOCAB_SIZE) -> Tuple[List[str], List[float]]:
+    """Common words first, then course terms and made-up identifiers, weighted by 1/rank."""
+    words = _COMMON + rng.sample(_TOPICS, len(_TOPICS))
+    while len(words) < size:
+        words.append("".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 10))))
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+
+def _course_vocabularies(seed: int, courses: int, vocab_size: int):
+    return [vocabulary(random.Random(seed * 100 + c), vocab_size) for c in range(courses)]
+
+
+def synthetic_chunks(
+    n: int,
+    content_chars: int = DEFAULT_CONTENT_CHARS,
+    seed: int = 0,
+    vocab_size: int = DEFAULT_VOCAB_SIZE,
+    courses: int = DEFAULT_COURSES,
+    start: int = 0,
+) -> Iterator[DocumentChunk]:
+    """
+    Chunks `start` .. `start + n - 1` as the API receives them (parsed from
+    JSON, so no strings are shared). Ids are unique per position.
+    """
+    rng = random.Random(seed * 1_000_003 + start)
+    vocabularies = _course_vocabularies(seed, courses, vocab_size)
+    epoch = datetime(2024, 9, 1)
+    for i in range(start, start + n):
+        course = f"course-{i % courses}"
+        words, weights = vocabularies[i % courses]
+        text = " ".join(rng.choices(words, weights, k=content_chars // 4))
+        created = (epoch + timedelta(seconds=i)).isoformat()
+        yield DocumentChunk.model_validate({
+            "id": f"{course}-chunk-{i:08d}",
+            "course_id": "".join(course),
+            "source": "".join(f"lecture-{(i // 40) % 200:03d}.pdf"),
+            "chunk_index": i % 40,
+            "title": "".join(f"Lecture {(i // 40) % 200}"),
+            "headings": [f"Section {i % 7}", f"Part {i % 3}"],
+            "content": text[:content_chars],
+            "metadata": {"page": i % 30, "lang": "en"},
+            "created_at": created,
+            "updated_at": created,
+        })
+
+
+def synthetic_queries(
+    n: int,
+    seed: int = 0,
+    vocab_size: int = DEFAULT_VOCAB_SIZE,
+    courses: int = DEFAULT_COURSES,
+    terms: Tuple[int, int] = (1, 4),
+) -> List[str]:
+    """Queries of 1-3 course terms (no common words), drawn with the chunks' Zipf weights."""
+    rng = random.Random(seed + 7)
+    vocabularies = _course_vocabularies(seed, courses, vocab_size)
+    skip = len(_COMMON)
+    queries = []
+    for i in range(n):
+        words, weights = vocabularies[i % courses]
+        queries.append(" ".join(rng.choices(words[skip:], weights[skip:], k=rng.randrange(*terms))))
+    return queries
@@ -0,0 +1,24 @@
+from benchmarks.bench_index import METRICS, compare, run_size
+from benchmarks.corpus import synthetic_chunks, synthetic_queries
+
+
+def test_synthetic_corpus_is_deterministic_and_configurable():
+    first = [doc.content for doc in synthetic_chunks(5, content_chars=200, vocab_size=100, seed=3)]
+    assert first == [doc.content for doc in synthetic_chunks(5, content_chars=200, vocab_size=100, seed=3)]
+    assert first != [doc.content for doc in synthetic_chunks(5, content_chars=200, vocab_size=100, seed=4)]
+    assert all(len(text) <= 200 for text in first)
+    assert len({doc.id for doc in synthetic_chunks(50, content_chars=40)}) == 50
+    assert synthetic_queries(3, seed=1) == synthetic_queries(3, seed=1)
+
+
+def test_run_reports_every_metric_and_compare_flags_regressions():
+    metrics = run_size(200, ops=20, queries=20, content_chars=200)
+    assert set(metrics) == set(METRICS)
+    assert metrics["peak_rss_mb"] >= metrics["corpus_rss_mb"] > 0
+
+    baseline = {"results": {"200": metrics, "500": metrics}}
+    slower = dict(metrics, search_p99_ms=metrics["search_p99_ms"] * 1.5)
+    rows = compare({"results": {"200": slower, "1000": slower}}, baseline, threshold=0.2)
+    assert len(rows) == len(METRICS)  # only the size both reports have
+    assert [row[1] for row in rows if row[-1]] == ["search_p99_ms"]
+    assert not any(row[-1] for row in compare({"results": {"200": slower}}, baseline, threshold=0.6))
@@ -94,3 +94,221 @@ def test_bm25_ranks_relevant_higher():
     # Most relevant should be b, irrelevant should be last
     assert ids[0] == "b"
     assert ids[-1] == "c"
+
+
+def _bm25s_reference(contents, query, k):
+    import bm25s
+    import Stemmer
+
+    stemmer = Stemmer.Stemmer("english")
+    retriever = bm25s.BM25()
+    retriever.index(bm25s.tokenize(contents, stopwords="en", stemmer=stemmer, show_progress=False), show_progress=False)
+    indices, scores = retriever.retrieve(
+        bm25s.tokenize(query, stopwords="en", stemmer=stemmer, show_progress=False),
+        k=k,
+        show_progress=False,
+    )
+    return {int(i): float(s) for i, s in zip(indices[0], scores[0])}
+
+
+def test_incremental_scores_match_full_bm25s_rebuild():
+    contents = [
+        "recursion is a function calling itself",
+        "big-O notation describes asymptotic running time",
+        "the midterm covers recursion and big-O",
+        "hash tables give constant time lookups on average",
+    ]
+    idx = BM25Index()
+    for i, content in enumerate(contents):
+        idx.upsert(_make_model_instance(DocumentChunk, id=str(i), content=content))
+
+    expected = _bm25s_reference(contents, "recursion running time", k=4)
+    got = {int(d.id): s for d, s in idx.search("recursion running time", k=4)}
+
+    assert got.keys() == expected.keys()
+    for i, score in expected.items():
+        assert abs(got[i] - score) < 1e-5
+
+
+def test_upsert_replaces_content_and_delete_removes_doc():
+    idx = BM25Index()
+    idx.upsert(_make_model_instance(DocumentChunk, id="a", content="binary search trees"))
+    idx.upsert(_make_model_instance(DocumentChunk, id="b", content="dynamic programming"))
+    idx.upsert(_make_model_instance(DocumentChunk, id="c", content="graph traversal"))
+
+    idx.upsert(_make_model_instance(DocumentChunk, id="a", content="graph coloring"))
+    assert idx.search("binary", k=1)[0][1] == 0.0
+    assert idx.search("coloring", k=1)[0][0].id == "a"
+
+    idx.delete("a")
+    ids = [d.id for d, _ in idx.search("graph", k=10)]
+    assert ids == ["c", "b"]
+
+    # The swapped-in row must still be addressable after the delete.
+    idx.delete("c")
+    assert [d.id for d, _ in idx.search("dynamic", k=10)] == ["b"]
+
+
+def test_upsert_many_defers_refresh_until_search_when_lazy():
+    idx = BM25Index(lazy=True)
+    docs = [
+        _make_model_instance(DocumentChunk, id=f"d{i}", content=f"lecture {i} on sorting algorithms")
+        for i in range(5)
+    ]
+    idx.upsert_many(docs)
+    assert idx.dirty
+
+    results = idx.search("sorting", k=10)
+    assert not idx.dirty
+    assert {d.id for d, _ in results} == {f"d{i}" for i in range(5)}
+
+    # Deletes are tombstones: nothing to recompile.
+    idx.delete_many(["d0", "d1"])
+    assert not idx.dirty
+    assert {d.id for d, _ in idx.search("sorting", k=10)} == {"d2", "d3", "d4"}
+
+
+def test_metadata_only_update_skips_tokenization():
+    idx = BM25Index()
+    doc = _make_model_instance(DocumentChunk, id="a", content="memoization and recursion")
+    idx.upsert(doc)
+    assert idx.token_cache_stats()["misses"] == 1
+
+    idx.upsert(doc.model_copy(update={"title": "Renamed", "metadata": {"week": 3}}))
+    stats = idx.token_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert idx.search("recursion", k=1)[0][0].title == "Renamed"
+
+    # Same content under a new id reuses the cached token ids.
+    idx.upsert(_make_model_instance(DocumentChunk, id="b", content="memoization and recursion"))
+    assert idx.token_cache_stats()["misses"] == 1
+    assert {d.id for d, _ in idx.search("memoization", k=2)} == {"a", "b"}
+
+
+def test_tombstoned_docs_are_masked_and_compaction_drops_them():
+    idx = BM25Index(compact_min_rows=1_000_000)  # compact manually below
+    idx.upsert_many(
+        _make_model_instance(DocumentChunk, id=f"d{i}", content=f"week {i} semester review")
+        for i in range(10)
+    )
+
+    idx.delete_many([f"d{i}" for i in range(6)])
+    assert idx.dead_fraction == 0.6
+
+    # Zero-score filler must not resurrect tombstoned chunks either.
+    results = idx.search("semester unrelated", k=10)
+    assert {d.id for d, _ in results} == {"d6", "d7", "d8", "d9"}
+
+    idx.compact()
+    assert idx.dead_fraction == 0.0
+    assert idx.doc_ids == ["d6", "d7", "d8", "d9"]
+    assert {d.id for d, _ in idx.search("semester", k=10)} == {"d6", "d7", "d8", "d9"}
+
+    # Re-adding a deleted id after compaction works like a fresh insert.
+    idx.upsert(_make_model_instance(DocumentChunk, id="d0", content="week zero semester review"))
+    assert idx.search("zero", k=1)[0][0].id == "d0"
+
+
+def test_compaction_runs_in_background_past_threshold():
+    idx = BM25Index(compact_threshold=0.5, compact_min_rows=4)
+    idx.upsert_many(
+        _make_model_instance(DocumentChunk, id=f"d{i}", content="old semester")
+        for i in range(8)
+    )
+    idx.delete_many([f"d{i}" for i in range(5)])
+
+    import time
+
+    deadline = time.time() + 5
+    while idx.compactions == 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert idx.compactions == 1
+    assert len(idx.doc_ids) == 3
+    assert {d.id for d, _ in idx.search("semester", k=10)} == {"d5", "d6", "d7"}
+
+
+def test_snapshot_is_unaffected_by_later_writes_and_compaction():
+    idx = BM25Index(compact_min_rows=1_000_000)
+    idx.upsert_many(
+        _make_model_instance(DocumentChunk, id=f"d{i}", content=f"lecture {i} on graphs")
+        for i in range(6)
+    )
+    snap = idx.snapshot()
+    before = [(d.id, s) for d, s in snap.search_terms(idx.query_terms("graphs"), k=10)]
+
+    idx.delete_many(["d0", "d1", "d2"])
+    idx.upsert(_make_model_instance(DocumentChunk, id="d3", content="now about trees"))
+    idx.upsert(_make_model_instance(DocumentChunk, id="d9", content="graphs graphs graphs"))
+    idx.compact()
+
+    assert [(d.id, s) for d, s in snap.search_terms(idx.query_terms("graphs"), k=10)] == before
+    assert snap.docs["d3"].content == "lecture 3 on graphs"
+    assert idx.generation > snap.generation
+    assert {d.id for d, s in idx.search("graphs", k=10) if s > 0} == {"d4", "d5", "d9"}
+
+
+def test_single_upserts_append_postings_in_place():
+    idx = BM25Index(compact_min_rows=1_000_000)
+    idx.upsert(_make_model_instance(DocumentChunk, id="d0", content="graphs and trees"))
+    term = idx.query_terms("graphs")[0]
+    buffer = idx._postings[term][0]
+    snap = idx.snapshot()
+
+    for i in range(1, len(buffer)):
+        idx.upsert(_make_model_instance(DocumentChunk, id=f"d{i}", content=f"graphs lecture {i}"))
+    assert idx._postings[term][0] is buffer  # filled its spare capacity, no copy
+    idx.upsert(_make_model_instance(DocumentChunk, id="last", content="graphs again"))
+    assert len(idx._postings[term][0]) > len(buffer)  # full: moved to a larger buffer
+
+    # The shared buffer's later rows are invisible to the older snapshot
+    assert snap.collection_stats([term]).df == {term: 1}
+    assert [d.id for d, _ in snap.search_terms([term], k=10)] == ["d0"]
+    assert idx.collection_stats([term]).df == {term: len(buffer) + 1}
+    arrays = idx.to_arrays()  # exports postings without the spare capacity
+    i = arrays["terms"].index(idx.vocabulary.term(term))
+    graphs = arrays["post_rows"][arrays["term_ptr"][i]:arrays["term_ptr"][i + 1]]
+    assert graphs.tolist() == list(range(len(buffer) + 1))
+
+
+def test_concurrent_searches_see_consistent_snapshots():
+    import threading
+
+    idx = BM25Index(compact_threshold=0.3, compact_min_rows=50)
+    errors = []
+    stop = threading.Event()
+
+    def writer():
+        try:
+            for round_ in range(40):
+                idx.upsert_many(
+                    _make_model_instance(DocumentChunk, id=f"d{i}", content=f"topic{round_ % 3} lecture {i}")
+                    for i in range(50)
+                )
+                idx.delete_many([f"d{i}" for i in range(0, 50, 3)])
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+        finally:
+            stop.set()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                snap = idx.snapshot()
+                results = snap.search_terms(idx.query_terms("lecture"), k=100)
+                ids = [d.id for d, _ in results]
+                assert len(ids) == len(set(ids)) == len(snap)
+                assert all(s > 0 for _, s in results)
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert idx.compactions >= 1
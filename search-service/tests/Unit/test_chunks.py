@@ -0,0 +1,135 @@
+import sys
+from datetime import datetime
+
+import pytest
+
+from app.chunks import ChunkColumns, ChunkStore, TextCache, text_cache
+from app.models import DocumentChunk
+
+
+def _doc(doc_id, content="text"):
+    return DocumentChunk(id=doc_id, course_id="cs101", content=content)
+
+
+def test_frozen_view_is_isolated_from_later_writes():
+    store = ChunkStore({"a": _doc("a"), "b": _doc("b")})
+    store["c"] = _doc("c")
+    frozen = store.freeze()
+
+    store["a"] = _doc("a", "changed")
+    del store["b"]
+    del store["c"]
+    store["d"] = _doc("d")
+
+    assert set(frozen) == {"a", "b", "c"} and len(frozen) == 3
+    assert frozen["a"].content == "text"
+    assert set(store) == {"a", "d"} and len(store) == 2
+    assert store["a"].content == "changed"
+    assert "b" not in store and "b" in frozen
+
+
+def test_overlay_is_folded_without_changing_contents():
+    store = ChunkStore({f"base{i}": _doc(f"base{i}") for i in range(100)})
+    views = []
+    for i in range(3000):
+        store[f"new{i}"] = _doc(f"new{i}")
+        if i % 2 and f"base{i % 100}" in store:
+            del store[f"base{i % 100}"]
+        if i % 500 == 0:
+            views.append((store.freeze(), dict(store)))
+    views.append((store.freeze(), dict(store)))
+
+    assert len(store._overlay) < 3000  # folded at least once
+    for frozen, expected in views:
+        assert dict(frozen) == expected
+        assert len(frozen) == len(expected)
+
+
+@pytest.mark.parametrize("fields", [
+    {},
+    {"source": "lecture1.pdf", "chunk_index": 0, "title": "Recursion", "headings": []},
+    {"headings": ["Intro", "Base case"], "metadata": {"page": 3, "tags": ["a"], "nested": {"x": None}}},
+    {"chunk_index": -1, "content": "ünïcode ✓ and \n newlines", "metadata": {"when": datetime(2024, 1, 1)}},
+    {"created_at": "2024-03-01T10:00:00+00:00", "updated_at": "2024-03-01T10:00:00.000001"},
+    {"created_at": "2024-03-01T10:00:00Z", "updated_at": "2024-03-01T12:00:00+02:00"},
+    {"created_at": "yesterday", "updated_at": ""},
+])
+def test_columns_round_trip_chunks_exactly(fields):
+    doc = DocumentChunk(id="a", course_id="cs101", **{"content": "text", **fields})
+    columns = ChunkColumns()
+    columns.append(_doc("other"))
+    row = columns.append(doc)
+
+    restored = columns.get(row, "a")
+    assert restored.model_dump() == doc.model_dump()
+    assert columns.get(0, "other").content == "text"
+
+
+def test_folded_chunks_are_stored_column_wise_and_compacted():
+    store = ChunkStore()
+    for version in range(4):
+        for i in range(2000):
+            store[f"d{i}"] = _doc(f"d{i}", f"version {version}")
+        store.freeze()
+
+    frozen = store.freeze()
+    assert not store._overlay
+    # Dead rows of replaced versions are dropped once they dominate the columns
+    assert len(store._columns) < 3 * len(store)
+    assert frozen["d7"].content == "version 3"
+    assert frozen["d7"].course_id is frozen["d8"].course_id  # interned
+
+
+def _lecture(i):
+    return (f"Lecture {i % 12}: a recursive function calls itself on a smaller input until it "
+            f"reaches the base case; the call stack keeps one frame per pending call ({i}).")
+
+
+def test_chunk_text_is_compressed_with_a_trained_dictionary():
+    store = ChunkStore()
+    for i in range(1500):
+        store[f"d{i}"] = _doc(f"d{i}", _lecture(i))
+    frozen = store.freeze()
+
+    columns = store._columns
+    assert columns.zdict  # the first fold had enough chunks to train one
+    raw = sum(len(_lecture(i).encode()) for i in range(1500))
+    assert columns.compressed_bytes() < raw / 4
+    assert all(frozen[f"d{i}"].content == _lecture(i) for i in range(1500))
+
+    # Short text, and text deflate cannot shrink, is stored as is
+    noise = bytes(range(32, 127)).decode()
+    short, noisy = columns.append(_doc("short", "tiny")), columns.append(_doc("noise", noise))
+    assert columns.compressed_bytes() == columns._text_ptr[noisy] + len(noise)
+    assert columns.get(short, "short").content == "tiny"
+    assert columns.get(noisy, "noise").content == noise
+
+    plain = ChunkColumns(compress=False)
+    plain.append(_doc("d0", _lecture(0)))
+    assert plain.compressed_bytes() == len(_lecture(0).encode())
+
+
+def test_text_cache_serves_hot_chunks_and_stays_bounded():
+    entry = sys.getsizeof("abcd")
+    cache = TextCache(max_bytes=2 * entry + 1)
+    cache.put((0, 0), "abcd")
+    cache.put((0, 1), "efgh")
+    assert cache.get((0, 0)) == "abcd"  # now most recently used
+    cache.put((0, 2), "ijkl")
+    assert cache.get((0, 1)) is None
+    assert cache.get((0, 2)) == "ijkl"
+    cache.put((0, 3), "x" * (2 * entry))  # larger than the whole cache
+    assert cache.get((0, 3)) is None
+    assert cache.stats()["bytes"] == 2 * entry
+    assert cache.stats()["hit_rate"] == 50.0  # a percentage, like every other hit_rate
+
+    # Non-ASCII text takes more than a byte per character
+    wide = TextCache(max_bytes=2 * entry + 1)
+    wide.put((0, 0), "αβγδ")
+    assert wide.stats()["bytes"] == sys.getsizeof("αβγδ") > entry
+
+    columns = ChunkColumns()
+    row = columns.append(_doc("a", _lecture(1)))
+    hits = text_cache.hits
+    assert columns.get(row, "a").content == columns.get(row, "a").content == _lecture(1)
+    assert text_cache.hits == hits + 1
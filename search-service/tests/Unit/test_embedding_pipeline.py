@@ -0,0 +1,72 @@
+import numpy as np
+
+from app.embedding_pipeline import EmbeddingCache, EmbeddingPipeline
+from app.embeddings import HashingEmbedder
+from app.index import content_hash
+from app.models import DocumentChunk
+from app.vector_index import VectorIndex
+
+
+TEXTS = [
+    "recursion is a function calling itself",
+    "big-O notation describes asymptotic running time",
+    "photosynthesis converts light into chemical energy",
+    "a recursive function needs a base case",
+    "recursion is a function calling itself",  # duplicate
+]
+
+
+def _hashes(texts):
+    return [content_hash(t) for t in texts]
+
+
+def test_embeddings_match_the_embedder_and_duplicates_embed_once():
+    embedder = HashingEmbedder(dim=32)
+    pipeline = EmbeddingPipeline(embedder, batch_size=2)
+
+    vectors = pipeline.embed(TEXTS, _hashes(TEXTS))
+
+    assert np.allclose(vectors, embedder.embed(TEXTS), atol=1e-6)
+    assert pipeline.embedded == 4
+    assert pipeline.batches == 2
+
+
+def test_cache_survives_restart_and_is_keyed_by_embedder(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    first = EmbeddingPipeline(HashingEmbedder(dim=32), cache=EmbeddingCache(path))
+    expected = first.embed(TEXTS, _hashes(TEXTS))
+
+    second = EmbeddingPipeline(HashingEmbedder(dim=32), cache=EmbeddingCache(path))
+    assert np.array_equal(second.embed(TEXTS, _hashes(TEXTS)), expected)
+    assert second.embedded == 0
+    assert second.stats()["cache_hit_rate"] == 100.0
+
+    other = EmbeddingPipeline(HashingEmbedder(dim=32, seed=1), cache=EmbeddingCache(path))
+    other.embed(TEXTS[:1], _hashes(TEXTS[:1]))
+    assert other.embedded == 1
+
+
+def test_process_pool_matches_inline():
+    texts = [f"chunk {i} about topic {i % 7}" for i in range(40)]
+    inline = EmbeddingPipeline(HashingEmbedder(dim=32), batch_size=8).embed(texts, _hashes(texts))
+
+    pooled = EmbeddingPipeline(HashingEmbedder(dim=32), batch_size=8, workers=2)
+    try:
+        assert np.allclose(pooled.embed(texts, _hashes(texts)), inline, atol=1e-6)
+        assert pooled.batches == 5
+    finally:
+        pooled.close()
+
+
+def test_reuploaded_chunks_are_served_from_the_cache():
+    pipeline = EmbeddingPipeline(HashingEmbedder(dim=32), cache=EmbeddingCache())
+    idx = VectorIndex(pipeline.embedder, pipeline=pipeline)
+    docs = [DocumentChunk(id=f"d{i}", course_id="cs101", content=t) for i, t in enumerate(TEXTS[:4])]
+
+    idx.upsert_many(docs)
+    idx.delete_many(["d0", "d1"])
+    idx.upsert_many(docs[:2])
+
+    assert pipeline.embedded == 4
+    assert pipeline.cache_hits == 2
+    assert [i for i, _ in idx.search("recursion", k=1)] == ["d0"]
@@ -0,0 +1,101 @@
+import pytest
+
+from app.federated import _get_executor, federated_rank, federated_search
+from app.index import BM25Index
+from app.models import DocumentChunk
+
+
+COURSES = {
+    "cs101": [
+        ("a", "recursion is a function calling itself"),
+        ("b", "big-O notation describes asymptotic running time"),
+        ("c", "the midterm covers recursion and big-O"),
+    ],
+    "cs202": [
+        ("d", "hash tables give constant time lookups on average"),
+        ("e", "recursion trees help analyse divide and conquer running time"),
+    ],
+    "bio110": [
+        ("f", "cells divide by mitosis"),
+        ("g", "photosynthesis converts light into chemical energy"),
+    ],
+}
+
+
+def _doc(course_id, doc_id, content):
+    return DocumentChunk(id=doc_id, course_id=course_id, content=content)
+
+
+def _shards():
+    shards = {}
+    for course_id, docs in COURSES.items():
+        shards[course_id] = BM25Index()
+        shards[course_id].upsert_many([_doc(course_id, i, c) for i, c in docs])
+    return shards
+
+
+def _combined():
+    idx = BM25Index()
+    idx.upsert_many([_doc(course_id, i, c) for course_id, docs in COURSES.items() for i, c in docs])
+    return idx
+
+
+@pytest.mark.parametrize("query", ["recursion", "running time recursion", "divide"])
+def test_federated_scores_match_single_global_index(query):
+    expected = {d.id: s for d, s in _combined().search(query, k=10) if s > 0}
+    results = federated_search(_shards(), query, k=10)
+    got = {d.id: s for d, s in results if s > 0}
+
+    # Ties may be broken differently, so compare scores per document.
+    assert got == pytest.approx(expected, rel=1e-5)
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+
+
+def test_federated_top_k_is_merged_across_shards():
+    results = federated_search(_shards(), "recursion", k=2)
+
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1]
+    assert {d.course_id for d, _ in results} <= {"cs101", "cs202"}
+
+
+def test_federated_rank_returns_the_same_top_k_unhydrated():
+    shards = _shards()
+    ranked = federated_rank(shards, "recursion running time", k=3, course_ids={"cs101", "cs202"})
+    hits = federated_search(shards, "recursion running time", k=3, course_ids={"cs101", "cs202"})
+
+    assert ranked == [(d.course_id, d.id, s) for d, s in hits]
+
+
+def test_shards_without_query_terms_are_skipped():
+    shards = _shards()
+    results = federated_search(shards, "photosynthesis", k=10)
+
+    assert {d.course_id for d, _ in results} == {"bio110"}
+    assert results[0][0].id == "g"
+
+
+def test_federated_search_with_no_matches_or_shards():
+    assert federated_search(_shards(), "quantum chromodynamics", k=5) == []
+    assert federated_search({}, "recursion", k=5) == []
+
+
+def test_course_filter_limits_candidates_but_not_statistics():
+    shards = _shards()
+    unfiltered = {d.id: s for d, s in federated_search(shards, "recursion running time", k=10)}
+    results = federated_search(shards, "recursion running time", k=2, course_ids={"cs202"})
+
+    assert [d.course_id for d, _ in results] == ["cs202", "cs202"]
+    # Scores use corpus statistics from every course, whoever is searching.
+    for doc, score in results:
+        assert score == pytest.approx(unfiltered[doc.id])
+
+
+def test_course_filter_with_no_allowed_courses():
+    assert federated_search(_shards(), "recursion", k=5, course_ids=set()) == []
+
+
+def test_executor_is_sized_by_each_callers_max_workers():
+    two, three = _get_executor(2), _get_executor(3)
+    assert two is _get_executor(2) and three is not two
+    assert (two._max_workers, three._max_workers) == (2, 3)
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from app.hybrid import HybridSearchError, _get_executor, hybrid_search, reciprocal_rank_fusion
+
+
+A, B, C, D = (("cs101", doc_id) for doc_id in "abcd")
+
+
+def test_rrf_rewards_documents_ranked_by_both_legs():
+    lexical = [(A, 9.0), (B, 5.0), (C, 1.0)]
+    vector = [(B, 0.9), (C, 0.8), (D, 0.1)]
+
+    fused = reciprocal_rank_fusion([lexical, vector], k=4, rrf_k=60)
+
+    assert [ref[1] for ref, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert len(reciprocal_rank_fusion([lexical, vector], k=2)) == 2
+
+
+def test_slow_leg_is_dropped_at_its_deadline():
+    def slow(k):
+        time.sleep(0.3)
+        return [(D, 1.0)]
+
+    started = time.perf_counter()
+    hits, timings, partial = hybrid_search(
+        {"lexical": lambda k: [(A, 2.0), (B, 1.0)], "vector": slow},
+        k=10,
+        deadlines={"lexical": 1.0, "vector": 0.02},
+    )
+
+    assert time.perf_counter() - started < 0.25
+    assert [ref[1] for ref, _ in hits] == ["a", "b"]
+    assert partial
+    assert {t.name: t.status for t in timings} == {"lexical": "ok", "vector": "timeout", "fusion": "ok"}
+
+
+def test_failing_legs():
+    def broken(k):
+        raise RuntimeError("boom")
+
+    hits, timings, partial = hybrid_search(
+        {"lexical": broken, "vector": lambda k: [(C, 0.5)]},
+        k=10,
+        deadlines={"lexical": 1.0, "vector": 1.0},
+    )
+    assert [ref[1] for ref, _ in hits] == ["c"] and partial
+    assert timings[0].status == "error"
+
+    with pytest.raises(HybridSearchError):
+        hybrid_search({"lexical": broken}, k=10, deadlines={"lexical": 1.0})
+
+
+def test_leg_pool_is_sized_by_each_callers_max_workers():
+    two, three = _get_executor(2), _get_executor(3)
+    assert two is _get_executor(2) and three is not two
+    assert (two._max_workers, three._max_workers) == (2, 3)
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from app.index import BM25Index
+from app.indexing import IndexingQueue, QueueFull
+from app.models import DocumentChunk
+
+
+def _doc(doc_id, content):
+    return DocumentChunk(id=doc_id, course_id="c1", content=content)
+
+
+class _Target:
+    """One course index behind an IndexingQueue, recording the batches it was given."""
+
+    def __init__(self):
+        self.index = BM25Index()
+        self.batches = []
+        self.released = []
+
+    def apply(self, course_id, upserts, deletes, target):
+        self.batches.append((sorted(d.id for d in upserts), sorted(deletes), target))
+        self.index.write_batch(upserts, deletes)
+        if self.index.generation < target:
+            self.index.generation = target
+
+    def queue(self, **kwargs):
+        return IndexingQueue(
+            self.apply, lambda course_id: self.index.generation, release_lsn=self.released.append, **kwargs
+        )
+
+
+def test_burst_of_writes_is_coalesced_into_one_batch():
+    t = _Target()
+    queue = t.queue(coalesce_seconds=0.1)
+
+    ops = [
+        queue.submit("c1", "upsert", [_doc("a", "old text")], lsn=1),
+        queue.submit("c1", "upsert", [_doc("b", "binary search trees")], lsn=2),
+        queue.submit("c1", "upsert", [_doc("a", "recursion and base cases")], lsn=3),
+        queue.submit("c1", "delete", ["b"], lsn=4),
+    ]
+    assert [op.target_generation for op in ops] == [1, 2, 3, 4]
+    assert queue.wait_for_generation("c1", 4, timeout=5)
+
+    assert t.batches == [(["a"], ["b"], 4)]
+    assert all(queue.get(op.id).status == "succeeded" for op in ops)
+    assert sorted(t.released) == [1, 2, 3, 4]
+    assert [doc.id for doc, score in t.index.search("recursion", k=5) if score > 0] == ["a"]
+    assert queue.stats()["operations_per_batch"] == 4.0
+    queue.stop()
+
+
+def test_target_generation_is_not_reached_before_the_write_is_visible():
+    t = _Target()
+    t.index.upsert_many([_doc("x", "existing chunk")])
+    queue = t.queue(coalesce_seconds=0)
+    seen = []
+
+    def searcher():
+        for _ in range(200):
+            snap = t.index.snapshot()
+            if snap.generation >= op.target_generation:
+                seen.append("new" in snap.docs)
+                return
+            time.sleep(0.001)
+
+    op = queue.submit("c1", "upsert", [_doc("new", "fresh content")])
+    thread = threading.Thread(target=searcher)
+    thread.start()
+    assert queue.wait_for_generation("c1", op.target_generation, timeout=5)
+    thread.join()
+    assert seen == [True]
+    queue.stop()
+
+
+def test_wait_for_generation_times_out():
+    t = _Target()
+    queue = t.queue()
+    started = time.monotonic()
+    assert not queue.wait_for_generation("c1", 5, timeout=0.05)
+    assert time.monotonic() - started < 1
+
+
+def test_backlog_limit_and_failed_batches():
+    t = _Target()
+
+    def failing(course_id, upserts, deletes, target):
+        raise RuntimeError("disk full")
+
+    pinned = []
+    queue = IndexingQueue(
+        failing, lambda course_id: t.index.generation, release_lsn=t.released.append, pin_lsn=pinned.append,
+        max_pending_docs=2, coalesce_seconds=0,
+    )
+    queue.ensure_room(2)
+    with pytest.raises(QueueFull):
+        queue.ensure_room(3)
+
+    op = queue.submit("c1", "upsert", [_doc("a", "text"), _doc("b", "text")], lsn=7)
+    assert queue.drain("c1", timeout=5)
+    assert queue.get(op.id).status == "failed"
+    assert queue.get(op.id).error == "disk full"
+    # The WAL record stays pinned so the write is replayed, not checkpointed away
+    assert pinned == [7] and t.released == []
+    queue.ensure_room(2)  # failed documents no longer count against the backlog
+    queue.stop()
+
+
+def test_drain_waits_for_a_course_queued_behind_another_courses_batch():
+    applied = []
+    first_started = threading.Event()
+
+    def apply(course_id, upserts, deletes, target):
+        if course_id == "slow":
+            first_started.set()
+            time.sleep(0.3)
+        applied.append(course_id)
+
+    queue = IndexingQueue(apply, lambda course_id: 0, coalesce_seconds=0.05)
+    queue.submit("slow", "upsert", [_doc("a", "text")])
+    queue.submit("fast", "upsert", [_doc("b", "text")])
+    assert first_started.wait(5)
+    # "fast" left the pending lists together with "slow", but is not applied yet
+    assert queue.drain("fast", timeout=5)
+    assert applied == ["slow", "fast"]
+    queue.stop()
+
+
+def test_synchronous_writes_are_recorded_as_succeeded():
+    t = _Target()
+    queue = t.queue()
+    t.index.upsert_many([_doc("a", "text")])
+    op = queue.record_applied("c1", "upsert", 1)
+    assert op.status == "succeeded"
+    assert op.target_generation == t.index.generation
+    # The next queued write targets a later generation
+    assert queue.reserve("c1") == t.index.generation + 1
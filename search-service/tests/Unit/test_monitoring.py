@@ -0,0 +1,141 @@
+import threading
+import time
+
+from app.monitoring import LatencyHistogram, MetricsFeed, MonitoringService, ProcessSampler, RequestMetrics
+
+
+def test_quantiles_interpolate_within_buckets():
+    histogram = LatencyHistogram((0.1, 0.2, 0.4), [50, 40, 9, 1])
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) == 0.1
+    assert abs(histogram.quantile(0.7) - 0.15) < 1e-9
+    assert 0.2 < histogram.quantile(0.95) < 0.4
+    assert histogram.quantile(1.0) == 0.4  # beyond the last bound
+    assert LatencyHistogram((0.1,), [0, 0]).quantile(0.99) == 0.0
+
+
+def test_per_thread_counts_are_merged_on_scrape():
+    metrics = RequestMetrics(buckets=(0.01, 0.1))
+
+    def record():
+        for i in range(1000):
+            metrics.record_request(0.005 if i % 2 else 0.05, 200, "/search", "POST")
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    metrics.record_request(1.0, 500, "/search", "POST")
+
+    histograms = metrics.histograms()
+    ok = histograms[("POST", "/search", 200)]
+    assert ok.counts == [2000, 2000, 0]
+    assert abs(ok.total_seconds - 2000 * 0.055) < 1e-6
+    assert histograms[("POST", "/search", 500)].counts == [0, 0, 1]
+
+
+def test_prometheus_text_exports_histograms_and_gauges():
+    service = MonitoringService()
+    service.record_request(0.003, 200, "/v1/courses/{course_id}/documents:search", "POST")
+    service.register_gauge("search_index_documents", "Chunks.", lambda: {"cs101": 3, 'we"ird': 1}, label="course_id")
+    service.register_gauge("broken", "Raises.", lambda: 1 / 0)
+
+    text = service.prometheus_text()
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    labels = 'method="POST",route="/v1/courses/{course_id}/documents:search",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.001"}} 0' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"http_request_duration_seconds_count{{{labels}}} 1" in text
+    assert 'search_index_documents{course_id="cs101"} 3' in text
+    assert 'search_index_documents{course_id="we\\"ird"} 1' in text
+    assert "http_requests_in_flight 0" in text
+    assert "broken" not in text
+
+    stats = service.get_request_stats()
+    assert stats["total"] == stats["successful"] == 1
+    assert 2.5 <= stats["p99_ms"] <= 5.0
+
+
+def test_request_stages_get_a_histogram_each():
+    service = MonitoringService()
+    for _ in range(10):
+        service.record_stages([("tokenize", 0.0002), ("retrieve", 0.02), ("serialize", 0.003)])
+    service.record_stages([("retrieve", 0.2)])
+
+    stages = service.get_request_stats()["stages"]
+    assert list(stages) == ["retrieve", "serialize", "tokenize"]
+    assert stages["retrieve"]["count"] == 11
+    assert stages["tokenize"]["p99_ms"] <= 1.0
+    assert stages["retrieve"]["p50_ms"] > stages["serialize"]["p50_ms"]
+
+    text = service.prometheus_text()
+    assert "# TYPE http_request_stage_duration_seconds histogram" in text
+    assert 'http_request_stage_duration_seconds_bucket{stage="retrieve",le="0.025"} 10' in text
+    assert 'http_request_stage_duration_seconds_count{stage="retrieve"} 11' in text
+
+
+def test_sampler_keeps_a_bounded_history_of_process_samples():
+    sampler = ProcessSampler(interval_seconds=0.01, capacity=5)
+    assert sampler.latest() is None and sampler.history() == []
+
+    for _ in range(8):
+        sampler.sample()
+    history = sampler.history()
+    assert len(history) == 5  # the three oldest were overwritten
+    assert [p.timestamp for p in history] == sorted(p.timestamp for p in history)
+    assert sampler.latest() is history[-1]
+    assert history[-1].memory_mb > 0 and history[-1].threads >= 1 and history[-1].open_fds >= 1
+    assert sampler.history(seconds=0.000001) in ([], history[-1:])
+
+    sampler.start()
+    try:
+        deadline = time.time() + 5
+        while sampler.latest() is history[-1] and time.time() < deadline:
+            time.sleep(0.01)
+        assert sampler.latest() is not history[-1]
+    finally:
+        sampler.stop()
+
+
+def test_health_reads_the_latest_sample_without_measuring_inline():
+    service = MonitoringService()
+    service.sampler = ProcessSampler(capacity=10)
+    service.sampler.sample()
+    latest = service.sampler.latest()
+
+    process = service.get_process_stats()
+    assert process["memory_mb"] == latest.memory_mb
+    assert process["psutil_available"]
+
+    history = service.get_process_history()
+    assert history["points"] == 1
+    assert history["memory_mb"] == [latest.memory_mb]
+    assert "process_threads " in service.prometheus_text()
+
+
+def test_metrics_feed_sends_everything_once_then_only_changes():
+    service = MonitoringService()
+    service.sampler = ProcessSampler(capacity=10)
+    sizes = {"documents": 10}
+    service.register_collector("indices", lambda: {"documents": sizes["documents"], "token_cache": {"hit_rate": 50.0}})
+    feed = MetricsFeed(service)
+
+    first = feed.next_event()
+    assert first["indices.documents"] == 10
+    assert first["indices.token_cache.hit_rate"] == 50.0
+    assert "environment.python_version" in first and "requests.p99_ms" in first
+
+    for _ in range(10):
+        service.record_request(0.02, 200, "/search", "POST")
+    sizes["documents"] = 12
+    second = feed.next_event()
+    assert second["indices.documents"] == 12
+    assert second["requests.total"] == 10
+    assert 10 <= second["requests.p50_ms"] <= 25  # only the requests since the last event
+    assert "indices.token_cache.hit_rate" not in second
+    assert "environment.python_version" not in second
+
+    third = feed.next_event()
+    assert third["requests.per_second"] == 0.0  # no requests since the last event
+    assert "requests.total" not in third
@@ -0,0 +1,131 @@
+import pytest
+
+from app.models import DocumentChunk
+from app.pagination import InvalidPageToken, Paginator, StalePageToken, _b64encode
+
+
+HITS = [(("cs101", f"d{i}"), float(100 - i)) for i in range(23)]
+DOCS = {ref: DocumentChunk(id=ref[1], course_id=ref[0], content=f"doc {ref[1]}") for ref, _ in HITS}
+
+
+class CountingRanker:
+    def __init__(self, hits=HITS):
+        self.hits = hits
+        self.calls = []
+
+    def __call__(self, k):
+        self.calls.append(k)
+        return self.hits[:k]
+
+
+class CountingHydrator:
+    def __init__(self):
+        self.hydrated = []
+
+    def __call__(self, ranked):
+        self.hydrated.extend(ref for ref, _ in ranked)
+        return [(DOCS[ref], score) for ref, score in ranked]
+
+
+hydrate = CountingHydrator()
+
+
+def _walk(paginator, rank, generation=1, page_size=5):
+    token, pages = None, []
+    while True:
+        hits, token = paginator.page("course:cs101", "search", generation, page_size, token, rank, hydrate)
+        pages.append([doc.id for doc, _ in hits])
+        if token is None:
+            return pages
+
+
+def test_pages_cover_the_ranking_once_in_order():
+    rank = CountingRanker()
+    pages = _walk(Paginator(), rank)
+
+    assert [doc_id for page in pages for doc_id in page] == [ref[1] for ref, _ in HITS]
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+
+
+def test_following_pages_reuse_the_cached_ranking():
+    rank = CountingRanker()
+    paginator = Paginator(prefetch_pages=5)
+    _walk(paginator, rank)
+
+    # The first call ranks five pages ahead (plus one to detect a next page),
+    # which covers the whole result set here.
+    assert rank.calls == [26]
+    assert paginator.cache.stats()["hits"] == 4
+
+
+def test_only_the_returned_page_is_hydrated():
+    hydrator = CountingHydrator()
+    paginator = Paginator()
+    hits, token = paginator.page("course:cs101", "search", 1, 5, None, CountingRanker(), hydrator)
+    paginator.page("course:cs101", "search", 1, 5, token, CountingRanker(), hydrator)
+
+    assert [doc.id for doc, _ in hits] == ["d0", "d1", "d2", "d3", "d4"]
+    assert hydrator.hydrated == [ref for ref, _ in HITS[:10]]
+    ranked, _ = paginator.cache.get(("course:cs101", "search"), 1)
+    assert ranked[0] == (("cs101", "d0"), 100.0)  # the cache holds refs, not chunks
+
+
+def test_expired_ranking_is_recomputed_and_resumed():
+    rank = CountingRanker()
+    paginator = Paginator()
+    _, token = paginator.page("course:cs101", "search", 1, 5, None, rank, hydrate)
+    paginator.cache.clear()
+
+    hits, _ = paginator.page("course:cs101", "search", 1, 5, token, rank, hydrate)
+    assert [doc.id for doc, _ in hits] == ["d5", "d6", "d7", "d8", "d9"]
+    assert len(rank.calls) == 2
+
+
+def test_generation_change_invalidates_token():
+    paginator = Paginator()
+    _, token = paginator.page("course:cs101", "search", 1, 5, None, CountingRanker(), hydrate)
+
+    with pytest.raises(StalePageToken):
+        paginator.page("course:cs101", "search", 2, 5, token, CountingRanker(), hydrate)
+
+
+def test_token_is_bound_to_its_search_and_signature():
+    paginator = Paginator()
+    _, token = paginator.page("course:cs101", "search", 1, 5, None, CountingRanker(), hydrate)
+
+    with pytest.raises(InvalidPageToken):
+        paginator.page("course:cs101", "other search", 1, 5, token, CountingRanker(), hydrate)
+    with pytest.raises(InvalidPageToken):
+        paginator.page("course:cs202", "search", 1, 5, token, CountingRanker(), hydrate)
+    with pytest.raises(InvalidPageToken):
+        Paginator().page("course:cs101", "search", 1, 5, token, CountingRanker(), hydrate)  # other key
+    with pytest.raises(InvalidPageToken):
+        paginator.page("course:cs101", "search", 1, 5, "garbage", CountingRanker(), hydrate)
+
+    body, signature = token.split(".")
+    with pytest.raises(InvalidPageToken):
+        paginator.page("course:cs101", "search", 1, 5, f"{body}x.{signature}", CountingRanker(), hydrate)
+    with pytest.raises(InvalidPageToken):
+        paginator.page("course:cs101", "search", 1, 5, f"{body}.{signature[:-1]}é", CountingRanker(), hydrate)
+
+
+@pytest.mark.parametrize("body", [b"not json", b"[1, 2]", b'{"scope": "course:cs101"}', b'{"exp": "soon"}'])
+def test_signed_but_malformed_payload_is_rejected(body):
+    paginator = Paginator()
+    token = f"{_b64encode(body)}.{paginator._sign(body)}"
+    with pytest.raises(InvalidPageToken):
+        paginator.decode_token(token)
+
+
+def test_expired_token_is_rejected():
+    paginator = Paginator(ttl_seconds=-1)
+    _, token = paginator.page("course:cs101", "search", 1, 5, None, CountingRanker(), hydrate)
+
+    with pytest.raises(InvalidPageToken):
+        paginator.page("course:cs101", "search", 1, 5, token, CountingRanker(), hydrate)
+
+
+def test_single_page_has_no_token():
+    hits, token = Paginator().page("course:cs101", "search", 1, 50, None, CountingRanker(), hydrate)
+    assert len(hits) == len(HITS)
+    assert token is None
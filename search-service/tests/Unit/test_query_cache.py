@@ -0,0 +1,47 @@
+from app.query_cache import QueryCache, normalize_query
+
+
+def test_hit_after_put_and_miss_for_other_key():
+    cache = QueryCache()
+    cache.put(("course:cs101", "recursion"), 1, ["a"])
+
+    assert cache.get(("course:cs101", "recursion"), 1) == ["a"]
+    assert cache.get(("course:cs202", "recursion"), 1) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_generation_change_invalidates_only_that_entry():
+    cache = QueryCache()
+    cache.put(("course:cs101", "recursion"), 1, ["a"])
+    cache.put(("course:cs202", "recursion"), 7, ["b"])
+
+    assert cache.get(("course:cs101", "recursion"), 2) is None
+    assert cache.get(("course:cs202", "recursion"), 7) == ["b"]
+    assert cache.stats()["invalidations"] == 1
+    assert len(cache) == 1
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", 0, 1)
+    cache.put("b", 0, 2)
+    cache.get("a", 0)
+    cache.put("c", 0, 3)
+
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == 1
+    assert cache.get("c", 0) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = QueryCache(ttl_seconds=-1)
+    cache.put("a", 0, 1)
+
+    assert cache.get("a", 0) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_normalize_query():
+    assert normalize_query("  Big-O   Notation ") == normalize_query("big-o notation")
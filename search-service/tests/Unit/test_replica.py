@@ -0,0 +1,77 @@
+import shutil
+
+from app.index import BM25Index
+from app.models import DocumentChunk
+from app.replica import ReplicaSync
+from app.snapshot import SnapshotManager, load_generation
+
+
+def _doc(doc_id, content):
+    return DocumentChunk(id=doc_id, course_id="cs101", content=content)
+
+
+class _Reader:
+    """The state a reader process keeps: indices and profiles, swapped in by a ReplicaSync."""
+
+    def __init__(self, root):
+        self.indices = {}
+        self.profiles = []
+        self.sync = ReplicaSync(SnapshotManager(root), self.swap, self.set_profiles)
+
+    def swap(self, course_id, path):
+        self.indices[course_id] = load_generation(path, verify=False)
+
+    def set_profiles(self, profiles):
+        self.profiles = profiles
+
+
+def test_reader_swaps_in_published_generations(tmp_path):
+    indexer = SnapshotManager(str(tmp_path))
+    course = BM25Index()
+    course.upsert(_doc("a", "recursion and the call stack"))
+    indexer.save_all({"cs101": course})
+    indexer.write_checkpoint(0, [{"uid": "u1", "courses": ["cs101"]}])
+
+    reader = _Reader(str(tmp_path))
+    assert reader.sync.poll() == 1
+    assert reader.profiles == [{"uid": "u1", "courses": ["cs101"]}]
+    first = reader.indices["cs101"]
+    assert first.search("recursion", k=1)[0][0].id == "a"
+
+    # Nothing published: nothing reloaded
+    assert reader.sync.poll() == 0
+    assert reader.indices["cs101"] is first
+
+    course.upsert(_doc("b", "recursion with memoization"))
+    indexer.save_all({"cs101": course})
+    assert reader.sync.poll() == 1
+    swapped = reader.indices["cs101"]
+    assert swapped.generation == course.generation
+    assert {d.id for d, s in swapped.search("memoization", k=5) if s > 0} == {"b"}
+    # The replaced index keeps answering for searches that still hold it
+    assert {d.id for d, s in first.search("recursion", k=5) if s > 0} == {"a"}
+    assert reader.sync.stats()["swaps"] == 2
+
+
+def test_generation_removed_while_loading_is_retried(tmp_path):
+    indexer = SnapshotManager(str(tmp_path))
+    course = BM25Index()
+    course.upsert(_doc("a", "recursion"))
+    indexer.save_all({"cs101": course})
+
+    reader = _Reader(str(tmp_path))
+    real_swap = reader.swap
+
+    def superseded(course_id, path):
+        shutil.rmtree(path)
+        real_swap(course_id, path)
+
+    reader.sync._swap = superseded
+    assert reader.sync.poll() == 0
+    assert reader.sync.failed_loads == 1
+
+    course.upsert(_doc("b", "memoization"))
+    indexer.save_all({"cs101": course})
+    reader.sync._swap = real_swap
+    assert reader.sync.poll() == 1
+    assert set(reader.indices["cs101"].docs) == {"a", "b"}
@@ -0,0 +1,183 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.embeddings import HashingEmbedder
+from app.index import BM25Index
+from app.models import DocumentChunk
+from app.snapshot import (
+    SnapshotError,
+    SnapshotManager,
+    current_generation_dir,
+    load_snapshot,
+    load_vectors,
+    save_snapshot,
+)
+from app.vector_index import VectorIndex
+
+
+def _doc(doc_id, content, **extra):
+    return DocumentChunk(id=doc_id, course_id="cs101", content=content, **extra)
+
+
+def _seeded_index():
+    idx = BM25Index()
+    idx.upsert_many([
+        _doc("a", "recursion and the call stack", title="Recursion"),
+        _doc("b", "big-O notation for running time", metadata={"week": 2}),
+        _doc("c", "midterm review recursion big-O"),
+        _doc("d", "to be deleted"),
+    ])
+    idx.delete("d")
+    return idx
+
+
+def _corrupt(path):
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+
+def test_snapshot_round_trip_is_memory_mapped(tmp_path):
+    idx = _seeded_index()
+    save_snapshot(idx, str(tmp_path))  # compacts `idx` as a side effect
+    expected = [(d.id, s) for d, s in idx.search("recursion big-O", k=3)]
+
+    loaded = load_snapshot(str(tmp_path))
+
+    assert [(d.id, s) for d, s in loaded.search("recursion big-O", k=3)] == expected
+    assert loaded.generation == idx.generation
+    assert "d" not in loaded.docs
+    assert loaded.docs["b"].metadata == {"week": 2}
+    assert loaded.docs["a"].title == "Recursion"
+    assert isinstance(loaded._doc_len, np.memmap)
+
+
+def test_loaded_snapshot_accepts_writes(tmp_path):
+    save_snapshot(_seeded_index(), str(tmp_path))
+    loaded = load_snapshot(str(tmp_path))
+
+    loaded.upsert(_doc("e", "hash tables and recursion"))
+    loaded.upsert(_doc("a", "dynamic programming"))
+    loaded.delete("c")
+
+    assert {d.id for d, s in loaded.search("recursion", k=10) if s > 0} == {"e"}
+    assert len(loaded.docs) == 3
+
+    # And the changed index can be snapshotted again.
+    save_snapshot(loaded, str(tmp_path))
+    reloaded = load_snapshot(str(tmp_path))
+    assert set(reloaded.docs) == {"a", "b", "e"}
+
+
+def test_existing_generation_directory_is_never_replaced(tmp_path, monkeypatch):
+    idx = _seeded_index()
+    first, generation = save_snapshot(idx, str(tmp_path))
+    marker = os.path.join(first, "in-use")
+    open(marker, "w").close()
+    synced = []
+    monkeypatch.setattr("app.snapshot._fsync_path", lambda path: synced.append(os.path.basename(path)))
+
+    # Same generation again, e.g. after a crash left the directory behind without CURRENT
+    second, _ = save_snapshot(idx, str(tmp_path))
+    assert os.path.exists(marker)
+    assert second == first + "-1"
+    assert current_generation_dir(str(tmp_path)) == second
+    assert load_snapshot(str(tmp_path)).generation == generation == idx.generation
+    # Data files, the generation directory and the directory holding CURRENT reach the disk
+    assert {"chunks.jsonl", "manifest.json", "post_rows.npy", os.path.basename(str(tmp_path))} <= set(synced)
+
+
+def test_corrupted_postings_are_rebuilt_from_chunks(tmp_path):
+    idx = _seeded_index()
+    expected = [d.id for d, _ in idx.search("recursion", k=3)]
+    path, _ = save_snapshot(idx, str(tmp_path))
+
+    _corrupt(os.path.join(path, "post_tfs.npy"))
+
+    loaded = load_snapshot(str(tmp_path))
+    assert [d.id for d, _ in loaded.search("recursion", k=3)] == expected
+
+
+def test_corrupted_chunk_store_raises(tmp_path):
+    path, _ = save_snapshot(_seeded_index(), str(tmp_path))
+    _corrupt(os.path.join(path, "chunks.jsonl"))
+
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(tmp_path))
+
+
+def test_manager_only_snapshots_changed_indices(tmp_path):
+    manager = SnapshotManager(str(tmp_path))
+    courses = {"cs 101/fall": _seeded_index(), "math": BM25Index()}
+    courses["math"].upsert(_doc("m", "linear algebra"))
+
+    assert manager.save_all(courses) == 2
+    assert manager.save_all(courses) == 0
+    courses["math"].upsert(_doc("n", "eigenvalues"))
+    assert manager.save_all(courses) == 1
+
+    restored = SnapshotManager(str(tmp_path)).load_courses()
+    assert set(restored) == {"cs 101/fall", "math"}
+    assert restored["math"].search("eigenvalues", k=1)[0][0].id == "n"
+
+
+def test_write_during_a_save_is_saved_by_the_next_one(tmp_path, monkeypatch):
+    manager = SnapshotManager(str(tmp_path))
+    idx = BM25Index()
+    idx.upsert(_doc("a", "recursion"))
+    to_arrays = idx.to_arrays
+
+    def copy_then_write():
+        arrays = to_arrays()
+        monkeypatch.setattr(idx, "to_arrays", to_arrays)
+        idx.upsert(_doc("b", "big-O notation"))  # lands after the copy
+        return arrays
+
+    monkeypatch.setattr(idx, "to_arrays", copy_then_write)
+    assert manager.save_all({"cs101": idx}) == 1
+    assert set(load_snapshot(manager._dir("cs101")).docs) == {"a"}
+
+    assert manager.save_all({"cs101": idx}) == 1
+    assert set(load_snapshot(manager._dir("cs101")).docs) == {"a", "b"}
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_vectors_round_trip_memory_mapped(tmp_path, dtype):
+    embedder = HashingEmbedder(dim=32)
+    vectors = VectorIndex(embedder, dtype=dtype)
+    vectors.upsert_many([_doc("a", "recursion and the call stack"), _doc("b", "big-O notation"), _doc("d", "gone")])
+    vectors.delete_many(["d"])
+    expected = vectors.search("recursion", k=2)
+    path, _ = save_snapshot(_seeded_index(), str(tmp_path), vectors=vectors)
+
+    loaded = load_vectors(path, embedder, dtype=dtype)
+    assert isinstance(loaded._vectors, np.ndarray) and not loaded._vectors.flags.writeable
+    assert loaded.search("recursion", k=2) == pytest.approx(expected)
+    assert len(loaded) == 2
+
+    # Writes copy the mapped arrays instead of failing on them
+    loaded.upsert_many([_doc("e", "hash tables")])
+    loaded.delete_many(["a"])
+    assert {doc_id for doc_id, _ in loaded.search("hash tables", k=5)} == {"b", "e"}
+
+    # Vectors from another embedder or dtype are not reused
+    assert load_vectors(path, HashingEmbedder(dim=16)) is None
+    assert load_vectors(path, embedder, dtype="float16") is None
+    assert load_vectors(save_snapshot(_seeded_index(), str(tmp_path / "none"))[0], embedder) is None
+
+
+def test_manager_restores_vectors_of_loaded_generations(tmp_path):
+    embedder = HashingEmbedder(dim=32)
+    vectors = VectorIndex(embedder)
+    vectors.upsert_many([_doc("a", "recursion and the call stack")])
+    SnapshotManager(str(tmp_path)).save_all({"cs101": _seeded_index()}, {"cs101": vectors})
+
+    manager = SnapshotManager(str(tmp_path))
+    assert set(manager.load_courses()) == {"cs101"}
+    restored = manager.load_vectors(embedder)
+    assert restored["cs101"].search("recursion", k=1)[0][0] == "a"
+    assert current_generation_dir(manager._dir("cs101")) == manager.current_path("cs101")
@@ -0,0 +1,43 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.timing import StageTimer, current_timer, finish_timer, record_stage, stage, start_timer
+
+
+def test_stages_add_up_and_format_as_server_timing():
+    timer = StageTimer()
+    assert not timer
+    timer.add("retrieve", 0.002)
+    timer.add("hydrate", 0.0005)
+    timer.add("retrieve", 0.001)
+    timer.add("vector", 0.02, "timeout")
+    timer.add("cache", 0.0, "hit")
+    assert [name for name, _ in timer.stages()] == ["retrieve", "hydrate", "vector", "cache"]
+    assert abs(dict(timer.stages())["retrieve"] - 0.003) < 1e-12
+    assert timer.header() == (
+        'retrieve;dur=3.00, hydrate;dur=0.50, vector;dur=20.00;desc="timeout", cache;desc="hit"'
+    )
+
+
+def test_stage_records_into_the_current_timer_only():
+    with stage("tokenize"):  # no request: nothing to record into
+        pass
+    record_stage("fusion", 0.001)
+    assert current_timer() is None
+
+    timer, token = start_timer()
+    try:
+        with stage("tokenize"):
+            time.sleep(0.001)
+        # Work handed to a pool sees the timer when submitted with a copy of the context
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(contextvars.copy_context().run, record_stage, "vector", 0.004).result()
+            pool.submit(record_stage, "lost", 0.004).result()
+    finally:
+        finish_timer(token)
+    assert current_timer() is None
+    stages = dict(timer.stages())
+    assert stages["tokenize"] >= 0.001
+    assert stages["vector"] == 0.004
+    assert "lost" not in stages
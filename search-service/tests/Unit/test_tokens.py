@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from app.tokens import (
+    CertificateRefresher,
+    CertificatesUnavailable,
+    FakeIssuer,
+    InvalidToken,
+    TokenCache,
+    TokenVerifier,
+)
+
+
+@pytest.fixture(scope="module")
+def issuer(tmp_path_factory):
+    return FakeIssuer("demo-project", str(tmp_path_factory.mktemp("auth") / "issuer.pem"))
+
+
+def _verifier(issuer, project_id="demo-project"):
+    return TokenVerifier(project_id, CertificateRefresher(issuer.certificates))
+
+
+def test_fake_issuer_tokens_verify_like_firebase_ones(issuer, tmp_path):
+    claims = _verifier(issuer).verify(issuer.mint("student1", role="student"))
+    assert claims["uid"] == claims["sub"] == "student1"
+    assert claims["role"] == "student"
+
+    with pytest.raises(InvalidToken):
+        _verifier(issuer).verify(issuer.mint("student1", ttl_seconds=-10))  # expired
+    with pytest.raises(InvalidToken):
+        _verifier(issuer, "other-project").verify(issuer.mint("student1"))
+    with pytest.raises(InvalidToken):
+        _verifier(issuer).verify("not-a-jwt")
+    stranger = FakeIssuer("demo-project", str(tmp_path / "other.pem"))
+    with pytest.raises(InvalidToken):
+        _verifier(issuer).verify(stranger.mint("student1"))  # same key id, different key
+
+    # The key file is reused, so another process can mint accepted tokens
+    again = FakeIssuer("demo-project", str(tmp_path / "other.pem"))
+    assert _verifier(stranger).verify(again.mint("teacher1"))["uid"] == "teacher1"
+
+
+def test_token_cache_is_bounded_and_drops_expired_claims():
+    cache = TokenCache(max_entries=2)
+    now = time.time()
+    cache.put("a", {"uid": "a", "exp": now + 60})
+    cache.put("b", {"uid": "b", "exp": now + 60})
+    assert cache.get("a")["uid"] == "a"
+    cache.put("c", {"uid": "c", "exp": now + 60})  # evicts b, the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c")["uid"] == "c"
+
+    cache.put("old", {"uid": "old", "exp": now - 1})
+    assert cache.get("old") is None
+    stats = cache.stats()
+    assert stats["entries"] <= 2
+    assert stats["expirations"] == 1
+    assert stats["evictions"] >= 1
+
+
+def test_certificates_are_fetched_in_the_background_and_rate_limited(issuer):
+    fetches = []
+
+    def fetch():
+        fetches.append(time.time())
+        return issuer.certificates()
+
+    certificates = CertificateRefresher(fetch)
+    certificates.start()
+    try:
+        deadline = time.time() + 5
+        while not certificates.stats()["keys"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert certificates.stats()["keys"] == 1
+        assert TokenVerifier("demo-project", certificates).verify(issuer.mint("u1"))["uid"] == "u1"
+        assert len(fetches) == 1  # the token did not trigger a fetch of its own
+
+        # A made-up key id right after a refresh does not fetch again
+        with pytest.raises(InvalidToken):
+            certificates.key("rotated-away")
+        assert len(fetches) == 1
+    finally:
+        certificates.stop()
+
+
+def test_stale_certificates_are_used_while_google_is_unreachable(issuer):
+    available = [True]
+
+    def fetch():
+        if not available[0]:
+            raise CertificatesUnavailable("offline")
+        return issuer.certificates()[0], 0.0  # already stale
+
+    certificates = CertificateRefresher(fetch)
+    certificates.refresh()
+    available[0] = False
+    assert TokenVerifier("demo-project", certificates).verify(issuer.mint("u1"))["uid"] == "u1"
+    assert certificates.failures == 1
@@ -0,0 +1,196 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.embeddings import HashingEmbedder, create_embedder, register_embedder
+from app.models import DocumentChunk
+from app.vector_index import VectorIndex
+
+
+DOCS = [
+    ("a", "recursion is a function calling itself"),
+    ("b", "big-O notation describes asymptotic running time"),
+    ("c", "photosynthesis converts light into chemical energy"),
+    ("d", "a recursive function needs a base case"),
+]
+
+
+def _doc(doc_id, content):
+    return DocumentChunk(id=doc_id, course_id="cs101", content=content)
+
+
+def _index(**kwargs):
+    idx = VectorIndex(HashingEmbedder(dim=128), **kwargs)
+    idx.upsert_many([_doc(i, c) for i, c in DOCS])
+    return idx
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    texts = [c for _, c in DOCS] + [""]
+    first = HashingEmbedder(dim=64).embed(texts)
+    second = HashingEmbedder(dim=64).embed(texts)
+
+    assert first.shape == (5, 64)
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first[:4], axis=1), 1.0, atol=1e-5)
+    assert not first[4].any()  # nothing to embed
+    assert HashingEmbedder(dim=64, seed=1).id != HashingEmbedder(dim=64).id
+
+
+def test_vector_search_ranks_related_chunks_first():
+    results = _index().search("recursive functions", k=4)
+
+    assert {doc_id for doc_id, _ in results[:2]} == {"a", "d"}
+    assert all(score < results[1][1] - 0.1 for _, score in results[2:])
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_reduced_precision_matches_float32(dtype):
+    exact = _index().search("asymptotic running time of recursion", k=4)
+    approx = _index(dtype=dtype).search("asymptotic running time of recursion", k=4)
+
+    assert [i for i, _ in approx] == [i for i, _ in exact]
+    assert [s for _, s in approx] == pytest.approx([s for _, s in exact], abs=0.02)
+
+
+def test_search_many_matches_single_queries():
+    idx = _index()
+    queries = ["recursion", "light energy", "running time"]
+
+    batched = idx.search_many(queries, k=2)
+    single = [idx.search(q, k=2) for q in queries]
+
+    assert [[i for i, _ in hits] for hits in batched] == [[i for i, _ in hits] for hits in single]
+    for b, s in zip(batched, single):
+        assert [x for _, x in b] == pytest.approx([x for _, x in s], abs=1e-5)
+
+
+def test_unchanged_content_is_not_reembedded():
+    idx = _index()
+    idx.upsert_many([_doc("a", DOCS[0][1]), _doc("b", "big-O and amortized analysis")])
+
+    assert idx.embedded == len(DOCS) + 1
+    assert len(idx) == len(DOCS)
+
+
+def test_delete_and_compaction():
+    idx = _index(compact_min_rows=1, compact_threshold=0.5)
+    idx.delete_many(["a"])
+    assert "a" not in [i for i, _ in idx.search("recursion", k=4)]
+    assert len(idx.search("recursion", k=10)) == 3
+
+    idx.delete_many(["d"])  # half the rows are now dead
+    assert idx.dead_fraction == 0.0
+    assert idx.doc_ids == ["b", "c"]
+    assert [i for i, _ in idx.search("light", k=1)] == ["c"]
+
+
+def test_create_embedder_by_name_and_import_path():
+    assert isinstance(create_embedder("hashing", dim=32), HashingEmbedder)
+    assert isinstance(create_embedder("app.embeddings:HashingEmbedder", dim=32), HashingEmbedder)
+
+    register_embedder("tiny", lambda **kw: HashingEmbedder(dim=8))
+    assert create_embedder("tiny").dim == 8
+
+    with pytest.raises(ValueError):
+        create_embedder("no-such-embedder")
+
+
+def _clustered(n, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _vector_index(vectors, **kwargs):
+    idx = VectorIndex(HashingEmbedder(dim=vectors.shape[1]), **kwargs)
+    idx.add_vectors(
+        [f"v{i}" for i in range(len(vectors))],
+        [i.to_bytes(16, "little") for i in range(len(vectors))],
+        vectors,
+    )
+    return idx
+
+
+def _recall(idx, queries, k=10, nprobe=None):
+    exact = idx.search_vectors(queries, k, nprobe=10**9)
+    approx = idx.search_vectors(queries, k, nprobe=nprobe)
+    found = sum(len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approx, exact))
+    return found / sum(len(e) for e in exact)
+
+
+def test_ivf_recall_grows_with_nprobe():
+    vectors = _clustered(3000)
+    idx = _vector_index(vectors, nlist=40)
+    idx.train_ann()
+    queries = vectors[:50] + 0.05
+
+    assert idx.ann is not None and idx.ann.nlist == 40
+    low, high = _recall(idx, queries, nprobe=1), _recall(idx, queries, nprobe=8)
+    assert high >= low
+    assert high > 0.9
+    assert _recall(idx, queries, nprobe=40) == 1.0  # probing every cell is exact
+
+
+def test_ivf_stays_in_sync_with_inserts_deletes_and_compaction():
+    vectors = _clustered(2000)
+    idx = _vector_index(vectors, nlist=20, nprobe=20 - 1, compact_min_rows=1, compact_threshold=0.3)
+    idx.train_ann()
+
+    new = _clustered(1, seed=7)
+    idx.add_vectors(["new"], [b"n" * 16], new)
+    assert idx.search_vectors(new, 1)[0][0][0] == "new"
+
+    idx.delete_many(["new"])
+    assert "new" not in [i for i, _ in idx.search_vectors(new, 5)[0]]
+
+    idx.delete_many([f"v{i}" for i in range(0, 2000, 2)])  # crosses the compaction threshold
+    assert idx.compactions == 1
+    results = idx.search_vectors(vectors[1:2], 3)[0]
+    assert results[0][0] == "v1"
+    assert all(int(i[1:]) % 2 == 1 for i, _ in results)
+
+
+def test_ivf_trains_in_background_once_large_enough():
+    idx = _vector_index(_clustered(500), ann_min_rows=1000, nlist=8)
+    assert idx.ann is None
+
+    idx.add_vectors([f"w{i}" for i in range(600)], [b"w" * 16] * 600, _clustered(600, seed=3))
+    for _ in range(200):
+        if idx.ann is not None:
+            break
+        time.sleep(0.01)
+    assert idx.ann is not None
+    assert sum(len(rows) for rows in idx.ann.lists) == 1100
+
+
+@pytest.mark.parametrize("nprobe", [None, 19])
+def test_searches_during_compaction_never_mislabel_hits(nprobe):
+    vectors = _clustered(4000)
+    idx = _vector_index(vectors, nlist=20, compact_min_rows=1, compact_threshold=0.05)
+    idx.train_ann()
+    kept = list(range(1, 4000, 2))
+    errors = []
+    stop = threading.Event()
+
+    def search():
+        while not stop.is_set():
+            for i in kept[:50]:
+                top = idx.search_vectors(vectors[i:i + 1], 1, nprobe=nprobe or 10**9)[0]
+                if top and top[0][0] != f"v{i}":
+                    errors.append((i, top[0][0]))
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    try:
+        for start in range(0, 4000, 400):  # each round of deletes compacts
+            idx.delete_many([f"v{i}" for i in range(start, start + 400, 2)])
+    finally:
+        stop.set()
+        thread.join()
+    assert idx.compactions >= 5
+    assert errors == []
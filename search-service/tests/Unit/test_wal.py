@@ -0,0 +1,97 @@
+import os
+import threading
+
+import pytest
+
+from app.wal import WriteAheadLog
+
+
+def _replay(directory, after_lsn=0, **kwargs):
+    wal = WriteAheadLog(str(directory), group_commit_ms=0, **kwargs)
+    records = []
+    wal.replay(after_lsn, records.append)
+    return wal, records
+
+
+def test_append_then_replay_in_order(tmp_path):
+    wal, records = _replay(tmp_path)
+    assert records == []
+    assert wal.append({"op": "delete", "course_id": "cs101", "document_ids": ["a"]}) == 1
+    assert wal.append({"op": "delete", "course_id": "cs101", "document_ids": ["b"]}) == 2
+    wal.close()
+
+    wal, records = _replay(tmp_path)
+    assert [r["document_ids"] for r in records] == [["a"], ["b"]]
+    assert wal.append({"op": "noop"}) == 3  # LSNs keep increasing across restarts
+    wal.close()
+
+    _, records = _replay(tmp_path, after_lsn=2)
+    assert records == [{"op": "noop"}]
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    wal, _ = _replay(tmp_path)
+    wal.append({"op": "first"})
+    wal.append({"op": "second"})
+    wal.close()
+
+    (segment,) = [p for p in os.listdir(tmp_path) if p.endswith(".log")]
+    path = os.path.join(tmp_path, segment)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    wal, records = _replay(tmp_path)
+    assert records == [{"op": "first"}]
+    assert wal.append({"op": "third"}) == 2
+    wal.close()
+
+    _, records = _replay(tmp_path)
+    assert [r["op"] for r in records] == ["first", "third"]
+
+
+def test_group_commit_shares_fsyncs_between_writers(tmp_path):
+    wal = WriteAheadLog(str(tmp_path), group_commit_ms=20)
+    wal.replay(0, lambda record: None)
+
+    threads = [threading.Thread(target=wal.append, args=({"op": i},)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert wal.appended_records == 16
+    assert wal.fsyncs < 16
+    wal.close()
+
+
+def test_checkpoint_drops_covered_segments_and_tracks_applied(tmp_path):
+    wal, _ = _replay(tmp_path)
+    with wal.record({"op": "a"}) as lsn:
+        # Not applied yet, so a checkpoint must not cover it.
+        assert wal.applied_lsn() == lsn - 1
+    assert wal.applied_lsn() == lsn
+
+    wal.checkpoint(wal.applied_lsn())
+    wal.append({"op": "b"})
+    wal.checkpoint(wal.applied_lsn())
+    assert wal.stats()["segments"] == 1
+    wal.close()
+
+    _, records = _replay(tmp_path, after_lsn=2)
+    assert records == []
+
+
+def test_record_that_failed_to_apply_is_kept_for_replay(tmp_path):
+    wal, _ = _replay(tmp_path)
+    with pytest.raises(RuntimeError):
+        with wal.record({"op": "failed"}) as lsn:
+            raise RuntimeError("index is broken")
+    with wal.record({"op": "later"}):
+        pass
+    assert wal.applied_lsn() == lsn - 1  # pinned behind the failed record
+    wal.checkpoint(wal.applied_lsn())
+    assert wal.stats()["failed_records"] == 1
+    wal.close()
+
+    _, records = _replay(tmp_path, after_lsn=lsn - 1)
+    assert records == [{"op": "failed"}, {"op": "later"}]
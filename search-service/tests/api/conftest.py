@@ -13,8 +13,11 @@ def client():
     app.dependency_overrides[get_current_user] = lambda: {"uid": "test-user", "role": "student"}
     app.dependency_overrides[is_teacher] = lambda: {"uid": "test-user", "role": "teacher"}
 
-    # Clear in-memory indices between tests
+    # Clear in-memory indices, profiles and cached searches between tests
     main_module.course_indices.clear()
+    main_module.course_vectors.clear()
+    main_module.user_profiles.clear()
+    main_module.query_cache.clear()
 
     with TestClient(app) as c:
         yield c
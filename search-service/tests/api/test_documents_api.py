@@ -1,7 +1,13 @@
+import asyncio
 from datetime import datetime, timezone
+import time
 import uuid
 
+from app import main
+
 from app.models import DocumentChunk, BatchCreateRequest, SearchRequest, UpdateDocumentChunk
+from app.snapshot import SnapshotManager
+from app.wal import WriteAheadLog
 
 
 def _iso_now():
@@ -158,3 +164,344 @@ def test_patch_then_delete_document(client):
     )
     assert r_search.status_code == 200
     assert r_search.json()["results"] == []
+
+
+def test_health_json_reports_token_cache(client):
+    d1 = _make_model_instance(DocumentChunk, id="d1", content="cached tokens")
+    batch = _make_model_instance(BatchCreateRequest, documents=[d1])
+    client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    r_patch = client.patch("/v1/courses/cs101/documents/d1", json={"title": "Only the title"})
+    assert r_patch.status_code == 200
+
+    r = client.get("/health/json")
+    assert r.status_code == 200
+    cache = r.json()["indices"]["token_cache"]
+    assert cache["hits"] >= 1  # the title-only PATCH skipped re-tokenizing
+    assert cache["misses"] >= 1
+
+
+def test_global_search_only_returns_allowed_courses_with_exact_count(client):
+    client.post("/v1/users/me", json={"courses": ["niche"]})
+
+    # A large course the student did not select, full of better matches
+    popular = [_make_model_instance(DocumentChunk, id=f"p{i}", content="graph graph graph search") for i in range(30)]
+    niche = [_make_model_instance(DocumentChunk, id=f"n{i}", content=f"graph theory lecture {i}") for i in range(5)]
+    for course_id, docs in (("popular", popular), ("niche", niche)):
+        batch = _make_model_instance(BatchCreateRequest, documents=docs)
+        client.post(f"/v1/courses/{course_id}/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    for endpoint in ("/v1/documents:search", "/v1/documents:ragSearch"):
+        r = client.post(endpoint, json={"query": "graph", "page_size": 3})
+        assert r.status_code == 200
+        results = r.json()["results"]
+        assert len(results) == 3
+        assert {hit["course_id"] for hit in results} == {"niche"}
+
+
+def test_search_pages_with_next_page_token(client):
+    client.post("/v1/users/me", json={"courses": ["cs101"]})
+    docs = [_make_model_instance(DocumentChunk, id=f"d{i}", content=f"recursion example {i}") for i in range(7)]
+    batch = _make_model_instance(BatchCreateRequest, documents=docs)
+    client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    seen, token = [], None
+    while True:
+        r = client.post(
+            "/v1/courses/cs101/documents:search",
+            json={"query": "recursion", "page_size": 3, "page_token": token},
+        )
+        assert r.status_code == 200
+        seen += [hit["id"] for hit in r.json()["results"]]
+        token = r.json()["next_page_token"]
+        if token is None:
+            break
+    assert sorted(seen) == sorted(d.id for d in docs)
+
+    # Any write to the course invalidates outstanding tokens
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "recursion", "page_size": 3})
+    token = r.json()["next_page_token"]
+    client.delete("/v1/courses/cs101/documents/d0")
+    r = client.post(
+        "/v1/courses/cs101/documents:search",
+        json={"query": "recursion", "page_size": 3, "page_token": token},
+    )
+    assert r.status_code == 409
+
+    r = client.post(
+        "/v1/courses/cs101/documents:search",
+        json={"query": "recursion", "page_size": 3, "page_token": "not-a-token"},
+    )
+    assert r.status_code == 400
+
+
+def test_repeated_search_is_served_from_query_cache(client):
+    client.post("/v1/users/me", json={"courses": ["cs101", "cs202"]})
+    for course_id in ("cs101", "cs202"):
+        d = _make_model_instance(DocumentChunk, id=f"{course_id}-d", content="midterm recursion review")
+        batch = _make_model_instance(BatchCreateRequest, documents=[d])
+        client.post(f"/v1/courses/{course_id}/documents:batchCreate", json=batch.model_dump(by_alias=True))
+    before = client.get("/health/json").json()["query_cache"]
+
+    for query in ("midterm", "  Midterm "):
+        for course_id in ("cs101", "cs202"):
+            r = client.post(f"/v1/courses/{course_id}/documents:search", json={"query": query})
+            assert r.status_code == 200
+
+    cache = client.get("/health/json").json()["query_cache"]
+    assert cache["hits"] - before["hits"] == 2
+    assert cache["misses"] - before["misses"] == 2
+
+    # A write to cs101 invalidates only cs101's cached search
+    d = _make_model_instance(DocumentChunk, id="cs101-new", content="midterm logistics")
+    batch = _make_model_instance(BatchCreateRequest, documents=[d])
+    client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "midterm"})
+    assert "cs101-new" in [hit["id"] for hit in r.json()["results"]]
+    client.post("/v1/courses/cs202/documents:search", json={"query": "midterm"})
+
+    cache = client.get("/health/json").json()["query_cache"]
+    assert cache["invalidations"] - before["invalidations"] == 1
+    assert cache["hits"] - before["hits"] == 3
+
+
+def test_vector_mode_uses_dense_index(client):
+    client.post("/v1/users/me", json={"courses": ["cs101", "bio110"]})
+    docs = {
+        "cs101": [
+            _make_model_instance(DocumentChunk, id="rec", content="a recursive function calls itself"),
+            _make_model_instance(DocumentChunk, id="sort", content="merge sort splits the array"),
+        ],
+        "bio110": [_make_model_instance(DocumentChunk, id="cell", content="cells divide by mitosis")],
+    }
+    for course_id, chunks in docs.items():
+        batch = _make_model_instance(BatchCreateRequest, documents=chunks)
+        client.post(f"/v1/courses/{course_id}/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    # "recursion" shares no BM25 term with "recursive", but does share n-grams
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "recursion", "mode": "vector"})
+    assert r.status_code == 200
+    assert r.json()["mode"] == "vector"
+    assert r.json()["results"][0]["id"] == "rec"
+
+    r = client.post("/v1/documents:ragSearch", json={"query": "mitosis", "mode": "vector", "page_size": 1})
+    assert r.status_code == 200
+    assert [hit["id"] for hit in r.json()["results"]] == ["cell"]
+
+    client.delete("/v1/courses/cs101/documents/rec")
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "recursion", "mode": "vector"})
+    assert "rec" not in [hit["id"] for hit in r.json()["results"]]
+
+    pipeline = client.get("/health/json").json()["vectors"]["pipeline"]
+    assert pipeline["embedded_chunks"] >= 3
+    assert "Embeddings" in client.get("/health/dashboard").text
+
+
+def test_cross_course_vector_search_skips_a_course_still_loading(client):
+    client.post("/v1/users/me", json={"courses": ["cs101", "bio110"]})
+    batch = _make_model_instance(BatchCreateRequest, documents=[
+        _make_model_instance(DocumentChunk, id="cell", content="cells divide by mitosis"),
+    ])
+    client.post("/v1/courses/bio110/documents:batchCreate", json=batch.model_dump(by_alias=True))
+    # A reader loading cs101 for the first time: its vectors are in, its BM25 index not yet
+    vectors = main.VectorIndex(main.embedder, **main.vector_index_kwargs())
+    vectors.upsert_many([_make_model_instance(DocumentChunk, id="rec", course_id="cs101", content="mitosis again")])
+    main.course_vectors["cs101"] = vectors
+
+    r = client.post("/v1/documents:search", json={"query": "mitosis", "mode": "vector"})
+    assert r.status_code == 200
+    assert [hit["id"] for hit in r.json()["results"]] == ["cell"]
+
+
+def test_hybrid_mode_fuses_both_legs_and_reports_timings(client, monkeypatch):
+    client.post("/v1/users/me", json={"courses": ["cs101"]})
+    chunks = [
+        _make_model_instance(DocumentChunk, id="rec", content="a recursive function calls itself"),
+        _make_model_instance(DocumentChunk, id="base", content="recursion needs a base case"),
+        _make_model_instance(DocumentChunk, id="sort", content="merge sort splits the array"),
+    ]
+    batch = _make_model_instance(BatchCreateRequest, documents=chunks)
+    client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "recursion", "mode": "hybrid"})
+    assert r.status_code == 200
+    ids = [hit["id"] for hit in r.json()["results"]]
+    assert set(ids[:2]) == {"base", "rec"}
+    assert "sort" in ids  # no BM25 match: contributed by the vector leg only
+    timing = r.headers["Server-Timing"]
+    assert "lexical;dur=" in timing and "vector;dur=" in timing and "fusion;dur=" in timing
+
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "recursion", "mode": "hybrid"})
+    assert 'cache;desc="hit"' in r.headers["Server-Timing"]
+    assert "lexical" not in r.headers["Server-Timing"]
+
+    # A vector leg that misses its deadline is dropped; lexical results are still served
+    real_search = main.VectorIndex.search
+    def slow_search(self, query, k=10):
+        time.sleep(0.2)
+        return real_search(self, query, k)
+    monkeypatch.setattr(main.VectorIndex, "search", slow_search)
+    monkeypatch.setattr(main.settings, "HYBRID_VECTOR_DEADLINE_MS", 20.0)
+
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "recursive", "mode": "hybrid"})
+    assert r.status_code == 200
+    assert {hit["id"] for hit in r.json()["results"]} == {"base", "rec"}
+    assert 'vector;dur=' in r.headers["Server-Timing"] and 'desc="timeout"' in r.headers["Server-Timing"]
+
+
+def test_async_batch_create_returns_operation_and_min_generation_waits(client, monkeypatch):
+    monkeypatch.setattr(main.settings, "INDEXING_ASYNC", True)
+    client.post("/v1/users/me", json={"courses": ["cs101"]})
+    chunk = _make_model_instance(DocumentChunk, id="late", content="dynamic programming tables")
+    batch = _make_model_instance(BatchCreateRequest, documents=[chunk])
+
+    r = client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+    assert r.status_code == 202
+    body = r.json()
+    target = body["target_generation"]
+
+    r = client.post(
+        "/v1/courses/cs101/documents:search",
+        json={"query": "dynamic programming", "min_generation": target},
+    )
+    assert r.status_code == 200
+    assert r.json()["results"][0]["id"] == "late"
+
+    op = client.get(f"/v1/operations/{body['operation_id']}").json()
+    assert op["status"] == "succeeded"
+    assert op["current_generation"] >= target
+    assert client.get("/v1/operations/unknown").status_code == 404
+
+    # A generation that is never reached fails fast with a retryable error
+    monkeypatch.setattr(main.settings, "MIN_GENERATION_TIMEOUT_MS", 20.0)
+    r = client.post("/v1/courses/cs101/documents:search", json={"query": "x", "min_generation": target + 100})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+    r = client.post("/v1/documents:search", json={"query": "x", "min_generation": target})
+    assert r.status_code == 400
+
+
+def test_reader_rejects_writes_but_serves_searches(client, monkeypatch):
+    monkeypatch.setattr(main, "is_reader", True)
+    batch = _make_model_instance(BatchCreateRequest, documents=[_make_model_instance(DocumentChunk, id="d1")])
+
+    r = client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+    assert r.status_code == 503
+    assert client.delete("/v1/courses/cs101/documents/d1").status_code == 503
+    assert client.post("/v1/users/me", json={"courses": ["cs101"]}).status_code == 503
+    assert client.post("/v1/courses/cs101/documents:ragSearch", json={"query": "x"}).status_code == 200
+
+
+def test_write_during_a_snapshot_survives_checkpoint_and_replay(client, monkeypatch, tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal"), group_commit_ms=0)
+    wal.replay(0, lambda record: None)
+    monkeypatch.setattr(main, "snapshots", SnapshotManager(str(tmp_path)))
+    monkeypatch.setattr(main, "wal", wal)
+
+    def write(doc_id):
+        record = {"op": "upsert", "course_id": "cs101",
+                  "documents": [{"id": doc_id, "course_id": "cs101", "content": f"lecture {doc_id}"}]}
+        with main.log_mutation(record):
+            main.apply_record(record)
+
+    write("a")
+    index = main.course_indices["cs101"]
+    to_arrays = index.to_arrays
+
+    def copy_then_write():
+        arrays = to_arrays()
+        monkeypatch.setattr(index, "to_arrays", to_arrays)
+        write("b")  # applied after the copy, before the checkpoint
+        return arrays
+
+    monkeypatch.setattr(index, "to_arrays", copy_then_write)
+    main.save_snapshots()
+    main.save_snapshots()  # must not checkpoint "b" away without saving it
+    wal.close()
+
+    # Restart: load the snapshots and replay the WAL past the checkpoint
+    restarted = SnapshotManager(str(tmp_path))
+    courses = restarted.load_courses()
+    replayed = []
+    WriteAheadLog(str(tmp_path / "wal"), group_commit_ms=0).replay(restarted.load_checkpoint(), replayed.append)
+    for record in replayed:
+        courses["cs101"].upsert_many([DocumentChunk.model_validate(d) for d in record["documents"]])
+    assert set(courses["cs101"].docs) == {"a", "b"}
+
+
+def test_metrics_report_route_histograms_and_index_gauges(client):
+    batch = _make_model_instance(BatchCreateRequest, documents=[_make_model_instance(DocumentChunk, id="d1")])
+    assert client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True)).status_code == 200
+    client.post("/v1/courses/cs101/documents:ragSearch", json={"query": "x"})
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    text = r.text
+    # Routes are labelled by template, not by the course id in the path
+    assert 'route="/v1/courses/{course_id}/documents:ragSearch"' in text
+    assert 'le="+Inf"' in text
+    assert 'search_index_documents{course_id="cs101"} 1' in text
+
+    routes = client.get("/health/json").json()["requests"]["routes"]
+    assert routes["POST /v1/courses/{course_id}/documents:ragSearch"]["count"] >= 1
+
+
+def test_search_reports_its_stages_in_server_timing_and_metrics(client):
+    client.post("/v1/users/me", json={"courses": ["cs101"]})
+    batch = _make_model_instance(BatchCreateRequest, documents=[
+        _make_model_instance(DocumentChunk, id="d1", content="a recursive function calls itself"),
+    ])
+    client.post("/v1/courses/cs101/documents:batchCreate", json=batch.model_dump(by_alias=True))
+
+    for path in ("/v1/courses/cs101/documents:search", "/v1/documents:search"):
+        r = client.post(path, json={"query": "recursive function"})
+        assert r.status_code == 200
+        assert r.json()["results"][0]["id"] == "d1"
+        stages = [part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")]
+        for name in ("tokenize", "retrieve", "hydrate", "serialize"):
+            assert name in stages
+    assert "Server-Timing" not in client.get("/health/json").headers
+
+    stats = client.get("/health/json").json()["requests"]["stages"]
+    assert stats["retrieve"]["count"] >= 2
+    assert 'http_request_stage_duration_seconds_count{stage="serialize"}' in client.get("/metrics").text
+
+
+def test_health_collectors_run_off_the_event_loop(client, monkeypatch):
+    loops = []
+
+    def probe():
+        try:
+            loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            loops.append(None)
+        return {}
+
+    monkeypatch.setitem(main.monitoring_service._collectors, "probe", probe)
+    monkeypatch.setitem(main.monitoring_service._gauges, "probe", ("Probe.", None, lambda: probe() or 0))
+    assert client.get("/health/json").status_code == 200
+    assert client.get("/metrics").status_code == 200
+    assert len(loops) == 2 and loops == [None, None]
+
+
+def test_health_history_returns_sampled_series(client):
+    main.monitoring_service.sampler.sample()
+    history = client.get("/health/history").json()
+    assert history["points"] >= 1
+    assert len(history["timestamp"]) == len(history["cpu_percent"]) == history["points"]
+    assert client.get("/health/history", params={"seconds": 0}).status_code == 422
+
+
+def test_dashboard_is_static_and_its_traffic_is_not_counted(client):
+    before = client.get("/health/json").json()["requests"]["total"]
+    page = client.get("/health/dashboard")
+    assert page.status_code == 200
+    assert page.headers["content-type"].startswith("text/html")
+    assert "/health/stream" in page.text
+    client.get("/health/history")
+
+    requests = client.get("/health/json").json()["requests"]
+    assert requests["total"] == before + 1  # only the first /health/json
+    assert not any("dashboard" in route or "history" in route for route in requests["routes"])
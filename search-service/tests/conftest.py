@@ -0,0 +1,6 @@
+import os
+
+# The API tests cover the vector and hybrid modes as well; settings are read when app.main is imported.
+os.environ.setdefault("VECTOR_SEARCH_ENABLED", "true")
+# Auth is overridden per test, so the app must not fetch Google's token certificates either.
+os.environ.setdefault("TEST_AUTH_BYPASS", "1")